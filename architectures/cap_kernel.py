@@ -38,6 +38,7 @@ def setup(
             degree=3),
         metric=Frobenius(),
         iterations=12,
+        top_k=hparams.top_k,
         verbose=hparams.verbose,
         name="router3"
     )
@@ -1,5 +1,6 @@
 import tensorflow as tf
 
+from models.core import variables
 from models.coreimp.commonMetrics import Frobenius
 from models.coreimp.equiTransform import EquiTransform
 from models.coreimp.rnnRouting import RNNRouting
@@ -15,7 +16,8 @@ def setup(
         iterations=3,
         cell = tf.compat.v1.nn.rnn_cell.LSTMCell(
             num_units=hparams.degree,
-            name="attentionLayer"),
+            name="attentionLayer",
+            dtype=variables.policy()),
         verbose = hparams.verbose,
         name="router",
         bias=False,
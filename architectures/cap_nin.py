@@ -1,5 +1,6 @@
 import tensorflow as tf
 
+from models.core import variables
 from models.coreimp.commonMetrics import Frobenius
 from models.coreimp.equiTransform import EquiTransform
 from models.coreimp.rnnRouting import RNNRouting
@@ -38,7 +39,8 @@ def setup(
                 iterations=3,
                 cell=tf.compat.v1.nn.rnn_cell.LSTMCell(
                     num_units=hparams.degree,
-                    name="attentionLayer3"),
+                    name="attentionLayer3",
+                    dtype=variables.policy()),
                 verbose=hparams.verbose,
                 name="router3",
                 bias=False,
@@ -55,7 +57,8 @@ def setup(
                     iterations=3,
                     cell=tf.compat.v1.nn.rnn_cell.LSTMCell(
                         num_units=hparams.degree,
-                        name="attentionLayer2"),
+                        name="attentionLayer2",
+                        dtype=variables.policy()),
                     verbose=hparams.verbose,
                     name="router2",
                     bias=False,
@@ -79,7 +82,8 @@ def setup(
                     iterations=3,
                     cell=tf.compat.v1.nn.rnn_cell.LSTMCell(
                         num_units=hparams.degree,
-                        name="attentionLayer1"),
+                        name="attentionLayer1",
+                        dtype=variables.policy()),
                     verbose = hparams.verbose,
                     name="router1",
                 bias=False,
@@ -0,0 +1,76 @@
+"""Benchmarks the planned contractions against plain opt_einsum calls.
+
+Builds the training graph of the capsule setups of experiment.py on random
+mnist sized inputs, once with the contraction registry lowering einsums to
+transposes and batched matmuls and once with every contraction going through
+opt_einsum.contract, and reports the graph build time and the mean step time.
+
+  python -m benchmarks.contraction --batch_size 16 --models KernelNet CapsMLP
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import time
+
+import tensorflow as tf
+
+from benchmarks.routing_memory import SETUPS, features, hyperparameters
+from models.capsulemodel import CapsuleModel
+from models.util import contraction
+
+parser = argparse.ArgumentParser(prog='ContractionBenchmark', add_help=True)
+
+parser.add_argument('--batch_size', default=16,
+                    type=int, help='Batch size.')
+parser.add_argument('--steps', default=10,
+                    type=int, help='Number of timed training steps.')
+parser.add_argument('--models', default=sorted(SETUPS), nargs='+',
+                    type=str, help='Setups to benchmark.')
+
+
+def benchmark(model, batch_size, steps, lowering):
+    contraction.lowering(lowering)
+
+    with tf.Graph().as_default() as graph:
+        start = time.time()
+
+        hparams = hyperparameters(model, batch_size)
+        result, _, _ = CapsuleModel(hparams).multi_gpu([features(batch_size)], 1)
+
+        build_time = time.time() - start
+        operations = len(graph.get_operations())
+
+        with tf.compat.v1.Session(config=tf.compat.v1.ConfigProto(allow_soft_placement=True)) as session:
+            session.run(tf.compat.v1.global_variables_initializer())
+            session.run(result.train_op)
+
+            start = time.time()
+            for _ in range(steps):
+                session.run(result.train_op)
+            step_time = (time.time() - start) / steps
+
+    contraction.lowering(True)
+
+    return build_time, operations, step_time
+
+
+def main():
+    args = parser.parse_args()
+
+    for model in args.models:
+        for lowering in [False, True]:
+            try:
+                build_time, operations, step_time = benchmark(model, args.batch_size, args.steps, lowering)
+            except Exception as error:
+                print('{}: could not be built ({})'.format(model, error))
+                break
+
+            print('{} {}: build {:.2f} s, {} ops, step time {:.3f} s'.format(
+                model, 'planned' if lowering else 'opt_einsum', build_time, operations, step_time))
+
+
+if __name__ == '__main__':
+    main()
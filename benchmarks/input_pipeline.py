@@ -0,0 +1,158 @@
+"""Benchmarks the input pipelines in images per second.
+
+Writes synthetic mnist, cifar10 and smallnorb record files in the formats the
+readers expect, then times how fast each pipeline produces batches.
+
+  python -m benchmarks.input_pipeline --batch_size 128 --steps 100
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from data_processing.cifar10 import cifar10_input
+from data_processing.mnist import mnist_input_record
+from data_processing.smallnorb import smallnorb_input_record
+
+parser = argparse.ArgumentParser(prog='InputPipeline', add_help=True)
+
+parser.add_argument('--batch_size', default=128,
+                    type=int, help='Batch size.')
+parser.add_argument('--steps', default=100,
+                    type=int, help='Number of timed batches.')
+parser.add_argument('--examples', default=10000,
+                    type=int, help='Number of synthetic examples per dataset.')
+parser.add_argument('--datasets', default=['mnist', 'cifar10', 'smallnorb', 'smallnorb_memmap'],
+                    nargs='+',
+                    type=str, help='Datasets to benchmark.')
+parser.add_argument('--batch_augment', default=[False, True], nargs='+',
+                    type=lambda x: x.lower() in ('1', 'true'),
+                    help='Per image and/or batch level training distortions.')
+parser.add_argument('--splits', default=['train', 'test'], nargs='+',
+                    type=str, help='Splits to benchmark.')
+
+
+def _int64(value):
+    return tf.train.Feature(int64_list=tf.train.Int64List(value=[value]))
+
+
+def _bytes(value):
+    return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
+
+
+def write_mnist(data_dir, examples):
+    rng = np.random.RandomState(0)
+    for split, shift in [('train', 2), ('test', 0)]:
+        path = os.path.join(data_dir, '{}_{}shifted_mnist.tfrecords'.format(split, shift))
+        with tf.io.TFRecordWriter(path) as writer:
+            for _ in range(examples):
+                image = rng.randint(0, 256, 28 * 28).astype(np.uint8)
+                writer.write(tf.train.Example(features=tf.train.Features(feature={
+                    'image_raw': _bytes(image.tobytes()),
+                    'label': _int64(rng.randint(10)),
+                    'height': _int64(28),
+                    'width': _int64(28),
+                    'depth': _int64(1),
+                })).SerializeToString())
+
+
+def write_cifar10(data_dir, examples):
+    rng = np.random.RandomState(0)
+    record_bytes = 1 + 32 * 32 * 3
+    names = ['data_batch_%d.bin' % i for i in range(1, 6)] + ['test_batch.bin']
+    for name in names:
+        records = rng.randint(0, 256, (examples // 5, record_bytes)).astype(np.uint8)
+        records[:, 0] %= 10
+        records.tofile(os.path.join(data_dir, name))
+
+
+def write_smallnorb(data_dir, examples, shards=4):
+    rng = np.random.RandomState(0)
+    for split in ['train', 'test']:
+        for shard in range(shards):
+            path = os.path.join(data_dir, '{}{}.tfrecords'.format(split, shard))
+            with tf.io.TFRecordWriter(path) as writer:
+                for _ in range(examples // shards):
+                    image = rng.randint(0, 256, 96 * 96).astype(np.float64)
+                    writer.write(tf.train.Example(features=tf.train.Features(feature={
+                        'img_raw': _bytes(image.tobytes()),
+                        'label': _int64(rng.randint(5)),
+                        'category': _int64(rng.randint(10)),
+                        'elevation': _int64(rng.randint(9)),
+                        'azimuth': _int64(rng.randint(18)),
+                        'lighting': _int64(rng.randint(6)),
+                    })).SerializeToString())
+
+
+def write_smallnorb_memmap(data_dir, examples, size=48):
+    rng = np.random.RandomState(0)
+    metadata_dtype = [(name, np.int32) for name in
+                      ['label', 'category', 'elevation', 'azimuth', 'lighting']]
+    for split in ['train', 'test']:
+        images, metadata = smallnorb_input_record.cache_paths(data_dir, split, size)
+        np.save(images, rng.randint(0, 256, (examples, size, size, 1)).astype(np.uint8))
+        np.save(metadata, np.zeros(examples, metadata_dtype))
+
+
+WRITERS = {
+    'mnist': write_mnist,
+    'cifar10': write_cifar10,
+    'smallnorb': write_smallnorb,
+    'smallnorb_memmap': write_smallnorb_memmap,
+}
+
+
+def inputs(dataset, data_dir, batch_size, split, batch_augment=False):
+    if dataset == 'mnist':
+        return mnist_input_record.inputs(data_dir, batch_size, split, num_targets=1)
+    if dataset == 'cifar10':
+        return cifar10_input.inputs(split, data_dir, batch_size, batch_augment=batch_augment)
+    return smallnorb_input_record.inputs(
+        data_dir, batch_size, split, epochs=None, batch_augment=batch_augment,
+        memmap=(dataset == 'smallnorb_memmap'))
+
+
+def benchmark(dataset, data_dir, batch_size, split, steps, batch_augment=False):
+    with tf.Graph().as_default():
+        features = inputs(dataset, data_dir, batch_size, split, batch_augment)
+        batch = [features['images'], features['labels']]
+
+        with tf.compat.v1.Session() as session:
+            for _ in range(5):
+                session.run(batch)
+
+            start = time.time()
+            for _ in range(steps):
+                session.run(batch)
+            elapsed = time.time() - start
+
+    return steps * batch_size / elapsed
+
+
+def main():
+    args = parser.parse_args()
+
+    for dataset in args.datasets:
+        data_dir = tempfile.mkdtemp(prefix=dataset)
+        WRITERS[dataset](data_dir, args.examples)
+
+        for split in args.splits:
+            ## the flag only changes the training distortions.
+            for batch_augment in (args.batch_augment if split == 'train' else [False]):
+                images_per_second = benchmark(
+                    dataset, data_dir, args.batch_size, split, args.steps, batch_augment)
+                print('{} {}{}: {:.0f} images/s'.format(
+                    dataset, split, ' batch augment' if batch_augment else '',
+                    images_per_second))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Benchmarks the training step time of each variable placement strategy.
+
+Splits the batch over several towers on virtual CPU devices, the parameter
+device is the first one, and reports the mean step time for the
+parameter_server, colocated and replicated placements.
+
+  python -m benchmarks.placement --num_gpus 4 --batch_size 32
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import time
+
+import tensorflow as tf
+
+from benchmarks.routing_memory import features, hyperparameters
+from models.capsulemodel import CapsuleModel
+from models.core import variables
+
+parser = argparse.ArgumentParser(prog='Placement', add_help=True)
+
+parser.add_argument('--batch_size', default=32,
+                    type=int, help='Total batch size over all towers.')
+parser.add_argument('--num_gpus', default=4,
+                    type=int, help='Number of towers, each on its own virtual CPU device.')
+parser.add_argument('--steps', default=10,
+                    type=int, help='Number of timed training steps.')
+parser.add_argument('--placements', default=list(variables.PLACEMENTS), nargs='+',
+                    type=str, help='Placement strategies to benchmark.')
+parser.add_argument('--models', default=['KernelNet', 'CapsMLP'], nargs='+',
+                    type=str, help='Setups to benchmark.')
+
+
+def benchmark(model, placement, batch_size, num_gpus, steps):
+    variables.set_placement(placement, device='/cpu:0', tower_device='/cpu:%d')
+
+    with tf.Graph().as_default():
+        hparams = hyperparameters(model, batch_size // num_gpus)
+
+        result, _, _ = CapsuleModel(hparams).multi_gpu(
+            [features(batch_size // num_gpus) for _ in range(num_gpus)], num_gpus)
+
+        config = tf.compat.v1.ConfigProto(device_count={'CPU': num_gpus})
+
+        with tf.compat.v1.Session(config=config) as session:
+            session.run(tf.compat.v1.global_variables_initializer())
+            session.run(result.train_op)
+
+            start = time.time()
+            for _ in range(steps):
+                session.run(result.train_op)
+            step_time = (time.time() - start) / steps
+
+    variables.set_placement()
+
+    return step_time
+
+
+def main():
+    args = parser.parse_args()
+
+    for model in args.models:
+        for placement in args.placements:
+            step_time = benchmark(model, placement, args.batch_size, args.num_gpus, args.steps)
+            print('{} {} on {} towers: step time {:.3f} s'.format(
+                model, placement, args.num_gpus, step_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""Benchmarks the memory and time of a training step with recomputed routing.
+
+Builds the KernelNet (cap_kernel) and CapsMLP (cap_mlp) setups on random
+mnist sized inputs and reports, for each recompute setting of the routing
+procedures, the peak allocator memory of one traced step and the mean step time.
+--last_layer measures the routing of the last layer alone, where --top_k applies.
+
+  python -m benchmarks.routing_memory --batch_size 32 --every 0 1 2
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import os
+import time
+from argparse import Namespace
+
+## the default cpu allocator does not record peak memory in traced steps.
+os.environ.setdefault('TF_CPU_ALLOCATOR_USE_BFC', 'true')
+
+import numpy as np
+import tensorflow as tf
+
+import architectures.cap_em as EM
+import architectures.cap_block_net as BlockNet
+import architectures.cap_kernel as KernelBaseline
+import architectures.cap_mlp as CapsMLP
+import architectures.cap_mlp_shared as CapsMLPShared
+import architectures.cap_nin as CapNIN
+import architectures.cap_dyn as CapDynamic
+from models.capsulemodel import CapsuleModel
+from models.coreimp.commonKernels import GaussianKernel, SpectralMixture
+
+## the capsule setups of experiment.py.
+SETUPS = {
+    "CapsuleBlockNet": BlockNet.setup,
+    "CapsuleBaseline": EM.setup,
+    "KernelNet": lambda hparams: KernelBaseline.setup(hparams, GaussianKernel(False, singular=False)),
+    "KernelNetSpectral": lambda hparams: KernelBaseline.setup(hparams, SpectralMixture(False)),
+    "CapsMLP": CapsMLP.setup,
+    "CapsMLPShared": CapsMLPShared.setup,
+    "CapsuleNin": CapNIN.setup,
+    "CapDynamic": CapDynamic.setup,
+}
+
+parser = argparse.ArgumentParser(prog='RoutingMemory', add_help=True)
+
+parser.add_argument('--batch_size', default=16,
+                    type=int, help='Batch size.')
+parser.add_argument('--steps', default=10,
+                    type=int, help='Number of timed training steps.')
+parser.add_argument('--every', default=[0, 1, 2], nargs='+',
+                    type=int, help='Recompute group sizes, 0 keeps every iteration.')
+parser.add_argument('--top_k', default=None,
+                    type=int, help='Children kept per parent by the last layer routing.')
+parser.add_argument('--last_layer', action='store_true',
+                    help='Benchmark the routing of the last layer alone.')
+parser.add_argument('--models', default=['KernelNet', 'CapsMLP'], nargs='+',
+                    type=str, help='Setups to benchmark.')
+
+
+def hyperparameters(model, batch_size, top_k=None):
+    hparams = Namespace()
+
+    hparams.__dict__ = {
+        "model": model,
+        "dataset": "mnist",
+        "batch_size": batch_size,
+        "learning_rate": 0.001,
+        "max_steps": 1000,
+        "num_classes": 10,
+        "loss_type": "margin",
+        "remake": False,
+        "verbose": False,
+        "regulizer_constant": 0.0,
+        "bn_train": False,
+        "degree": 16,
+        "top_k": top_k,
+        "precision": "float32",
+        "train": True,
+    }
+
+    return SETUPS[model](hparams)
+
+
+def routers(hparams):
+    return [layer.routing for layer in hparams.layers] + [hparams.last_layer["routing"]]
+
+
+def features(batch_size):
+    images = np.random.RandomState(0).rand(batch_size, 1, 28, 28)
+    labels = np.random.RandomState(1).randint(0, 10, batch_size)
+
+    return {
+        "images": tf.constant(images.reshape(batch_size, -1), dtype=tf.float32),
+        "labels": tf.one_hot(labels, 10),
+        "recons_image": tf.constant(images.reshape(batch_size, -1), dtype=tf.float32),
+        "recons_label": tf.constant(labels, dtype=tf.int32),
+        "height": 28,
+        "width": 28,
+        "depth": 1,
+        "num_targets": 1,
+        "num_classes": 10,
+    }
+
+
+def peak_bytes(run_metadata):
+    """Returns the largest allocator peak recorded in a traced step."""
+    peak = 0
+    for device in run_metadata.step_stats.dev_stats:
+        for node in device.node_stats:
+            for memory in node.memory:
+                peak = max(peak, memory.peak_bytes)
+    return peak
+
+
+def run(train_op, steps):
+    """Returns the peak memory of one traced step and the mean step time."""
+    with tf.compat.v1.Session(config=tf.compat.v1.ConfigProto(allow_soft_placement=True)) as session:
+        session.run(tf.compat.v1.global_variables_initializer())
+
+        run_metadata = tf.compat.v1.RunMetadata()
+        session.run(
+            train_op,
+            options=tf.compat.v1.RunOptions(
+                trace_level=tf.compat.v1.RunOptions.FULL_TRACE),
+            run_metadata=run_metadata)
+
+        start = time.time()
+        for _ in range(steps):
+            session.run(train_op)
+        step_time = (time.time() - start) / steps
+
+    return peak_bytes(run_metadata), step_time
+
+
+def benchmark(model, batch_size, every, steps, top_k=None):
+    with tf.Graph().as_default():
+        hparams = hyperparameters(model, batch_size, top_k)
+
+        for router in routers(hparams):
+            router.recompute_iterations(every)
+
+        result, _, _ = CapsuleModel(hparams).multi_gpu([features(batch_size)], 1)
+
+        return run(result.train_op, steps)
+
+
+def benchmark_last_layer(model, batch_size, every, steps, top_k=None):
+    """Benchmarks the routing of the last layer alone, on random votes of its shape."""
+    ## the number of children only follows from the layers below it.
+    with tf.Graph().as_default():
+        hparams = hyperparameters(model, batch_size, top_k)
+        CapsuleModel(hparams).multi_gpu([features(batch_size)], 1)
+        children = hparams.last_layer["routing"].atoms
+
+    with tf.Graph().as_default():
+        hparams = hyperparameters(model, batch_size, top_k)
+        router = hparams.last_layer["routing"]
+        router.recompute_iterations(every)
+
+        rng = np.random.RandomState(0)
+        shape = [batch_size, hparams.num_classes, 1, 1, children] + hparams.primary_parameters["pose_dim"]
+        votes = tf.Variable(rng.randn(*shape).astype(np.float32))
+        activations = tf.constant(rng.rand(*shape[:5] + [1, 1]).astype(np.float32))
+
+        poses, activations = router.fit(votes, activations)
+        train_op = tf.compat.v1.train.GradientDescentOptimizer(0.001).minimize(
+            tf.reduce_sum(poses) + tf.reduce_sum(activations))
+
+        return run(train_op, steps)
+
+
+def main():
+    args = parser.parse_args()
+
+    for model in args.models:
+        for every in args.every:
+            peak, step_time = (benchmark_last_layer if args.last_layer else benchmark)(
+                model, args.batch_size, every, args.steps, args.top_k)
+            print('{}{} recompute every {}: peak memory {:.1f} MB, step time {:.3f} s'.format(
+                model, ' last layer' if args.last_layer else '', every, peak / 2 ** 20, step_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Load generator of the scoring server, reports latency percentiles and throughput.
+
+Starts serve.py on an exported model, unless --url points at a running
+server, and sends single image requests from concurrent clients. Every
+configuration of the batcher is measured in turn, a maximum batch size of 1
+scores the requests one at a time.
+
+  python -m benchmarks.serving --export_dir exported/ --clients 16 --requests 20
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import concurrent.futures
+import json
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+import serve
+from models.core.serving import Batcher
+
+parser = argparse.ArgumentParser(prog='Serving', add_help=True)
+
+parser.add_argument('--export_dir', default=None,
+                    type=str, help='Directory of the exported SavedModel.')
+parser.add_argument('--url', default=None,
+                    type=str, help='Address of a running server instead, like http://127.0.0.1:8500.')
+parser.add_argument('--clients', default=16,
+                    type=int, help='Number of concurrent clients.')
+parser.add_argument('--requests', default=20,
+                    type=int, help='Number of requests sent by every client.')
+parser.add_argument('--max_batch_sizes', default=[1, None], nargs='+',
+                    type=lambda x: None if x.lower() == 'none' else int(x),
+                    help='Batcher maximum batch sizes, none for the default of the batcher.')
+parser.add_argument('--max_latency', default=0.005,
+                    type=float, help='Seconds a request waits for others to batch with.')
+
+
+def score(url, image):
+    body = json.dumps({'images': image.tolist()}).encode()
+    request = urllib.request.Request(url + '/score', body, {'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def load(url, image_shape, clients, requests):
+    """Sends requests from concurrent clients.
+
+    Returns:
+      The latency of every request in seconds and the total time taken.
+    """
+    rng = np.random.RandomState(0)
+    images = rng.rand(clients, *image_shape).astype(np.float32)
+
+    def client(i):
+        latencies = []
+        for _ in range(requests):
+            start = time.time()
+            score(url, images[i])
+            latencies.append(time.time() - start)
+        return latencies
+
+    ## a warm up request before timing.
+    score(url, images[0])
+
+    start = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = sum(pool.map(client, range(clients)), [])
+    return np.array(latencies), time.time() - start
+
+
+def report(name, latencies, seconds):
+    print('{}: p50 {:.1f} ms, p99 {:.1f} ms, {:.1f} images/s'.format(
+        name, np.percentile(latencies, 50) * 1000, np.percentile(latencies, 99) * 1000,
+        len(latencies) / seconds))
+
+
+def main():
+    args = parser.parse_args()
+
+    if args.url:
+        with urllib.request.urlopen(args.url + '/metadata') as response:
+            image_shape = json.loads(response.read())['image_shape']
+        latencies, seconds = load(args.url, image_shape, args.clients, args.requests)
+        report(args.url, latencies, seconds)
+        return
+
+    for max_batch_size in args.max_batch_sizes:
+        batcher = Batcher(args.export_dir, args.max_latency, max_batch_size)
+        server = serve.make_server(batcher)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = 'http://{}:{}'.format(*server.server_address)
+
+        latencies, seconds = load(url, batcher.image_shape, args.clients, args.requests)
+        server.shutdown()
+        server.server_close()
+        batcher.close()
+
+        report('max batch size {}'.format(batcher.max_batch_size), latencies, seconds)
+        print('  {} images in {} batches'.format(batcher.examples, batcher.batches))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Benchmarks the graph native sparsemax against the former py_func version.
+
+Times a forward and backward pass of sparsemax over the children axis of
+routing coefficients shaped { batch, output_atoms, new_w, new_h, children }.
+The py_func version runs in float64 numpy on the host and only handles rows,
+so the coefficients are flattened for it.
+
+  python -m benchmarks.sparsemax --batch_size 32 --children 144
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from models.util.sparsemax import sparsemax, smforward
+
+parser = argparse.ArgumentParser(prog='SparsemaxBenchmark', add_help=True)
+
+parser.add_argument('--batch_size', default=32,
+                    type=int, help='Batch size.')
+parser.add_argument('--output_atoms', default=10,
+                    type=int, help='Number of parent capsules.')
+parser.add_argument('--children', default=144,
+                    type=int, help='Size of the normalized axis.')
+parser.add_argument('--steps', default=50,
+                    type=int, help='Number of timed steps.')
+
+
+def py_func_sparsemax(z):
+    """The py_func sparsemax as it was in models/util/sparsemax.py, on rows."""
+
+    @tf.custom_gradient
+    def forward(z):
+        spm = tf.compat.v1.py_func(smforward, [z], tf.float64, stateful=False)
+        spm.set_shape(z.shape)
+
+        def grad(dy):
+            support = tf.cast(spm > 0, spm.dtype)
+            v_hat = tf.reduce_sum(dy * support, 1) / tf.reduce_sum(support, 1)
+            return support * (dy - v_hat[:, np.newaxis])
+
+        return spm, grad
+
+    return forward(z)
+
+
+def native(logits):
+    return sparsemax(logits, axis=4)
+
+
+def host(logits):
+    shape = logits.shape.as_list()
+    rows = tf.reshape(tf.cast(logits, tf.float64), [-1, shape[4]])
+
+    return tf.cast(tf.reshape(py_func_sparsemax(rows), shape), logits.dtype)
+
+
+def benchmark(normalization, shape, steps):
+    with tf.Graph().as_default():
+        logits = tf.Variable(np.random.RandomState(0).randn(*shape).astype(np.float32))
+
+        c = normalization(logits)
+        grad = tf.gradients(tf.reduce_sum(c * c), [logits])[0]
+
+        with tf.compat.v1.Session() as session:
+            session.run(tf.compat.v1.global_variables_initializer())
+            session.run(grad)
+
+            start = time.time()
+            for _ in range(steps):
+                session.run(grad)
+
+    return (time.time() - start) / steps
+
+
+def main():
+    args = parser.parse_args()
+    shape = [args.batch_size, args.output_atoms, 1, 1, args.children]
+
+    for name, normalization in [("py_func", host), ("native", native)]:
+        step_time = benchmark(normalization, shape, args.steps)
+        print('{} sparsemax over {}: {:.2f} ms per forward and backward pass'.format(
+            name, shape, step_time * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Batch level image distortions with per example random parameters.
+
+Each function draws one random parameter per image, like its tf.image
+counterpart applied to every image on its own, but transforms the whole
+batch with a handful of vectorised ops.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+
+
+def random_crop(images, size):
+  """Crops a random size x size window out of every image.
+
+  Args:
+    images: A [batch, height, width, depth] tensor.
+    size: The height and width of the crops.
+
+  Returns:
+    A [batch, size, size, depth] tensor.
+  """
+  shape = images.shape.as_list()
+  batch = tf.shape(images)[0]
+
+  offsets_y = tf.random.uniform([batch, 1], maxval=shape[1] - size + 1, dtype=tf.int32)
+  offsets_x = tf.random.uniform([batch, 1], maxval=shape[2] - size + 1, dtype=tf.int32)
+
+  window = tf.range(size)[None, :]
+
+  rows = tf.gather(images, offsets_y + window, axis=1, batch_dims=1)
+  return tf.gather(rows, offsets_x + window, axis=2, batch_dims=1)
+
+
+def random_flip_left_right(images):
+  """Mirrors every image horizontally with probability 1/2."""
+  batch = tf.shape(images)[0]
+  flip = tf.random.uniform([batch, 1, 1, 1]) < 0.5
+  return tf.where(flip, tf.reverse(images, axis=[2]), images)
+
+
+def random_brightness(images, max_delta):
+  """Adds a random delta in [-max_delta, max_delta) to every image."""
+  batch = tf.shape(images)[0]
+  delta = tf.random.uniform([batch, 1, 1, 1], -max_delta, max_delta)
+  return images + delta
+
+
+def random_contrast(images, lower, upper):
+  """Scales every image around its per channel mean by a random factor in
+  [lower, upper).
+  """
+  batch = tf.shape(images)[0]
+  factor = tf.random.uniform([batch, 1, 1, 1], lower, upper)
+  mean = tf.reduce_mean(images, axis=[1, 2], keepdims=True)
+  return (images - mean) * factor + mean
@@ -0,0 +1,84 @@
+"""Tests for augment."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import tensorflow as tf
+
+from . import augment
+
+
+class AugmentTest(tf.test.TestCase):
+
+  def _run(self, fn, images):
+    with tf.Graph().as_default(), self.session() as sess:
+      return sess.run(fn(tf.constant(images)))
+
+  def testRandomCrop(self):
+    """Every crop is a window of its image, at its own random offset."""
+    batch, height, size = 256, 48, 32
+    grid = np.arange(height)[:, None] * 100 + np.arange(height)[None, :]
+    images = np.tile(grid[None, :, :, None], [batch, 1, 1, 1]).astype(np.float32)
+
+    crops = self._run(lambda x: augment.random_crop(x, size), images)
+
+    self.assertEqual((batch, size, size, 1), crops.shape)
+    offsets_y = (crops[:, 0, 0, 0] // 100).astype(int)
+    offsets_x = (crops[:, 0, 0, 0] % 100).astype(int)
+    for i in range(batch):
+      self.assertAllEqual(
+          images[i, offsets_y[i]:offsets_y[i] + size, offsets_x[i]:offsets_x[i] + size],
+          crops[i])
+
+    # Uniform over the height - size + 1 possible offsets, like tf.image.random_crop.
+    self.assertEqual(0, offsets_y.min())
+    self.assertEqual(height - size, offsets_y.max())
+    self.assertAllClose((height - size) / 2, offsets_x.mean(), atol=1.5)
+
+  def testRandomFlip(self):
+    batch = 512
+    images = np.tile(np.arange(4, dtype=np.float32)[None, None, :, None], [batch, 1, 1, 1])
+
+    flipped = self._run(augment.random_flip_left_right, images)
+
+    mirrored = flipped[:, 0, 0, 0] == 3
+    self.assertAllEqual(flipped[mirrored], images[mirrored][:, :, ::-1])
+    self.assertAllClose(0.5, mirrored.mean(), atol=0.1)
+
+  def testRandomBrightness(self):
+    batch, max_delta = 2048, 0.5
+    images = np.zeros([batch, 4, 4, 1], np.float32)
+
+    deltas = self._run(lambda x: augment.random_brightness(x, max_delta), images)
+
+    # One delta per image, uniform in [-max_delta, max_delta).
+    self.assertAllEqual(deltas, np.broadcast_to(deltas[:, :1, :1], deltas.shape))
+    deltas = deltas[:, 0, 0, 0]
+    self.assertLessEqual(np.abs(deltas).max(), max_delta)
+    self.assertAllClose(0.0, deltas.mean(), atol=0.05)
+    self.assertAllClose(max_delta / np.sqrt(3), deltas.std(), atol=0.03)
+
+  def testRandomContrast(self):
+    """Matches tf.image.adjust_contrast for the factor of every image."""
+    batch, lower, upper = 1024, 0.5, 1.5
+    images = np.random.RandomState(0).rand(batch, 8, 8, 3).astype(np.float32)
+
+    adjusted = self._run(lambda x: augment.random_contrast(x, lower, upper), images)
+
+    centered = images - images.mean(axis=(1, 2), keepdims=True)
+    factors = (adjusted - images.mean(axis=(1, 2), keepdims=True))[:, 0, 0, 0] / centered[:, 0, 0, 0]
+
+    with tf.Graph().as_default(), self.session() as sess:
+      expected = sess.run(tf.stack([
+          tf.image.adjust_contrast(images[i], factors[i]) for i in range(8)]))
+    self.assertAllClose(expected, adjusted[:8], atol=1e-4)
+
+    self.assertGreaterEqual(factors.min(), lower - 1e-4)
+    self.assertLessEqual(factors.max(), upper + 1e-4)
+    self.assertAllClose((lower + upper) / 2, factors.mean(), atol=0.05)
+
+
+if __name__ == "__main__":
+  tf.test.main()
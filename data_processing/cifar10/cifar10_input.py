@@ -14,36 +14,41 @@ import os
 
 import tensorflow as tf
 
+from .. import augment
+from .. import pipeline
 
-def _read_input(filename_queue):
-  """Reads a single record and converts it to a tensor.
+
+_LABEL_BYTES = 1
+_HEIGHT = 32
+_DEPTH = 3
+_IMAGE_BYTES = _HEIGHT * _HEIGHT * _DEPTH
+_RECORD_BYTES = _LABEL_BYTES + _IMAGE_BYTES
+
+
+def _read_file(filename):
+  """Returns the dataset of the fixed length records of one file."""
+  return tf.data.FixedLengthRecordDataset(filename, record_bytes=_RECORD_BYTES)
+
+
+def _decode(records):
+  """Decodes a batch of records.
 
   Each record consists the 3x32x32 image with one byte for the label.
 
   Args:
-    filename_queue: A queue of strings with the filenames to read from.
+    records: A string tensor of a batch of records.
 
   Returns:
-      image: a [32, 32, 3] float32 Tensor with the image data.
-      label: an int32 Tensor with the label in the range 0..9.
+      image: a [batch, 32, 32, 3] float32 Tensor with the image data.
+      label: a [batch] int32 Tensor with the label in the range 0..9.
   """
-  label_bytes = 1
-  height = 32
-  depth = 3
-  image_bytes = height * height * depth
-  record_bytes = label_bytes + image_bytes
+  uint_data = tf.reshape(tf.io.decode_raw(records, tf.uint8), [-1, _RECORD_BYTES])
 
-  reader = tf.compat.v1.FixedLengthRecordReader(record_bytes=record_bytes)
-  _, byte_data = reader.read(filename_queue)
-  uint_data = tf.io.decode_raw(byte_data, tf.uint8)
-
-  label = tf.cast(tf.strided_slice(uint_data, [0], [label_bytes]), tf.int32)
-  label.set_shape([1])
+  label = tf.cast(uint_data[:, 0], tf.int32)
 
   depth_major = tf.reshape(
-      tf.strided_slice(uint_data, [label_bytes], [record_bytes]),
-      [depth, height, height])
-  image = tf.cast(tf.transpose(a=depth_major, perm=[1, 2, 0]), tf.float32)
+      uint_data[:, _LABEL_BYTES:], [-1, _DEPTH, _HEIGHT, _HEIGHT])
+  image = tf.cast(tf.transpose(a=depth_major, perm=[0, 2, 3, 1]), tf.float32)
 
   return image, label
 
@@ -70,62 +75,66 @@ def _distort_resize(image, image_size):
   return distorted_image
 
 
-def _batch_features(image, label, batch_size, split, image_size):
-  """Constructs the batched feature dictionary.
+def _distort_resize_batch(images, image_size):
+  """Distorts a batch of input images for CIFAR training.
 
-  Batches the images and labels accourding to the split. Shuffles the data only
-  if split is train. Formats the feature dictionary to be in the format required
-  by experiment.py.
+  Applies the distortions of _distort_resize with independent random
+  parameters for every image, as a few batch level ops.
 
   Args:
-    image: A float32 tensor with shape [image_size, image_size, 3].
+    images: A float32 tensor of shape [batch, 32, 32, 3].
+    image_size: The output image size after cropping.
+
+  Returns:
+    distorted_images: A float32 tensor with shape
+      [batch, image_size, image_size, 3].
+  """
+  distorted_images = augment.random_crop(images, image_size)
+  distorted_images = augment.random_flip_left_right(distorted_images)
+  distorted_images = augment.random_brightness(distorted_images, max_delta=63)
+  distorted_images = augment.random_contrast(
+      distorted_images, lower=0.2, upper=1.8)
+  return distorted_images
+
+
+def _features(image, label):
+  """Formats the feature dictionary to be in the format required by
+  experiment.py.
+
+  Args:
+    image: A float32 tensor with shape [..., image_size, image_size, 3].
     label: An int32 tensor with the label of the image.
-    batch_size: The number of data points in the output batch.
-    split: 'train' or 'test'.
-    image_size: The size of the input image.
 
   Returns:
-    batched_features: A dictionary of the input data features.
+    features: A dictionary of the input data features.
   """
-  image = tf.transpose(a=image, perm=[2, 0, 1])
+  # Depth first, for a single image or a batch.
+  if image.shape.rank == 3:
+    image = tf.transpose(a=image, perm=[2, 0, 1])
+  else:
+    image = tf.transpose(a=image, perm=[0, 3, 1, 2])
   features = {
       'images': image,
       'labels': tf.one_hot(label, 10),
       'recons_image': image,
       'recons_label': label,
   }
-  if split == 'train':
-    batched_features = tf.compat.v1.train.shuffle_batch(
-        features,
-        batch_size=batch_size,
-        num_threads=16,
-        capacity=10000 + 3 * batch_size,
-        min_after_dequeue=10000)
-  else:
-    batched_features = tf.compat.v1.train.batch(
-        features,
-        batch_size=batch_size,
-        num_threads=1,
-        capacity=10000 + 3 * batch_size)
-  batched_features['labels'] = tf.reshape(batched_features['labels'],
-                                          [batch_size, 10])
-  batched_features['recons_label'] = tf.reshape(
-      batched_features['recons_label'], [batch_size])
-  batched_features['height'] = image_size
-  batched_features['width'] = image_size
-  batched_features['depth'] = 3
-  batched_features['num_targets'] = 1
-  batched_features['num_classes'] = 10
-  return batched_features
+  return features
 
 
-def inputs(split, data_dir, batch_size):
+def inputs(split, data_dir, batch_size, device=None, batch_augment=False, steps=None,
+           examples=None):
   """Constructs input for CIFAR experiment.
 
   Args:
     split: 'train' or 'test', which split of the data set to read from.
     data_dir: Path to the CIFAR-10 data directory.
     batch_size: Number of images per batch.
+    device: The device the batches are prefetched to.
+    batch_augment: If set distorts the training images a batch at a time.
+    steps: If set, number of batches stacked in every returned tensor.
+    examples: If set, every pass reads the first examples and ends with a
+      partial batch, the batch dimension is then unknown.
 
   Returns:
     batched_features: A dictionary of the input data features.
@@ -137,16 +146,40 @@ def inputs(split, data_dir, batch_size):
   else:
     filenames = [os.path.join(data_dir, 'test_batch.bin')]
 
-  filename_queue = tf.compat.v1.train.string_input_producer(filenames)
-  float_image, label = _read_input(filename_queue)
-
   image_size = 24
 
-  if split == 'train':
-    resized_image = _distort_resize(float_image, image_size)
-  else:
+  def decode(records):
+    image, label = _decode(records)
+    if split == 'train':
+      return image, label
     resized_image = tf.image.resize_with_crop_or_pad(
-        float_image, image_size, image_size)
-  image = tf.image.per_image_standardization(resized_image)
-
-  return _batch_features(image, label, batch_size, split, image_size)
+        image, image_size, image_size)
+    image = tf.image.per_image_standardization(resized_image)
+    return _features(image, label)
+
+  def distort(image, label):
+    if batch_augment:
+      resized_image = _distort_resize_batch(image, image_size)
+    else:
+      resized_image = _distort_resize(image, image_size)
+    image = tf.image.per_image_standardization(resized_image)
+    return _features(image, label)
+
+  records = pipeline.records(filenames, _read_file, split)
+
+  dataset = pipeline.batches(
+      records,
+      batch_size=batch_size,
+      split=split,
+      decode=decode,
+      distort=distort if split == 'train' else None,
+      vectorized=batch_augment,
+      examples=examples)
+
+  batched_features = pipeline.features(dataset, device, steps, batch_size)
+  batched_features['height'] = image_size
+  batched_features['width'] = image_size
+  batched_features['depth'] = 3
+  batched_features['num_targets'] = 1
+  batched_features['num_classes'] = 10
+  return batched_features
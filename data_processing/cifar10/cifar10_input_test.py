@@ -35,16 +35,15 @@ class CIFAR10InputTest(tf.test.TestCase):
     filename = os.path.join(self.get_temp_dir(), "cifar_test")
     open(filename, "wb").write(b"".join(records))
 
-    with self.test_session() as sess:
-      q = tf.queue.FIFOQueue(100, [tf.string], shapes=())
-      q.enqueue([filename]).run()
-      q.close().run()
-      image_tensor, label_tensor = cifar10_input._read_input(q)
+    with tf.Graph().as_default(), self.session() as sess:
+      records = cifar10_input._read_file(filename).batch(1)
+      image_tensor, label_tensor = cifar10_input._decode(
+          tf.compat.v1.data.make_one_shot_iterator(records).get_next())
 
       for i in range(3):
         image, label = sess.run([image_tensor, label_tensor])
         self.assertEqual(labels[i], label)
-        self.assertAllEqual(expecteds[i], image)
+        self.assertAllEqual([expecteds[i]], image)
 
       with self.assertRaises(tf.errors.OutOfRangeError):
         sess.run(image_tensor)
@@ -57,16 +56,11 @@ class CIFAR10InputTest(tf.test.TestCase):
     data_dir = self.get_temp_dir()
     filename = os.path.join(data_dir, "test_batch.bin")
     open(filename, "wb").write(b"".join([record]))
-    features = cifar10_input.inputs("test", data_dir, batch_size)
-
-    with self.test_session() as sess:
-      coord = tf.train.Coordinator()
-      threads = tf.compat.v1.train.start_queue_runners(coord=coord)
+    with tf.Graph().as_default(), self.session() as sess:
+      features = cifar10_input.inputs("test", data_dir, batch_size)
       labels = sess.run(features["recons_label"])
       self.assertAllEqual(expected_labels, labels)
-      coord.request_stop()
-      for thread in threads:
-        thread.join()
+      self.assertEqual([batch_size, 3, 24, 24], features["images"].shape.as_list())
 
 
 if __name__ == "__main__":
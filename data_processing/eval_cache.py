@@ -0,0 +1,143 @@
+"""In memory cache of evaluation datasets.
+
+Reads a test split through its input pipeline once into contiguous numpy
+arrays, optionally persisted as one .npy file per feature, and serves it
+back as batches of an initializable tf.data iterator. Evaluating many
+checkpoints then decodes the data once and copies it into the graph once,
+instead of once per checkpoint and batch.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+
+## materialized datasets of this process, by key.
+_MEMORY = {}
+
+_STATIC = 'static.json'
+
+
+def key(dataset, split, **preprocessing):
+  """Returns the cache key of a split read with the given preprocessing.
+
+  Args:
+    dataset: Name of the dataset.
+    split: Split of the dataset.
+    **preprocessing: Everything else the cached values depend on, such as
+      the number of examples or the number of targets.
+  """
+  options = ['{}={}'.format(name, preprocessing[name]) for name in sorted(preprocessing)]
+  return '-'.join([dataset, split] + options)
+
+
+def materialize(features, num_steps, session):
+  """Reads num_steps batches of the features into numpy arrays.
+
+  Args:
+    features: Dictionary of batched feature tensors and static python values
+      such as the image height.
+    num_steps: Number of batches to read.
+    session: The session running the input pipeline.
+
+  Returns:
+    arrays: Dictionary of the tensor features, every one concatenated over
+      the batches.
+    static: Dictionary of the other features.
+  """
+  tensors = {name: value for name, value in features.items() if tf.is_tensor(value)}
+  static = {name: value for name, value in features.items() if not tf.is_tensor(value)}
+
+  batches = [session.run(tensors) for _ in range(num_steps)]
+  arrays = {name: np.concatenate([batch[name] for batch in batches]) for name in tensors}
+  return arrays, static
+
+
+def save(directory, name, arrays, static):
+  """Writes a materialized dataset to directory/name/ as .npy files."""
+  path = os.path.join(directory, name)
+  if not tf.io.gfile.exists(path):
+    tf.io.gfile.makedirs(path)
+
+  for feature, array in arrays.items():
+    np.save(os.path.join(path, feature + '.npy'), array)
+  with open(os.path.join(path, _STATIC), 'w') as f:
+    json.dump(static, f)
+
+
+def load(directory, name):
+  """Reads a dataset written by save, returns None if there is none."""
+  path = os.path.join(directory, name)
+  if not os.path.exists(os.path.join(path, _STATIC)):
+    return None
+
+  with open(os.path.join(path, _STATIC)) as f:
+    static = json.load(f)
+  arrays = {
+      fname[:-len('.npy')]: np.load(os.path.join(path, fname))
+      for fname in os.listdir(path) if fname.endswith('.npy')
+  }
+  return arrays, static
+
+
+def get(name, read, directory=None):
+  """Returns the arrays and static features of a dataset, reading it at most once.
+
+  Looks the dataset up in memory, then in directory, and only then calls
+  read. Datasets read or loaded are kept in memory, and written to
+  directory when it is set.
+
+  Args:
+    name: Cache key of the dataset, see key.
+    read: Function returning the (arrays, static) pair of materialize.
+    directory: Optional directory persisting the dataset across runs.
+  """
+  if name not in _MEMORY:
+    cached = load(directory, name) if directory else None
+    if cached is None:
+      cached = read()
+      if directory:
+        save(directory, name, *cached)
+    _MEMORY[name] = cached
+  return _MEMORY[name]
+
+
+def features(arrays, static, batch_size):
+  """Serves cached arrays as batched features in their original order.
+
+  The arrays are copied into the dataset once, when the iterator is
+  initialized. Every pass ends with a partial batch unless batch_size
+  divides the number of examples, the batch dimension is unknown. The
+  dataset repeats, so reading ceil(len / batch_size) batches after every
+  checkpoint restore always sees the same batches.
+
+  Args:
+    arrays: Dictionary of the cached tensor features.
+    static: Dictionary of the static features.
+    batch_size: Number of examples per batch.
+
+  Returns:
+    features: Dictionary of batched feature tensors and static features.
+    initialize: Function of a session, initializes the iterator.
+  """
+  placeholders = {
+      name: tf.compat.v1.placeholder(array.dtype, shape=(None,) + array.shape[1:])
+      for name, array in arrays.items()
+  }
+  dataset = tf.data.Dataset.from_tensor_slices(placeholders)
+  dataset = dataset.batch(batch_size).repeat()
+  dataset = dataset.prefetch(tf.data.experimental.AUTOTUNE)
+  iterator = tf.compat.v1.data.make_initializable_iterator(dataset)
+
+  def initialize(session):
+    session.run(iterator.initializer,
+                feed_dict={placeholders[name]: arrays[name] for name in arrays})
+
+  batched = dict(static)
+  batched.update(iterator.get_next())
+  return batched, initialize
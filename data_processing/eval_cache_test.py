@@ -0,0 +1,82 @@
+"""Tests for eval_cache."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import tensorflow as tf
+
+from . import eval_cache
+
+
+class EvalCacheTest(tf.test.TestCase):
+
+  def _pipeline(self, batch_size):
+    images = np.arange(24 * 2 * 2, dtype=np.float32).reshape(24, 2, 2, 1)
+    labels = np.arange(24, dtype=np.int32)
+    dataset = tf.data.Dataset.from_tensor_slices(
+        {'images': images, 'recons_label': labels}).batch(batch_size)
+    features = tf.compat.v1.data.make_one_shot_iterator(dataset).get_next()
+    features['height'] = 2
+    return features, images, labels
+
+  def testMaterialize(self):
+    with tf.Graph().as_default(), self.session() as sess:
+      features, images, labels = self._pipeline(4)
+      arrays, static = eval_cache.materialize(features, 5, sess)
+
+    self.assertEqual({'height': 2}, static)
+    self.assertAllEqual(images[:20], arrays['images'])
+    self.assertAllEqual(labels[:20], arrays['recons_label'])
+
+  def testFeaturesRepeatInOrder(self):
+    """Every pass over the cached batches sees the same batches."""
+    arrays = {'recons_label': np.arange(12, dtype=np.int32)}
+    with tf.Graph().as_default(), self.session() as sess:
+      features, initialize = eval_cache.features(arrays, {'height': 2}, 4)
+      self.assertEqual(2, features['height'])
+      self.assertEqual([None], features['recons_label'].shape.as_list())
+
+      initialize(sess)
+      for _ in range(3):
+        for step in range(3):
+          self.assertAllEqual(arrays['recons_label'][step * 4:(step + 1) * 4],
+                              sess.run(features['recons_label']))
+
+  def testFeaturesKeepPartialBatch(self):
+    """Every pass ends with the examples left over by the whole batches."""
+    arrays = {'recons_label': np.arange(10, dtype=np.int32)}
+    with tf.Graph().as_default(), self.session() as sess:
+      features, initialize = eval_cache.features(arrays, {}, 4)
+
+      initialize(sess)
+      for _ in range(2):
+        self.assertAllEqual([0, 1, 2, 3], sess.run(features['recons_label']))
+        self.assertAllEqual([4, 5, 6, 7], sess.run(features['recons_label']))
+        self.assertAllEqual([8, 9], sess.run(features['recons_label']))
+
+  def testGetReadsOnce(self):
+    directory = self.get_temp_dir()
+    name = eval_cache.key('mnist', 'test', examples=8, num_targets=1)
+    self.assertEqual('mnist-test-examples=8-num_targets=1', name)
+
+    cached = ({'images': np.ones([8, 2, 2, 1], np.float32)}, {'depth': 1})
+    reads = []
+
+    def read():
+      reads.append(1)
+      return cached
+
+    eval_cache.get(name, read, directory)
+    eval_cache.get(name, read, directory)
+    self.assertEqual(1, len(reads))
+
+    arrays, static = eval_cache.load(directory, name)
+    self.assertEqual({'depth': 1}, static)
+    self.assertAllEqual(cached[0]['images'], arrays['images'])
+    self.assertIsNone(eval_cache.load(directory, 'mnist-train'))
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -9,29 +9,27 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import functools
 import os
 
 import tensorflow as tf
 
+from .. import pipeline
 
-def _read_and_decode(filename_queue, image_dim=28,
-                     split='train'):
-  """Reads a single record and converts it to a tensor.
+
+def _decode(serialized_examples, image_dim=28):
+  """Decodes a batch of records into a dictionary of tensors.
 
   Args:
-    filename_queue: Tensor Queue, list of input files.
+    serialized_examples: String tensor, a batch of serialized records.
     image_dim: Scalar, the height (and width) of the image in pixels.
-    distort: Boolean, whether to distort the input or not.
-    split: String, the split of the data (test or train) to read from.
 
   Returns:
-    Dictionary of the (Image, label) and the image height.
+    Dictionary of the batched (Image, label).
 
   """
-  reader = tf.compat.v1.TFRecordReader()
-  _, serialized_example = reader.read(filename_queue)
-  features = tf.io.parse_single_example(
-      serialized=serialized_example,
+  features = tf.io.parse_example(
+      serialized=serialized_examples,
       features={
           'image_raw': tf.io.FixedLenFeature([], tf.string),
           'label': tf.io.FixedLenFeature([], tf.int64),
@@ -40,12 +38,11 @@ def _read_and_decode(filename_queue, image_dim=28,
           'depth': tf.io.FixedLenFeature([], tf.int64)
       })
 
-  # Convert from a scalar string tensor (whose single string has
+  # Convert from a batch of strings (whose single string has
   # length image_pixel*image_pixel) to a uint8 tensor with shape
-  # [image_pixel, image_pixel, 1].
+  # [batch, image_pixel, image_pixel, 1].
   image = tf.io.decode_raw(features['image_raw'], tf.uint8)
-  image = tf.reshape(image, [image_dim, image_dim, 1])
-  image.set_shape([image_dim, image_dim, 1])
+  image = tf.reshape(image, [-1, image_dim, image_dim, 1])
 
   # Convert from [0, 255] -> [-0.5, 0.5] floats.
   image = tf.cast(image, tf.float32) * (1. / 255)
@@ -58,24 +55,21 @@ def _read_and_decode(filename_queue, image_dim=28,
       'recons_image': image,
       'recons_label': label,
   }
-  return features, image_dim
+  return features
 
 
-def _multi_read_and_decode(filename_queue):
-  """Reads a multi record and converts it to a dictionary of tensors.
+def _multi_decode(serialized_examples):
+  """Decodes a batch of multi records into a dictionary of tensors.
 
   Args:
-    filename_queue: Tensor Queue, list of input files.
+    serialized_examples: String tensor, a batch of serialized records.
 
   Returns:
     Dictionary of tensors containing the information from a multi record.
-    Image height.
 
   """
-  reader = tf.compat.v1.TFRecordReader()
-  _, serialized_example = reader.read(filename_queue)
-  features = tf.io.parse_single_example(
-      serialized=serialized_example,
+  features = tf.io.parse_example(
+      serialized=serialized_examples,
       # Defaults are not specified since both keys are required.
       features={
           'height': tf.io.FixedLenFeature([], tf.int64),
@@ -89,21 +83,12 @@ def _multi_read_and_decode(filename_queue):
       })
 
   # Decode 3 images
-  features['image_raw_1'] = tf.io.decode_raw(features['image_raw_1'], tf.uint8)
-  features['image_raw_2'] = tf.io.decode_raw(features['image_raw_2'], tf.uint8)
-  features['merged_raw'] = tf.io.decode_raw(features['merged_raw'], tf.uint8)
   image_pixels = 36 * 36
-  features['image_raw_1'].set_shape([image_pixels])
-  features['image_raw_2'].set_shape([image_pixels])
-  features['merged_raw'].set_shape([image_pixels])
-
-  # Convert from [0, 255] -> [-0.5, 0.5] floats.
-  features['image_raw_1'] = tf.cast(features['image_raw_1'], tf.float32) * (
-      1. / 255)
-  features['image_raw_2'] = tf.cast(features['image_raw_2'], tf.float32) * (
-      1. / 255)
-  features['merged_raw'] = tf.cast(features['merged_raw'], tf.float32) * (
-      1. / 255)
+  for key in ['image_raw_1', 'image_raw_2', 'merged_raw']:
+    image = tf.io.decode_raw(features[key], tf.uint8)
+    image = tf.reshape(image, [-1, image_pixels])
+    # Convert from [0, 255] -> [-0.5, 0.5] floats.
+    features[key] = tf.cast(image, tf.float32) * (1. / 255)
 
   # Convert label from a scalar uint8 tensor to an int32 scalar.
   features['label_1'] = tf.cast(features['label_1'], tf.int32)
@@ -111,8 +96,6 @@ def _multi_read_and_decode(filename_queue):
 
   # Convert the dictionary to the format used in the code.
   res_features = {}
-  res_features['height'] = features['height']
-  res_features['depth'] = features['depth']
   res_features['images'] = features['merged_raw']
   res_features['labels'] = tf.one_hot(features['label_1'], 10) + tf.one_hot(
       features['label_2'], 10)
@@ -121,7 +104,7 @@ def _multi_read_and_decode(filename_queue):
   res_features['spare_label'] = features['label_2']
   res_features['spare_image'] = features['image_raw_2']
 
-  return res_features, 36
+  return res_features
 
 
 def _generate_sharded_filenames(data_dir):
@@ -141,6 +124,9 @@ def inputs(data_dir,
            distort=False,
            batch_capacity=5000,
            validate=False,
+           device=None,
+           steps=None,
+           examples=None,
            ):
   """Reads input data.
 
@@ -151,9 +137,13 @@ def inputs(data_dir,
     num_targets: 1 digit or 2 digit dataset.
     height: image height.
     distort: whether to distort the input image.
-    batch_capacity: the number of elements to prefetch in a batch.
+    batch_capacity: the number of examples the training shuffle draws from.
     validate: If set use training-validation for training and validation for
       test.
+    device: the device the batches are prefetched to.
+    steps: if set, number of batches stacked in every returned tensor.
+    examples: if set, every pass reads the first examples and ends with a
+      partial batch, the batch dimension is then unknown.
 
   Returns:
     Dictionary of Batched features and labels.
@@ -173,28 +163,23 @@ def inputs(data_dir,
     filenames = [os.path.join(data_dir, file_format.format(split, shift))]
 
   with tf.compat.v1.name_scope('input'):
-    filename_queue = tf.compat.v1.train.string_input_producer(
-        filenames, shuffle=(split == 'train'))
+    records = pipeline.records(filenames, tf.data.TFRecordDataset, split)
 
     if num_targets == 2:
-      features, image_dim = _multi_read_and_decode(filename_queue)
-    else:
-      features, image_dim = _read_and_decode(
-          filename_queue, image_dim=height, split=split)
-    if split == 'train':
-      batched_features = tf.compat.v1.train.shuffle_batch(
-          features,
-          batch_size=batch_size,
-          num_threads=2,
-          capacity=batch_capacity + 3 * batch_size,
-          # Ensures a minimum amount of shuffling of examples.
-          min_after_dequeue=batch_capacity)
+      decode, image_dim = _multi_decode, 36
     else:
-      batched_features = tf.compat.v1.train.batch(
-          features,
-          batch_size=batch_size,
-          num_threads=1,
-          capacity=batch_capacity + 3 * batch_size)
+      decode, image_dim = functools.partial(_decode, image_dim=height), height
+
+    dataset = pipeline.batches(
+        records,
+        batch_size=batch_size,
+        split=split,
+        decode=decode,
+        # Ensures a minimum amount of shuffling of examples.
+        shuffle_buffer=batch_capacity,
+        examples=examples)
+
+    batched_features = pipeline.features(dataset, device, steps, batch_size)
     batched_features['height'] = image_dim
     batched_features['width'] = image_dim
     batched_features['depth'] = 1
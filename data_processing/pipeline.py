@@ -0,0 +1,165 @@
+"""tf.data input pipeline shared by the mnist, cifar10 and smallnorb readers.
+
+Interleaves the record files in parallel, shuffles and batches the raw
+records, decodes whole batches at once and prefetches the batches to the
+device of the tower that consumes them. Per image random distortions run
+between decoding and batching with autotuned parallelism.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+
+AUTOTUNE = tf.data.experimental.AUTOTUNE
+
+
+def records(filenames, reader, split, cycle_length=8):
+  """Reads the records of all the files, interleaving them in parallel.
+
+  Args:
+    filenames: List of the record file paths.
+    reader: Function returning the dataset of records of one file.
+    split: 'train' or 'test'. Training reads the files in a random order and
+      does not keep the record order across files.
+    cycle_length: Number of files read concurrently.
+
+  Returns:
+    A dataset of the raw records.
+  """
+  files = tf.data.Dataset.from_tensor_slices(filenames)
+  if split == 'train':
+    files = files.shuffle(len(filenames))
+
+  return files.interleave(
+      reader,
+      cycle_length=min(cycle_length, len(filenames)),
+      num_parallel_calls=AUTOTUNE,
+      deterministic=(split != 'train'))
+
+
+def batches(dataset, batch_size, split, decode, distort=None,
+            shuffle_buffer=10000, epochs=None, vectorized=False,
+            shuffle_decoded=True, examples=None):
+  """Batches raw records into decoded feature dictionaries.
+
+  Args:
+    dataset: Dataset of raw records.
+    batch_size: Number of examples per batch.
+    split: 'train' or 'test', only training data is shuffled.
+    decode: Function from a batch of raw records to a dictionary of batched
+      features.
+    distort: Optional function from the features of one example to their
+      distorted version.
+    shuffle_buffer: Number of records the shuffle draws from.
+    epochs: Number of passes over the data, None repeats forever.
+    vectorized: If set distort takes and returns whole batches, it runs once
+      per batch instead of once per example.
+    shuffle_decoded: If set and distort runs per example, training shuffles
+      the distorted examples rather than the raw records.
+    examples: If set, every pass reads the first examples records, or the
+      records of a slice of them, and ends with their partial batch instead
+      of dropping it.
+
+  Returns:
+    A dataset of feature dictionaries, with a static batch dimension unless
+    examples is set.
+  """
+  # Without examples passes run into each other and only whole batches are
+  # kept, with examples every pass is batched on its own.
+  drop_remainder = examples is None
+  if drop_remainder:
+    dataset = dataset.repeat(epochs)
+  else:
+    dataset = _take(dataset, examples)
+
+  # Training shuffles the distorted examples when there are any, they are
+  # smaller and cheaper to buffer than the raw records.
+  per_example = distort is not None and not vectorized
+  shuffle_records = not (per_example and shuffle_decoded)
+  if split == 'train' and shuffle_records:
+    dataset = dataset.shuffle(shuffle_buffer)
+
+  def decode_batch(records):
+    features = decode(records)
+    if drop_remainder:
+      features = _static_batch(features, batch_size)
+    if distort is not None and vectorized:
+      # Called like Dataset.map calls it, tuples are unpacked.
+      if isinstance(features, tuple):
+        return distort(*features)
+      return distort(features)
+    return features
+
+  dataset = dataset.batch(batch_size, drop_remainder=drop_remainder)
+  dataset = dataset.map(decode_batch, num_parallel_calls=AUTOTUNE)
+
+  if per_example:
+    dataset = dataset.unbatch()
+    dataset = dataset.map(distort, num_parallel_calls=AUTOTUNE)
+    if split == 'train' and not shuffle_records:
+      dataset = dataset.shuffle(shuffle_buffer)
+    dataset = dataset.batch(batch_size, drop_remainder=drop_remainder)
+
+  if not drop_remainder:
+    dataset = dataset.repeat(epochs)
+  return dataset
+
+
+def _take(dataset, examples):
+  # A slice reads every step-th record from start on, so the towers of a
+  # multi GPU evaluation each read their own records.
+  if isinstance(examples, slice):
+    start, step = examples.start or 0, examples.step or 1
+    return dataset.skip(start).take(examples.stop - start).shard(step, 0)
+  return dataset.take(examples)
+
+
+def _static_batch(features, batch_size):
+  # decoding reshapes to [-1, ...], the capsule layers need the batch size.
+  def static(tensor):
+    tensor.set_shape([batch_size] + tensor.shape.as_list()[1:])
+    return tensor
+
+  return tf.nest.map_structure(static, features)
+
+
+def features(dataset, device=None, steps=None, batch_size=None):
+  """Returns the next batch of features of the dataset.
+
+  Args:
+    dataset: Dataset of batched feature dictionaries.
+    device: The device consuming the features, batches are prefetched there
+      when it is a GPU.
+    steps: If set, number of batches returned at once, stacked along a new
+      leading axis for consumers looping over several batches in one session
+      run.
+    batch_size: If set with steps, the size of the whole batches, they are
+      stacked steps at a time and every partial batch is returned on its own,
+      along a leading axis of 1. Otherwise the batches must have the same size.
+
+  Returns:
+    Dictionary of batched feature tensors.
+  """
+  if steps is not None and batch_size is not None:
+    # The whole batches of a pass must fill their last stack, the partial
+    # batch ending the pass is then emitted right after it.
+    def size(*features):
+      return tf.cast(tf.shape(tf.nest.flatten(features)[0])[0], tf.int64)
+
+    dataset = dataset.group_by_window(
+        key_func=size,
+        reduce_func=lambda key, window: window.batch(steps),
+        window_size_func=lambda key: tf.where(
+            tf.equal(key, batch_size), tf.constant(steps, tf.int64), 1))
+  elif steps is not None:
+    dataset = dataset.batch(steps, drop_remainder=True)
+
+  if device is not None and 'gpu' in device.lower() \
+      and tf.config.list_physical_devices('GPU'):
+    dataset = dataset.apply(tf.data.experimental.prefetch_to_device(device))
+  else:
+    dataset = dataset.prefetch(AUTOTUNE)
+
+  return tf.compat.v1.data.make_one_shot_iterator(dataset).get_next()
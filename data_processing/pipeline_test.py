@@ -0,0 +1,32 @@
+"""Tests for pipeline."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import tensorflow as tf
+
+from . import pipeline
+
+
+class PipelineTest(tf.test.TestCase):
+
+  def testFeaturesStackPartialBatchAlone(self):
+    """Whole batches are stacked steps at a time, the partial one alone."""
+    labels = np.arange(14, dtype=np.int32)
+    with tf.Graph().as_default(), self.session() as sess:
+      dataset = pipeline.batches(
+          tf.data.Dataset.from_tensor_slices(labels), batch_size=4,
+          split='test', decode=lambda batch: {'labels': batch}, examples=14)
+      features = pipeline.features(dataset, steps=3, batch_size=4)
+
+      for _ in range(2):
+        self.assertAllEqual(labels[:12].reshape(3, 4),
+                            sess.run(features['labels']))
+        self.assertAllEqual(labels[12:].reshape(1, 2),
+                            sess.run(features['labels']))
+
+
+if __name__ == '__main__':
+  tf.test.main()
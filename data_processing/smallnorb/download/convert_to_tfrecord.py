@@ -1,7 +1,9 @@
 import tensorflow as tf
 import numpy as np
 
+import argparse
 import logging
+import multiprocessing
 import daiquiri
 from time import time
 import os
@@ -9,16 +11,127 @@ import sys
 
 from numpy.random import RandomState
 
-prng = RandomState(1234567890)
+if not __package__:
+    # Run as a script, the repository root holds the data_processing package.
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+
+from data_processing.smallnorb.smallnorb_input_record import cache_paths
 
 daiquiri.setup(level=logging.DEBUG)
 logger = daiquiri.getLogger(__name__)
 
 
-def convert_to_tfrecord(kind: str, chunkify=False):
+MAT_FILES = {
+    "train": "smallnorb-5x46789x9x18x6x2x96x96-training-{}.mat",
+    "test": "smallnorb-5x01235x9x18x6x2x96x96-testing-{}.mat",
+}
+
+## header sizes of the dat, cat and info files in int32.
+HEADERS = {"dat": 6, "cat": 5, "info": 5}
+
+METADATA = np.dtype([
+    ("label", np.int32),
+    ("category", np.int32),
+    ("elevation", np.int32),
+    ("azimuth", np.int32),
+    ("lighting", np.int32),
+])
+
+## make dataset permuatation reproduceable
+SEED = 1234567890
+
+
+def _num_images(dir_mat, kind):
+    """Number of images of a split, read from the header of its .dat file.
+
+    The header holds the magic number, the number of dimensions and the
+    [pairs, 2, 96, 96] shape, the images come in stereo pairs.
+    """
+    path = os.path.join(dir_mat, MAT_FILES[kind].format("dat"))
+    return int(np.fromfile(path, dtype=np.int32, count=3)[2]) * 2
+
+
+def _mat(dir_mat, kind, part, dtype, shape):
+    """Memory maps the array stored in a smallNORB .mat file after its header."""
+    path = os.path.join(dir_mat, MAT_FILES[kind].format(part))
+    return np.memmap(path, dtype=dtype, mode='r', offset=HEADERS[part] * 4, shape=shape)
+
+
+def _metadata(dir_mat, kind):
+    """Reads the labels and additional info of a split into a METADATA table
+    with one row per image.
+    """
+    num_images = _num_images(dir_mat, kind)
+    num_labels = num_images // 2
+
+    def read(part, count):
+        path = os.path.join(dir_mat, MAT_FILES[kind].format(part))
+        return np.fromfile(path, dtype=np.int32, count=count, offset=HEADERS[part] * 4)
+
+    labels = read("cat", num_labels)
+    # Info
+    # 1. the instance in the category (0 to 9)
+    # 2. the elevation (0 to 8, which mean cameras are 30, 35,40,45,50,55,60,65,70 degrees from the horizontal respectively)
+    # 3. the azimuth (0,2,4,...,34, multiply by 10 to get the azimuth in degrees)
+    # 4. the lighting condition (0 to 5)
+    info = read("info", num_labels * 4).reshape(num_labels, 4)
+    elevation = np.array([30, 35, 40, 45, 50, 55, 60, 65, 70])
+    info[:, 1] = elevation[info[:, 1]]
+    info[:, 2] = info[:, 2] * 10
+
+    # The images are in stereo pairs, so two images correspond to one label
+    metadata = np.zeros(num_images, METADATA)
+    metadata["label"] = np.repeat(labels, 2)
+    for column, name in enumerate(METADATA.names[1:]):
+        metadata[name] = np.repeat(info[:, column], 2)
+    return metadata
+
+
+def _images(dir_mat, kind, index, chunk):
+    """Yields the images of index in chunks, as float64 [chunk, 96 * 96] arrays.
+
+    Every chunk is read from the memory mapped .dat file in file order, so
+    memory stays bounded by the chunk whatever the permutation.
+    """
+    images = _mat(dir_mat, kind, "dat", np.uint8, (_num_images(dir_mat, kind), 96 * 96))
+    for first in range(0, len(index), chunk):
+        block = index[first:first + chunk]
+        order = np.argsort(block)
+        pixels = np.empty((len(block), 96 * 96), np.float64)
+        pixels[order] = images[block[order]]
+        yield pixels
+
+
+def _write_shard(dir_mat, kind, path, index, metadata, chunk):
+    """Writes the images of index and their metadata rows into one TFRecord
+    file, then counts the records it holds.
+    """
+    with tf.io.TFRecordWriter(path) as writer:
+        rows = iter(metadata)
+        for pixels in _images(dir_mat, kind, index, chunk):
+            for img, row in zip(pixels, rows):
+                example = tf.train.Example(features=tf.train.Features(feature={
+                    'img_raw': tf.train.Feature(bytes_list=tf.train.BytesList(value=[img.tobytes()])),
+                    "label": tf.train.Feature(int64_list=tf.train.Int64List(value=[row["label"]])),
+                    'category': tf.train.Feature(int64_list=tf.train.Int64List(value=[row["category"]])),
+                    'elevation': tf.train.Feature(int64_list=tf.train.Int64List(value=[row["elevation"]])),
+                    'azimuth': tf.train.Feature(int64_list=tf.train.Int64List(value=[row["azimuth"]])),
+                    'lighting': tf.train.Feature(int64_list=tf.train.Int64List(value=[row["lighting"]]))
+                }))
+                writer.write(example.SerializeToString())
+
+    count = sum(1 for _ in tf.data.TFRecordDataset(path))
+    logger.info('Wrote {} records to {}'.format(count, path))
+    return path, count
+
+
+def convert_to_tfrecord(kind: str, shards=8, processes=None, data_store='./smallnorb_data/',
+                        chunk=1024):
     """Generate TFRecord for train and test datasets from smallNORB .mat files.
-    Combine the images, labels and additional info from .mat files into TFRecord. The chunk approach
-    has not been fully tested tested.
+    Combine the images, labels and additional info from .mat files into TFRecord
+    shards {kind}0.tfrecords ... {kind}{shards - 1}.tfrecords. The shards hold
+    consecutive slices of one reproducible permutation of the split and are
+    written in parallel worker processes, each streaming chunk images at a time.
     The following .mat files are required (download.sh):
         1. smallnorb-5x46789x9x18x6x2x96x96-training-dat.mat
         2. smallnorb-5x46789x9x18x6x2x96x96-training-cat.mat
@@ -28,140 +141,106 @@ def convert_to_tfrecord(kind: str, chunkify=False):
         6. smallnorb-5x01235x9x18x6x2x96x96-testing-info.mat
     Args:
         kind : 'train' or 'test'
-        chunkify : kernel size
-        s : stride
+        shards : number of TFRecord files
+        processes : number of worker processes, defaults to one per CPU
+        data_store : directory of the .mat files and of the TFRecords
+        chunk : number of images a worker holds in memory
     Returns:
-        A 2D numpy matrix containing mapping between children capsules along the rows,
-        and parent capsules along the columns.
+        The paths of the shards.
+    Raises:
+        ValueError: if a shard does not hold the expected number of records.
     """
+    start = time()
 
-    # Plan A: write dataset into one big tfrecord
-    # Plan B: write dataset into manageable chuncks
-    CHUNK = int(24300 * 2 / 10)  # create 10 chunks
-    TOTAL_NUM_IMAGES = int(24300 * 2)
+    if not tf.compat.v1.gfile.Exists(data_store):
+        tf.compat.v1.gfile.MakeDirs(data_store)
 
+    metadata = _metadata(data_store, kind)
+    perm = RandomState(SEED).permutation(len(metadata))
+
+    jobs = []
+    for j, index in enumerate(np.array_split(perm, shards)):
+        path = os.path.join(data_store, kind + "%d.tfrecords" % j)
+        jobs.append((data_store, kind, path, index, metadata[index], chunk))
+
+    # TensorFlow is not fork safe, the workers start from a fresh interpreter.
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(min(processes or os.cpu_count(), shards)) as pool:
+        written = pool.starmap(_write_shard, jobs)
+
+    for (path, count), job in zip(written, jobs):
+        if count != len(job[3]):
+            raise ValueError('{} holds {} records instead of {}.'.format(path, count, len(job[3])))
+
+    logger.info('Done writing ' + kind + '. Total time: %f' % (time() - start))
+
+    return [path for path, _ in written]
+
+
+def convert_to_npy(kind: str, size=48, data_store='./smallnorb_data/', chunk=2430):
+    """Generate a memory mappable uint8 cache of a split from smallNORB .mat files.
+
+    Downsamples every image once to size x size, with the bilinear resize the
+    input pipeline applied each epoch, and stores them in a [N, size, size, 1]
+    uint8 .npy file. Labels and the additional info are stored in a
+    structured .npy table with the METADATA fields. Both files follow the
+    permutation of convert_to_tfrecord.
+
+    Args:
+        kind : 'train' or 'test'
+        size : height and width of the stored images
+        data_store : directory of the .mat files and of the cache
+        chunk : number of images resized at once
+    Returns:
+        The paths of the image cache and of the metadata table.
+    """
     start = time()
 
-    # Set up directories
-    data_store = os.path.join('./', 'smallnorb_data/')
-    dir_mat = data_store
-    dir_tfrecords = data_store
+    num_images = _num_images(data_store, kind)
+    images = _mat(data_store, kind, "dat", np.uint8, (num_images, 96, 96))
+    metadata = _metadata(data_store, kind)
+    perm = RandomState(SEED).permutation(num_images)
 
-    if not tf.compat.v1.gfile.Exists(dir_tfrecords):
-        tf.compat.v1.gfile.MakeDirs(dir_tfrecords)
+    images_path, metadata_path = cache_paths(data_store, kind, size)
+    cache = np.lib.format.open_memmap(
+        images_path, mode='w+', dtype=np.uint8, shape=(num_images, size, size, 1))
 
-    # ----- READ -----#
+    for first in range(0, num_images, chunk):
+        index = perm[first:first + chunk]
 
-    if kind == "train":
-        fid_images = open(dir_mat + '/smallnorb-5x46789x9x18x6x2x96x96-training-dat.mat', 'rb')
-        fid_labels = open(dir_mat + '/smallnorb-5x46789x9x18x6x2x96x96-training-cat.mat', 'rb')
-        fid_info = open(dir_mat + '/smallnorb-5x46789x9x18x6x2x96x96-training-info.mat', 'rb')
-    elif kind == "test":
-        fid_images = open(dir_mat + '/smallnorb-5x01235x9x18x6x2x96x96-testing-dat.mat', 'rb')
-        fid_labels = open(dir_mat + '/smallnorb-5x01235x9x18x6x2x96x96-testing-cat.mat', 'rb')
-        fid_info = open(dir_mat + '/smallnorb-5x01235x9x18x6x2x96x96-testing-info.mat', 'rb')
-    else:
-        logger.warning('Please choose either training or testing data to preprocess.')
+        # Reads the chunk in file order, stores it in permutation order.
+        order = np.argsort(index)
+        chunk_images = np.empty((len(index), 96, 96, 1), np.float32)
+        chunk_images[order, ..., 0] = images[index[order]]
 
-    logger.info('Reading data finished:' + kind)
+        resized = tf.compat.v1.image.resize_images(chunk_images, [size, size])
+        cache[first:first + chunk] = np.clip(np.round(resized.numpy()), 0, 255).astype(np.uint8)
+        logger.info('Resized ' + kind + ' images %d' % (first + len(index)))
 
-    # Preprocessing to remove headers
-    # Images
-    for i in range(6):
-        a = fid_images.read(4)
-    # Labels
-    for i in range(5):
-        a = fid_labels.read(4)
-    # Info
-    for i in range(5):
-        a = fid_info.read(4)
-
-    for j in range(TOTAL_NUM_IMAGES // CHUNK if chunkify else 1):
-
-        num_images = CHUNK if chunkify else TOTAL_NUM_IMAGES  # 24300 * 2
-        num_labels = int(num_images / 2)  # the images are in stereo pairs, so two images correspond to one label
-
-        # ----- LOAD -----#
-
-        # Images
-        images = np.zeros((num_images, 96 * 96))
-        for idx in range(num_images):
-            if idx % 100 == 0:
-                logger.info('Load ' + kind + ' images %d' % ((j + 1) * idx))
-            temp = fid_images.read(96 * 96)
-            images[idx, :] = np.fromstring(temp, 'uint8')
-
-        # ----- PROCESS -----#
-
-        # Labels
-        labels = np.fromstring(fid_labels.read(num_images * np.dtype('int32').itemsize), 'int32')
-        # The images are in stereo pairs, so two images correspond to one label
-        labels = np.repeat(labels, 2)
-
-        # Info
-        # 1. the instance in the category (0 to 9)
-        # 2. the elevation (0 to 8, which mean cameras are 30, 35,40,45,50,55,60,65,70 degrees from the horizontal respectively)
-        # 3. the azimuth (0,2,4,...,34, multiply by 10 to get the azimuth in degrees)
-        # 4. the lighting condition (0 to 5)
-        info = np.fromstring(fid_info.read(4 * num_labels * np.dtype('int32').itemsize), 'int32')
-        info = info.reshape(num_labels, 4)
-        # Elevation
-        elevation = np.array([30, 35, 40, 45, 50, 55, 60, 65, 70])
-        info[:, 1] = elevation[info[:, 1]]
-        # Azimuth
-        info[:, 2] = info[:, 2] * 10
-        # The images are in stereo pairs, so two images correspond to one info vector
-        info = np.repeat(info, 2, axis=0)
-
-        logger.debug('Load data %d finish. Start filling chunk %d.' % (j, j))
-
-        # make dataset permuatation reproduceable
-        perm = prng.permutation(num_images)
-        images = images[perm]
-        labels = labels[perm]
-        info = info[perm]
-
-        # ----- WRITE -----#
-
-        tfrecord_path = dir_tfrecords + kind + "%d.tfrecords" % j
-        writer = tf.compat.v1.python_io.TFRecordWriter(tfrecord_path)
-        for i in range(num_images):
-            if i % 100 == 0:
-                logger.info('Write ' + kind + ' images %d' % ((j + 1) * i))
-
-            img = images[i, :].tobytes()
-            lab = labels[i].astype(np.int32)
-            category = info[i, 0].astype(np.int32)
-            elevation = info[i, 1].astype(np.int32)
-            azimuth = info[i, 2].astype(np.int32)
-            lighting = info[i, 3].astype(np.int32)
-
-            example = tf.train.Example(features=tf.train.Features(feature={
-                'img_raw': tf.train.Feature(bytes_list=tf.train.BytesList(value=[img])),
-                "label": tf.train.Feature(int64_list=tf.train.Int64List(value=[lab])),
-                'category': tf.train.Feature(int64_list=tf.train.Int64List(value=[category])),
-                'elevation': tf.train.Feature(int64_list=tf.train.Int64List(value=[elevation])),
-                'azimuth': tf.train.Feature(int64_list=tf.train.Int64List(value=[azimuth])),
-                'lighting': tf.train.Feature(int64_list=tf.train.Int64List(value=[lighting]))
-            }))
-            writer.write(example.SerializeToString())  # Translate Chinese comment: Serialized as a string
-        writer.close()
-
-    # Should take less than a minute
-    logger.info('Done writing ' + kind + '. Total time: %f' % (time() - start))
+    cache.flush()
+    del cache
+    np.save(metadata_path, metadata[perm])
+
+    logger.info('Done caching ' + kind + '. Total time: %f' % (time() - start))
 
-    # Count
-    # If not using sharded approach, then should be 48 600 in both train and test tfrecords
-    logger.info("Counting...")
-    c = 0
-    for record in tf.compat.v1.python_io.tf_record_iterator(tfrecord_path):
-        c += 1
-    logger.info("Number of records in {} tfrecord: {}".format(kind, c))
+    return images_path, metadata_path
 
 
 if __name__ == "__main__":
 
-    if len(sys.argv) > 1:
-        convert_to_tfrecord(kind=sys.argv[1], chunkify=False)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('kind', nargs='?', default='train', choices=['train', 'test'])
+    parser.add_argument('--format', default='tfrecord', choices=['tfrecord', 'npy'],
+                        help='float64 TFRecords or the pre-resized uint8 memmap cache.')
+    parser.add_argument('--size', default=48, type=int,
+                        help='image size of the npy cache.')
+    parser.add_argument('--shards', default=8, type=int,
+                        help='number of TFRecord files.')
+    parser.add_argument('--processes', default=None, type=int,
+                        help='number of processes writing TFRecord files, one per CPU by default.')
+    args = parser.parse_args()
+
+    if args.format == 'npy':
+        convert_to_npy(kind=args.kind, size=args.size)
     else:
-        convert_to_tfrecord(kind='train', chunkify=False)
+        convert_to_tfrecord(kind=args.kind, shards=args.shards, processes=args.processes)
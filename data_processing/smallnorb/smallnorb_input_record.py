@@ -10,120 +10,20 @@ from __future__ import division
 from __future__ import print_function
 
 import os
+import re
 
+import numpy as np
 import tensorflow as tf
 
+from .. import augment
+from .. import pipeline
 
-def _read_input(filename_queue):
-  """Reads a single record and converts it to a tensor.
-
-  Each record consists the 3x32x32 image with one byte for the label.
-
-  Args:
-    filename_queue: A queue of strings with the filenames to read from.
-
-  Returns:
-      image: a [32, 32, 3] float32 Tensor with the image data.
-      label: an int32 Tensor with the label in the range 0..9.
-  """
-  label_bytes = 1
-  height = 32
-  depth = 3
-  image_bytes = height * height * depth
-  record_bytes = label_bytes + image_bytes
-
-  reader = tf.compat.v1.FixedLengthRecordReader(record_bytes=record_bytes)
-  _, byte_data = reader.read(filename_queue)
-  uint_data = tf.io.decode_raw(byte_data, tf.uint8)
-
-  label = tf.cast(tf.strided_slice(uint_data, [0], [label_bytes]), tf.int32)
-  label.set_shape([1])
-
-  depth_major = tf.reshape(
-      tf.strided_slice(uint_data, [label_bytes], [record_bytes]),
-      [depth, height, height])
-  image = tf.cast(tf.transpose(a=depth_major, perm=[1, 2, 0]), tf.float32)
-
-  return image, label
-
-
-def _distort_resize(image, image_size):
-  """Distorts input images for CIFAR training.
-
-  Adds standard distortions such as flipping, cropping and changing brightness
-  and contrast.
-
-  Args:
-    image: A float32 tensor with last dimmension equal to 3.
-    image_size: The output image size after cropping.
-
-  Returns:
-    distorted_image: A float32 tensor with shape [image_size, image_size, 3].
-  """
-  distorted_image = tf.image.random_crop(image, [image_size, image_size, 3])
-  distorted_image = tf.image.random_flip_left_right(distorted_image)
-  distorted_image = tf.image.random_brightness(distorted_image, max_delta=63)
-  distorted_image = tf.image.random_contrast(
-      distorted_image, lower=0.2, upper=1.8)
-  distorted_image.set_shape([image_size, image_size, 3])
-  return distorted_image
-
-
-def _batch_features(image, label, batch_size, split, image_size):
-  """Constructs the batched feature dictionary.
-
-  Batches the images and labels accourding to the split. Shuffles the data only
-  if split is train. Formats the feature dictionary to be in the format required
-  by experiment.py.
-
-  Args:
-    image: A float32 tensor with shape [image_size, image_size, 3].
-    label: An int32 tensor with the label of the image.
-    batch_size: The number of data points in the output batch.
-    split: 'train' or 'test'.
-    image_size: The size of the input image.
-
-  Returns:
-    batched_features: A dictionary of the input data features.
-  """
-  image = tf.transpose(a=image, perm=[2, 0, 1])
-  features = {
-      'images': image,
-      'labels': tf.one_hot(label, 5),
-      'recons_image': image,
-      'recons_label': label,
-  }
-  if split == 'train':
-    batched_features = tf.compat.v1.train.shuffle_batch(
-        features,
-        batch_size=batch_size,
-        num_threads=16,
-        capacity=10000 + 3 * batch_size,
-        min_after_dequeue=10000)
-  else:
-    batched_features = tf.compat.v1.train.batch(
-        features,
-        batch_size=batch_size,
-        num_threads=1,
-        capacity=10000 + 3 * batch_size)
-  batched_features['labels'] = tf.reshape(batched_features['labels'],
-                                          [batch_size, 5])
-  batched_features['recons_label'] = tf.reshape(
-      batched_features['recons_label'], [batch_size])
-  batched_features['height'] = image_size
-  batched_features['width'] = image_size
-  batched_features['depth'] = 3
-  batched_features['num_targets'] = 1
-  batched_features['num_classes'] = 5
-  return batched_features
-
-import os
 
-def _parser(serialized_example):
-    """Parse smallNORB example from tfrecord.
+def _parser(serialized_examples):
+    """Parse a batch of smallNORB examples from tfrecord.
 
     Args:
-      serialized_example: serialized example from tfrecord
+      serialized_examples: batch of serialized examples from tfrecord
     Returns:
       img: image
       lab: label
@@ -143,19 +43,19 @@ def _parser(serialized_example):
         the lighting condition (0 to 5)
     """
 
-    features = tf.compat.v1.parse_single_example(
-        serialized_example,
+    features = tf.io.parse_example(
+        serialized_examples,
         features={
-            'img_raw': tf.compat.v1.FixedLenFeature([], tf.string),
-            'label': tf.compat.v1.FixedLenFeature([], tf.int64),
-            'category': tf.compat.v1.FixedLenFeature([], tf.int64),
-            'elevation': tf.compat.v1.FixedLenFeature([], tf.int64),
-            'azimuth': tf.compat.v1.FixedLenFeature([], tf.int64),
-            'lighting': tf.compat.v1.FixedLenFeature([], tf.int64),
+            'img_raw': tf.io.FixedLenFeature([], tf.string),
+            'label': tf.io.FixedLenFeature([], tf.int64),
+            'category': tf.io.FixedLenFeature([], tf.int64),
+            'elevation': tf.io.FixedLenFeature([], tf.int64),
+            'azimuth': tf.io.FixedLenFeature([], tf.int64),
+            'lighting': tf.io.FixedLenFeature([], tf.int64),
         })
 
-    img = tf.compat.v1.decode_raw(features['img_raw'], tf.float64)
-    img = tf.reshape(img, [96, 96, 1])
+    img = tf.io.decode_raw(features['img_raw'], tf.float64)
+    img = tf.reshape(img, [-1, 96, 96, 1])
     img = tf.cast(img, tf.float32)  # * (1. / 255) # left unnormalized
 
     lab = tf.cast(features['label'], tf.int32)
@@ -167,8 +67,18 @@ def _parser(serialized_example):
     return img, lab, cat, elv, azi, lit
 
 
+def _downsample(img, lab, cat, elv, azi, lit):
+    """Scales and downsamples a batch of images to 48 x 48."""
+
+    img = img / 255.
+    img = tf.compat.v1.image.resize_images(img, [48, 48])
+    #img = tf.image.per_image_standardization(img)
+
+    return img, lab, cat, elv, azi, lit
+
+
 def _train_preprocess(img, lab, cat, elv, azi, lit):
-    """Preprocessing for training.
+    """Preprocessing for training, of one downsampled image.
 
     Preprocessing from Hinton et al. (2018) "Matrix capsules with EM routing."
     Hinton2018: "We downsample smallNORB to 48 × 48 pixels and normalize each
@@ -185,9 +95,6 @@ def _train_preprocess(img, lab, cat, elv, azi, lit):
       lab, cat, elv, azi, lit: allow these to pass through
     """
 
-    img = img / 255.
-    img = tf.compat.v1.image.resize_images(img, [48, 48])
-    #img = tf.image.per_image_standardization(img)
     img = tf.compat.v1.random_crop(img, [32, 32, 1])
     img = tf.image.random_brightness(img, max_delta=32. / 255.)
     # original 0.5, 1.5
@@ -202,8 +109,22 @@ def _train_preprocess(img, lab, cat, elv, azi, lit):
     return img, lab, cat, elv, azi, lit
 
 
+def _train_preprocess_batch(img, lab, cat, elv, azi, lit):
+    """Preprocessing for training, of a downsampled batch.
+
+    Same distortions as _train_preprocess with independent random parameters
+    for every image, as a few batch level ops.
+    """
+
+    img = augment.random_crop(img, 32)
+    img = augment.random_brightness(img, max_delta=32. / 255.)
+    img = augment.random_contrast(img, lower=0.5, upper=1.5)
+
+    return img, lab, cat, elv, azi, lit
+
+
 def _val_preprocess(img, lab, cat, elv, azi, lit):
-    """Preprocessing for validation/testing.
+    """Preprocessing for validation/testing, of a downsampled batch.
 
     Preprocessing from Hinton et al. (2018) "Matrix capsules with EM routing."
     Hinton2018: "We downsample smallNORB to 48 × 48 pixels and normalize each
@@ -220,10 +141,7 @@ def _val_preprocess(img, lab, cat, elv, azi, lit):
       lab, cat, elv, azi, lit: allow these to pass through
     """
 
-    img = img / 255.
-    img = tf.compat.v1.image.resize_images(img, [48, 48])
-    #img = tf.image.per_image_standardization(img)
-    img = tf.slice(img, [8, 8, 0], [32, 32, 1])
+    img = img[:, 8:40, 8:40, :]
 
 
     # Original
@@ -233,41 +151,37 @@ def _val_preprocess(img, lab, cat, elv, azi, lit):
     return img, lab, cat, elv, azi, lit
 
 
-def input_fn(path, is_train: bool, batch_size = 64, epochs=100):
+def input_fn(path, is_train: bool, batch_size = 64, epochs=100, batch_augment=False,
+             examples=None):
     """Input pipeline for smallNORB using tf.data.
 
     Author:
       Ashley Gritzman 15/11/2018
     Args:
       is_train:
+      batch_augment: distort the training images a batch at a time
+      examples: if set, every pass reads the first examples and ends with a
+        partial batch
     Returns:
       dataset: image tf.data.Dataset
     """
 
-    import re
     if is_train:
         CHUNK_RE = re.compile(r"train.*\.tfrecords")
     else:
         CHUNK_RE = re.compile(r"test.*\.tfrecords")
 
     chunk_files = [os.path.join(path, fname)
-                   for fname in os.listdir(path)
+                   for fname in sorted(os.listdir(path))
                    if CHUNK_RE.match(fname)]
 
-    # 1. create the dataset
-    dataset = tf.data.TFRecordDataset(chunk_files)
+    split = "train" if is_train else "test"
 
-    # 2. map with the actual work (preprocessing, augmentation…) using multiple
-    # parallel calls
-    dataset = dataset.map(_parser, num_parallel_calls=4)
-    if is_train:
-        dataset = dataset.map(_train_preprocess,
-                              num_parallel_calls=4)
-    else:
-        dataset = dataset.map(_val_preprocess,
-                              num_parallel_calls=4)
+    # 1. read the chunks in parallel
+    dataset = pipeline.records(chunk_files, tf.data.TFRecordDataset, split)
 
-    # 3. shuffle (with a big enough buffer size)
+    # 2. shuffle (with a big enough buffer size), batch and decode whole
+    # batches, training distorts every image with autotuned parallelism.
     # In response to a question on OpenReview, Hinton et al. wrote the
     # following:
     # https://openreview.net/forum?id=HJWLfGWRb&noteId=rJgxonoNnm
@@ -276,21 +190,107 @@ def input_fn(path, is_train: bool, batch_size = 64, epochs=100):
     # capacity=2000 + 3 * batch_size, ensures a minimum amount of shuffling of
     # examples. min_after_dequeue=2000."
     capacity = 2000 + 3 * batch_size
-    dataset = dataset.shuffle(buffer_size=capacity)
 
-    # 4. batch
-    dataset = dataset.batch(batch_size, drop_remainder=True)
+    def decode(examples):
+        features = _downsample(*_parser(examples))
+        if is_train:
+            return features
+        return _val_preprocess(*features)
+
+    if batch_augment:
+        distort = _train_preprocess_batch if is_train else None
+    else:
+        distort = _train_preprocess if is_train else None
+
+    dataset = pipeline.batches(
+        dataset,
+        batch_size=batch_size,
+        split=split,
+        decode=decode,
+        distort=distort,
+        shuffle_buffer=capacity,
+        epochs=epochs,
+        vectorized=batch_augment,
+        examples=examples)
+
+    return dataset
+
+
+def cache_paths(path, split, size=48):
+    """Paths of the image cache and metadata table of a split, written by
+    convert_to_tfrecord.py --format npy.
+    """
+    images = os.path.join(path, "{}_{}x{}.npy".format(split, size, size))
+    metadata = os.path.join(path, "{}_{}x{}_metadata.npy".format(split, size, size))
+    return images, metadata
+
+
+def memmap_input_fn(path, is_train: bool, batch_size = 64, epochs=100, batch_augment=False,
+                    size=48, examples=None):
+    """Input pipeline for the memory mapped uint8 smallNORB cache.
+
+    The images are read straight from the memory mapped .npy file, already
+    downsampled, only the examples of each batch are copied.
+
+    Args:
+      is_train:
+      batch_augment: distort the training images a batch at a time
+      size: image size of the cache
+      examples: if set, every pass reads the first examples and ends with a
+        partial batch
+    Returns:
+      dataset: image tf.data.Dataset
+    """
+
+    split = "train" if is_train else "test"
+
+    images_path, metadata_path = cache_paths(path, split, size)
+    images = np.load(images_path, mmap_mode='r')
+    metadata = np.load(metadata_path)
+
+    def read(index):
+        # file order reads, the order within a batch does not matter.
+        index = np.sort(index)
+        rows = metadata[index]
+        return (images[index], rows['label'], rows['category'], rows['elevation'],
+                rows['azimuth'], rows['lighting'])
+
+    def decode(index):
+        img, lab, cat, elv, azi, lit = tf.numpy_function(
+            read, [index], [tf.uint8] + [tf.int32] * 5)
 
-    # 5. repeat
-    dataset = dataset.repeat(count=epochs)
+        img = tf.reshape(img, [-1, size, size, 1])
+        img = tf.cast(img, tf.float32) / 255.
+        lab, cat, elv, azi, lit = [tf.reshape(x, [-1]) for x in (lab, cat, elv, azi, lit)]
+        features = img, lab, cat, elv, azi, lit
 
-    # 6. prefetch
-    dataset = dataset.prefetch(1)
+        if is_train:
+            return features
+        return _val_preprocess(*features)
+
+    if batch_augment:
+        distort = _train_preprocess_batch if is_train else None
+    else:
+        distort = _train_preprocess if is_train else None
+
+    # the indices are cheap to shuffle, all of them are.
+    dataset = pipeline.batches(
+        tf.data.Dataset.range(len(images)),
+        batch_size=batch_size,
+        split=split,
+        decode=decode,
+        distort=distort,
+        shuffle_buffer=len(images),
+        epochs=epochs,
+        vectorized=batch_augment,
+        shuffle_decoded=False,
+        examples=examples)
 
     return dataset
 
 
-def create_inputs_norb(path, is_train: bool,batch_size,epochs):
+def create_inputs_norb(path, is_train: bool,batch_size,epochs,device=None,batch_augment=False,
+                       memmap=False, steps=None, examples=None):
     """Get a batch from the input pipeline.
 
     Author:
@@ -302,12 +302,15 @@ def create_inputs_norb(path, is_train: bool,batch_size,epochs):
     """
 
     # Create batched dataset
-    dataset = input_fn(path, is_train,batch_size=batch_size, epochs=epochs)
-
-    # Create one-shot iterator
-    iterator = tf.compat.v1.data.make_one_shot_iterator(dataset)
+    if memmap:
+        dataset = memmap_input_fn(path, is_train, batch_size=batch_size, epochs=epochs,
+                                  batch_augment=batch_augment, examples=examples)
+    else:
+        dataset = input_fn(path, is_train,batch_size=batch_size, epochs=epochs,
+                           batch_augment=batch_augment, examples=examples)
 
-    img, lab, cat, elv, azi, lit = iterator.get_next()
+    # Prefetch to the device
+    img, lab, cat, elv, azi, lit = pipeline.features(dataset, device, steps, batch_size)
 
     output_dict = {'image': img,
                    'label': lab,
@@ -322,9 +325,16 @@ def create_inputs_norb(path, is_train: bool,batch_size,epochs):
 def inputs(data_dir,
            batch_size,
            split,
-           epochs=50):
-
-    dict = create_inputs_norb(data_dir, split == "train",batch_size=batch_size, epochs=epochs)
+           epochs=50,
+           device=None,
+           batch_augment=False,
+           memmap=False,
+           steps=None,
+           examples=None):
+
+    dict = create_inputs_norb(data_dir, split == "train",batch_size=batch_size, epochs=epochs,
+                              device=device, batch_augment=batch_augment, memmap=memmap,
+                              steps=steps, examples=examples)
 
     batched_features={}
 
@@ -0,0 +1,90 @@
+"""Tests for the smallNORB TFRecord and memory mapped readers."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from . import smallnorb_input_record
+from .download import convert_to_tfrecord
+
+
+class SmallNorbInputTest(tf.test.TestCase):
+
+    def _write_mat(self, data_dir, pairs):
+        """Writes synthetic test split .mat files, returns the labels and info."""
+        rng = np.random.RandomState(0)
+        labels = rng.randint(0, 5, pairs).astype(np.int32)
+        info = np.stack([
+            rng.randint(0, 10, pairs),
+            rng.randint(0, 9, pairs),
+            rng.randint(0, 18, pairs) * 2,
+            rng.randint(0, 6, pairs)], axis=1).astype(np.int32)
+        images = rng.randint(0, 256, (pairs, 2, 96, 96)).astype(np.uint8)
+
+        for part, header, values in [
+                ("dat", [0x1E3D4C55, 4, pairs, 2, 96, 96], images),
+                ("cat", [0x1E3D4C54, 1, pairs, 1, 1], labels),
+                ("info", [0x1E3D4C54, 2, pairs, 4, 1], info)]:
+            path = os.path.join(data_dir, convert_to_tfrecord.MAT_FILES["test"].format(part))
+            with open(path, "wb") as f:
+                f.write(np.array(header, np.int32).tobytes())
+                f.write(values.tobytes())
+
+        return labels, info
+
+    def _read(self, dataset):
+        features = tf.compat.v1.data.make_one_shot_iterator(dataset).get_next()
+        batches = []
+        with self.session() as sess:
+            while True:
+                try:
+                    batches.append(sess.run(features))
+                except tf.errors.OutOfRangeError:
+                    break
+        return [np.concatenate(feature) for feature in zip(*batches)]
+
+    def testMemmapMatchesTFRecords(self):
+        """The cache holds the images and metadata of the TFRecords, in the
+        same permutation.
+        """
+        data_dir = self.get_temp_dir()
+        pairs = 6
+        labels, info = self._write_mat(data_dir, pairs)
+
+        convert_to_tfrecord.convert_to_tfrecord("test", shards=1, processes=1, data_store=data_dir)
+        images_path, metadata_path = convert_to_tfrecord.convert_to_npy(
+            "test", data_store=data_dir, chunk=5)
+        self.assertEqual(
+            (images_path, metadata_path),
+            smallnorb_input_record.cache_paths(data_dir, "test"))
+
+        with tf.Graph().as_default():
+            records = self._read(smallnorb_input_record.input_fn(
+                data_dir, False, batch_size=4, epochs=1))
+            cached = self._read(smallnorb_input_record.memmap_input_fn(
+                data_dir, False, batch_size=4, epochs=1))
+
+        self.assertEqual((pairs * 2, 32, 32, 1), cached[0].shape)
+        # uint8 storage rounds each pixel by at most half a level.
+        self.assertAllClose(records[0], cached[0], atol=0.5 / 255 + 1e-6, rtol=0)
+
+        perm = np.random.RandomState(convert_to_tfrecord.SEED).permutation(pairs * 2)
+        elevation = np.array([30, 35, 40, 45, 50, 55, 60, 65, 70])
+        expected = [
+            np.repeat(labels, 2)[perm],
+            np.repeat(info[:, 0], 2)[perm],
+            np.repeat(elevation[info[:, 1]], 2)[perm],
+            np.repeat(info[:, 2] * 10, 2)[perm],
+            np.repeat(info[:, 3], 2)[perm]]
+        for expected_column, record_column, cached_column in zip(expected, records[1:], cached[1:]):
+            self.assertAllEqual(expected_column, record_column)
+            self.assertAllEqual(expected_column, cached_column)
+
+
+if __name__ == "__main__":
+    tf.test.main()
@@ -6,6 +6,7 @@ from __future__ import division
 from __future__ import print_function
 
 import argparse
+import collections
 import os
 import re
 import sys
@@ -23,10 +24,15 @@ import architectures.cap_mlp_shared as CapsMLPShared
 import architectures.cap_nin as CapNIN
 import architectures.cap_dyn as CapDynamic
 import models.capsulemodel as capm
+from data_processing import eval_cache
 from data_processing.cifar10 import cifar10_input
 from data_processing.mnist import mnist_input_record
 from data_processing.smallnorb import smallnorb_input_record
 from models import convmodel
+from models.core import export
+from models.core import variables
+from models.core.ensemble import Ensemble
+from models.core.sweep import CheckpointSweep
 from models.coreimp.kernelmix import MonoKernelMix
 from models.coreimp.commonKernels import GaussianKernel, SpectralMixture
 
@@ -41,6 +47,10 @@ parser.add_argument('--data_dir', default=None,
                     help='The data directory.',type=str)
 parser.add_argument('--eval_size', default=10000,
                     help='Size of the test dataset.', type=int)
+parser.add_argument('--eval_batch_size', default=None,
+                    help='Batch size of the evaluation, the training batch size by default.', type=int)
+parser.add_argument('--eval_steps_per_run', default=10,
+                    help='Maximum number of evaluation batches per session run.', type=int)
 parser.add_argument('--learning_rate', default=0.001,
                     help='Size of the test dataset.', type=float)
 parser.add_argument('--batch_size', default=16,
@@ -79,6 +89,20 @@ parser.add_argument('--num_classes',default=10,
                     type=int,help='number of classes in the dataset.')
 parser.add_argument('--degree',default=None,
                     type=int,help='lstm degree.')
+parser.add_argument('--top_k', default=None,
+                    type=int,help='children kept per parent by the sparse last layer routing.')
+parser.add_argument('--precision', default='float32',
+                    type=str,help='float32, mixed_float16 or mixed_bfloat16.')
+parser.add_argument('--placement', default='parameter_server',
+                    type=str,help='parameter_server, colocated or replicated variables.')
+parser.add_argument('--batch_augment', default=False,
+                    type=bool,help='distort the training images a batch at a time.')
+parser.add_argument('--memmap', default=False,
+                    type=bool,help='read smallnorb from the memory mapped uint8 cache.')
+parser.add_argument('--eval_cache', default=None,
+                    type=str,help='directory persisting the evaluation data of ensemble and history runs.')
+parser.add_argument('--export_dir', default=None,
+                    type=str,help='write the checkpoint as a frozen SavedModel for serving.')
 parser.add_argument('--verbose', default=False,
                     type=bool, help='Register model info.')
 parser.add_argument('--loss_type', default='softmax',
@@ -103,9 +127,22 @@ models = {
     "CapDynamic" : capm.CapsuleModel
 }
 
+## the static features of the test split readers, an exported model is fed
+## images in the layout the readers produce.
+SERVING_FEATURES = {
+    "mnist": {"height": 28, "width": 28, "depth": 1, "num_classes": 10},
+    "cifar10": {"height": 24, "width": 24, "depth": 3, "num_classes": 10},
+    "smallnorb": {"height": 32, "width": 32, "depth": 1, "num_classes": 5},
+}
+
+## the readers emitting channels first images, the layout the models reshape
+## every dataset but smallnorb to. The others are channels last, with a depth
+## of 1 both layouts hold the same values.
+CHANNELS_FIRST = ("cifar10",)
+
 
 def get_features(split, total_batch_size, num_gpus, data_dir, num_targets,
-                 dataset, validate=False):
+                 dataset, validate=False, steps=None, examples=None):
     """Reads the input data and distributes it over num_gpus GPUs.
 
     Each tower of data has 1/FLAGS.num_gpus of the total_batch_size.
@@ -118,6 +155,11 @@ def get_features(split, total_batch_size, num_gpus, data_dir, num_targets,
       num_targets: Number of objects present in the image.
       dataset: The name of the dataset, either norb or mnist.
       validate: If set, subset training data into training and test.
+      steps: If set, number of batches stacked in every feature tensor.
+      examples: If set, every pass over the data reads the first examples, or
+        the examples of a slice of them, and ends with a partial batch, the
+        batch dimension is then unknown. With steps the partial batch is
+        stacked on its own. The towers read every num_gpus-th example each.
 
     Returns:
       A list of batched feature dictionaries.
@@ -127,31 +169,46 @@ def get_features(split, total_batch_size, num_gpus, data_dir, num_targets,
     """
 
     batch_size = total_batch_size // max(1, num_gpus)
+    if isinstance(examples, int):
+        examples = slice(0, examples)
     features = []
     for i in range(num_gpus):
-        with tf.device('/gpu:%d' % i):
-            if dataset == 'mnist':
-                features.append(
-                    mnist_input_record.inputs(
-                        data_dir=data_dir,
-                        batch_size=batch_size,
-                        split=split,
-                        num_targets=num_targets,
-                        validate=validate,
-                    ))
-            elif dataset == 'cifar10':
-                #data_dir = os.path.join(data_dir, 'cifar-10-batches-bin')
-                features.append(
-                    cifar10_input.inputs(
-                        split=split, data_dir=data_dir, batch_size=batch_size))
-            elif dataset == 'smallnorb':
-                features.append(
-                    smallnorb_input_record.inputs(
-                        split=split, data_dir=data_dir, batch_size=batch_size))
-            else:
-                raise ValueError(
-                    'Unexpected dataset {!r}, must be mnist, norb, or cifar10.'.format(
-                        dataset))
+        device = '/gpu:%d' % i
+        tower_examples = examples
+        if examples is not None:
+            start, step = examples.start or 0, examples.step or 1
+            tower_examples = slice(start + i * step, examples.stop, step * num_gpus)
+        if dataset == 'mnist':
+            features.append(
+                mnist_input_record.inputs(
+                    data_dir=data_dir,
+                    batch_size=batch_size,
+                    split=split,
+                    num_targets=num_targets,
+                    validate=validate,
+                    device=device,
+                    steps=steps,
+                    examples=tower_examples,
+                ))
+        elif dataset == 'cifar10':
+            #data_dir = os.path.join(data_dir, 'cifar-10-batches-bin')
+            features.append(
+                cifar10_input.inputs(
+                    split=split, data_dir=data_dir, batch_size=batch_size,
+                    device=device, batch_augment=GLOBAL_HPAR.batch_augment,
+                    steps=steps, examples=tower_examples))
+        elif dataset == 'smallnorb':
+            features.append(
+                smallnorb_input_record.inputs(
+                    split=split, data_dir=data_dir, batch_size=batch_size,
+                    device=device, batch_augment=GLOBAL_HPAR.batch_augment,
+                    memmap=GLOBAL_HPAR.memmap, steps=steps, examples=tower_examples,
+                    ## the evaluation reads the test split once per checkpoint.
+                    epochs=None if split == 'test' else 50))
+        else:
+            raise ValueError(
+                'Unexpected dataset {!r}, must be mnist, norb, or cifar10.'.format(
+                    dataset))
     return features
 
 
@@ -254,47 +311,43 @@ def load_eval(saver, session, load_dir):
 def eval_experiment(session, result, writer, last_step, max_steps, **kwargs):
     """Evaluates the current model on the test dataset once.
 
-    Evaluates the loaded model on the test data set with batch sizes of 100.
-    Aggregates the results and writes one summary point to the summary file.
+    Evaluates the loaded model on the runs of the evaluation graphs, each
+    scoring several batches. Aggregates the results and writes one summary
+    point to the summary file.
 
     Args:
       session: The loaded tf.session with the trained model.
-      result: The resultant operations of the model including evaluation metrics.
+      result: The list of EvalResult operations of the evaluation graphs.
       writer: The summary writer file.
       last_step: The last trained step.
-      max_steps: Maximum number of evaluation iterations.
+      max_steps: The list of the numbers of runs of every graph in result.
       **kwargs: Arguments passed by run_experiment but not used in this function.
     """
     del kwargs
 
     total_correct = 0
     total_almost = 0
-    summary_i=""
-
-    ######################
-    ######################
-    ######################
-    ######################
-
-    max_steps = 1
-
-    for _ in range(max_steps):
-        summary_i, correct, almost = session.run(
-            [result.summary, result.correct, result.almost])
-        total_correct += correct
-        total_almost += almost
-
-    total_false = max_steps * GLOBAL_HPAR.batch_size - total_correct
-    total_almost_false = max_steps * GLOBAL_HPAR.batch_size - total_almost
-    summary = tf.compat.v1.Summary.FromString(summary_i)
+    examples = 0
+
+    for graph_result, runs in zip(result, max_steps):
+        for _ in range(runs):
+            correct, almost, run_examples = session.run(
+                [graph_result.correct, graph_result.almost, graph_result.examples])
+            total_correct += correct
+            total_almost += almost
+            examples += run_examples
+
+    total_false = examples - total_correct
+    total_almost_false = examples - total_almost
+    summary = tf.compat.v1.Summary()
     summary.value.add(tag='correct_prediction', simple_value=total_correct)
     summary.value.add(tag='wrong_prediction', simple_value=total_false)
     summary.value.add(
         tag='almost_wrong_prediction', simple_value=total_almost_false)
     print('Total wrong predictions: {}, wrong percent: {}%'.format(
-        total_false, total_false /(max_steps*GLOBAL_HPAR.batch_size) ))
+        total_false, total_false / examples * 100))
     tf.compat.v1.logging.info('Total wrong predictions: {}, wrong percent: {}%'.format(
-        total_false, total_false / max_steps))
+        total_false, total_false / examples * 100))
     writer.add_summary(summary, last_step)
 
 
@@ -310,7 +363,7 @@ def run_experiment(loader,
 
     This is a general wrapper to load a saved model and run an experiment on it.
     An experiment can be a training experiment or an evaluation experiment.
-    It starts session, threads and queues and closes them before returning.
+    It starts a session and closes it before returning.
 
     Args:
       loader: A function of prototype (saver, session, load_dir) to load a saved
@@ -331,8 +384,6 @@ def run_experiment(loader,
     session.run(init_op)
     saver = tf.compat.v1.train.Saver(max_to_keep=1000)
     last_step = loader(saver, session, load_dir)
-    coord = tf.train.Coordinator()
-    threads = tf.compat.v1.train.start_queue_runners(sess=session, coord=coord)
     try:
         experiment(
             session=session,
@@ -348,9 +399,7 @@ def run_experiment(loader,
         print( excpt.message )
         tf.compat.v1.logging.info('Finished experiment.')
     finally:
-        coord.request_stop()
-    coord.join(threads)
-    session.close()
+        session.close()
 
 
 def train(hparams, summary_dir, num_gpus, model_type, max_steps,
@@ -392,6 +441,111 @@ def train(hparams, summary_dir, num_gpus, model_type, max_steps,
         writer.close()
 
 
+EvalResult = collections.namedtuple('EvalResult', ('correct', 'almost', 'examples'))
+
+
+def steps_per_run(num_batches, max_steps_per_run):
+    """Returns the largest number of batches up to max_steps_per_run that
+    divides num_batches, so that whole runs cover all the batches.
+    """
+    return max(steps for steps in range(1, max(1, min(num_batches, max_steps_per_run)) + 1)
+               if num_batches % steps == 0)
+
+
+def build_eval(model, features, num_gpus):
+    """Builds the inference only evaluation graph on num_gpus towers.
+
+    Every tower loops over the batches stacked in its features with a
+    tf.while_loop and accumulates the correct and almost correct predictions
+    on its device, so one session run scores all the stacked batches.
+
+    Args:
+      model: The inference only model to evaluate.
+      features: A list of dictionary of features with batches stacked along
+        the first axis, one per tower. The number of stacked batches may
+        change from run to run.
+      num_gpus: Number of gpus to be distributed on.
+
+    Returns:
+      An EvalResult of the summed correct and almost correct predictions of one
+      run and the number of examples it scores, the batches may be partial.
+    """
+    corrects = []
+    almosts = []
+    examples = []
+    for i in range(num_gpus):
+        feature = features[i]
+        stacked = {name: value for name, value in feature.items() if tf.is_tensor(value)}
+        steps = tf.shape(stacked['labels'])[0]
+
+        def body(step, correct, almost, count, feature=feature, stacked=stacked):
+            batch = dict(feature)
+            batch.update({name: value[step] for name, value in stacked.items()})
+            _, batch_correct, batch_almost = model.metrics(batch)
+            return (step + 1, correct + batch_correct, almost + batch_almost,
+                    count + tf.shape(batch['labels'])[0])
+
+        with variables.tower(i):
+            with tf.name_scope('tower_%d' % (i)):
+                _, correct, almost, count = tf.while_loop(
+                    lambda step, correct, almost, count: step < steps, body,
+                    [tf.constant(0), tf.constant(0.0), tf.constant(0.0), tf.constant(0)])
+        corrects.append(correct)
+        almosts.append(almost)
+        examples.append(count)
+
+    return EvalResult(tf.add_n(corrects), tf.add_n(almosts), tf.add_n(examples))
+
+
+def build_eval_runs(hparams, model, num_gpus, eval_size, data_dir, num_targets,
+                    dataset, validate):
+    """Builds the evaluation graphs scoring each of the eval_size first test
+    examples once.
+
+    The towers read every num_gpus-th example of the whole batches, in runs of
+    up to hparams.eval_steps_per_run batches. A single tower scores the
+    partial batch ending the split in one extra run of the same graph. With
+    several towers the examples left over, fewer than one batch over all of
+    them, are scored in one run of a graph of their own on the first tower.
+
+    Args:
+      hparams: The hyperparameters of the evaluation.
+      model: The inference only model to evaluate.
+      num_gpus: Number of gpus to be distributed on.
+      eval_size: Total number of examples in the test dataset.
+      data_dir: Directory containing the input data.
+      num_targets: Number of objects present in the image.
+      dataset: The name of the dataset for the experiment.
+      validate: If set, use validation set for continuous evaluation.
+
+    Returns:
+      The list of EvalResults of the graphs and the list of their numbers of
+      runs.
+    """
+    eval_batch_size = hparams.eval_batch_size or hparams.batch_size
+    tower_batch_size = eval_batch_size // num_gpus
+    num_batches = eval_size // (tower_batch_size * num_gpus)
+    steps = steps_per_run(num_batches, hparams.eval_steps_per_run)
+    ## the towers must all end their pass in the same run, only a single tower
+    ## reads the partial batch in its own stream.
+    whole = eval_size if num_gpus == 1 else num_batches * tower_batch_size * num_gpus
+
+    results = []
+    runs = []
+    if whole:
+        features = get_features('test', eval_batch_size, num_gpus, data_dir, num_targets,
+                                dataset, validate, steps=steps, examples=whole)
+        results.append(build_eval(model, features, num_gpus))
+        runs.append(num_batches // steps + (1 if whole % tower_batch_size else 0))
+    if whole < eval_size:
+        features = get_features('test', eval_size - whole, 1, data_dir, num_targets,
+                                dataset, validate, steps=1,
+                                examples=slice(whole, eval_size))
+        results.append(build_eval(model, features, 1))
+        runs.append(1)
+    return results, runs
+
+
 def find_checkpoint(load_dir, seen_step):
     """Finds the global step for the latest written checkpoint to the load_dir.
 
@@ -436,10 +590,9 @@ def evaluate(hparams, summary_dir, num_gpus, model_type, eval_size, data_dir,
     load_dir = summary_dir + '/train/' + "/" + hparams.model + "/"
     summary_dir += '/test/'
     with tf.Graph().as_default():
-        features = get_features('test', hparams.batch_size, num_gpus, data_dir, num_targets,
-                                dataset, validate)
-        model = models[model_type](hparams)
-        result, _ , _ = model.multi_gpu(features, num_gpus)
+        model = models[model_type](hparams, inference_only=True)
+        results, runs = build_eval_runs(hparams, model, num_gpus, eval_size, data_dir,
+                                        num_targets, dataset, validate)
         test_writer = tf.compat.v1.summary.FileWriter(summary_dir)
         seen_step = -1
         paused = 0
@@ -457,135 +610,130 @@ def evaluate(hparams, summary_dir, num_gpus, model_type, eval_size, data_dir,
                 paused = 0
                 seen_step = step
                 run_experiment(load_eval, last_checkpoint, test_writer, eval_experiment,
-                               result, eval_size // hparams.batch_size)
+                               results, runs)
                 if checkpoint:
                     break
 
         test_writer.close()
 
 
-def get_placeholder_data(num_steps, batch_size, features, session):
-    """Reads the features into a numpy array and replaces them with placeholders.
+def get_eval_data(split, batch_size, examples, data_dir, num_targets, dataset):
+    """Reads the first examples of a split once and serves them from memory.
 
-    Loads all the images and labels of the features queue in memory. Replaces
-    the feature queue reader handle with placeholders to switch input method from
-    queue to placeholders. Using placeholders gaurantees the order of datapoints
-    to stay exactly the same during each epoch.
+    The split is read through its input pipeline, in a graph of its own, the
+    first time it is asked for and then kept in memory, and on disk if
+    --eval_cache is set. The returned features iterate over the same batches
+    in the same order after every checkpoint restore, the last one partial
+    unless batch_size divides examples.
 
     Args:
-      num_steps: The number of times to read from the features queue.
+      split: 'train' or 'test', split of the data to read.
       batch_size: The number of datapoints at each step.
-      features: The dictionary containing the data queues such as images.
-      session: The session handle to use for running tensors.
+      examples: The number of examples to read.
+      data_dir: Directory containing the input data.
+      num_targets: Number of objects present in the image.
+      dataset: The name of the dataset for the experiment.
 
     Returns:
-      data: List of numpy arrays containing all the queued data in features.
-      targets: List of all the labels in range [0...num_classes].
+      features: The dictionary of the input tensors such as images.
+      initialize: Function of a session, to run before reading the features.
+      targets: Array of the labels of the examples in range [0...num_classes].
     """
-    image_size = features['height']
-    depth = features['depth']
-    num_classes = features['num_classes']
-    data = []
-    targets = []
-    for i in range(num_steps):
-        data.append(
-            session.run({
-                'recons_label': features['recons_label'],
-                'labels': features['labels'],
-                'images': features['images'],
-                'recons_image': features['recons_image']
-            }))
-        targets.append(data[i]['recons_label'])
-    image_shape = (batch_size, image_size, image_size, depth)
-    features['images'] = tf.compat.v1.placeholder(tf.float32, shape=image_shape)
-    features['labels'] = tf.compat.v1.placeholder(
-        tf.float32, shape=(batch_size, num_classes))
-    features['recons_image'] = tf.compat.v1.placeholder(tf.float32, shape=image_shape)
-    features['recons_label'] = tf.compat.v1.placeholder(tf.int32, shape=batch_size)
-    return data, targets
-
-
-def infer_ensemble_logits(features, model, checkpoints, session, num_steps,
-                          data):
-    """Extracts the logits for the whole dataset and all the trained models.
-
-    Loads all the checkpoints. For each checkpoint stores the logits for the whole
-    dataset.
+    def read():
+        with tf.Graph().as_default():
+            features = get_features(split, batch_size, 1, data_dir, num_targets,
+                                    dataset, examples=examples)[0]
+            with tf.compat.v1.Session() as session:
+                return eval_cache.materialize(
+                    features, (examples + batch_size - 1) // batch_size, session)
+
+    name = eval_cache.key(dataset, split, examples=examples,
+                          num_targets=num_targets, memmap=GLOBAL_HPAR.memmap)
+    arrays, static = eval_cache.get(name, read, GLOBAL_HPAR.eval_cache)
+
+    features, initialize = eval_cache.features(arrays, static, batch_size)
+    return features, initialize, arrays['recons_label']
+
+
+def infer_ensemble_logits(features, build, checkpoints, session, num_steps):
+    """Extracts the summed logits of all the trained models for the whole dataset.
+
+    Imports one copy of the inference graph per checkpoint, all of them reading
+    the same features, loads every checkpoint into its copy and computes the
+    summed logits of the whole ensemble in a single pass over the dataset.
 
     Args:
       features: The dictionary of the input handles.
-      model: The model operation graph.
+      build: Function from the features to the logits of a model.
       checkpoints: The list of all checkpoint paths.
       session: The session handle to use for running tensors.
       num_steps: The number of steps to run the experiment.
-      data: The num_steps list of loaded data to be fed to placeholders.
 
     Returns:
-      logits: List of all the final layer logits for different checkpoints.
+      logits: List of the summed final layer logits of every step, the last
+        batch may be partial.
     """
-    _, inferred, _ = model.multi_gpu([features], 1)
+    ensemble = Ensemble(build, features, checkpoints)
+    ensemble.load(session)
     logits = []
-    saver = tf.compat.v1.train.Saver()
-    for checkpoint in checkpoints:
-        saver.restore(session, checkpoint)
-        for i in range(num_steps):
-            logits.append(
-                session.run(
-                    inferred[0].logits,
-                    feed_dict={
-                        features['recons_label']: data[i]['recons_label'],
-                        features['labels']: data[i]['labels'],
-                        features['images']: data[i]['images'],
-                        features['recons_image']: data[i]['recons_image']
-                    }))
+    for _ in range(num_steps):
+        logits.append(session.run(ensemble.logits))
     return logits
 
 
 def infer_ensemble_accuracy(features, model, checkpoints, session, num_steps,
-                          data):
-    """Extracts the logits for the whole dataset and all the trained models.
+                            table=None):
+    """Counts the correct predictions on the whole dataset of all the trained models.
 
-    Loads all the checkpoints. For each checkpoint stores the logits for the whole
-    dataset.
+    Sweeps the checkpoints in order, restoring only the variables the
+    predictions depend on and that changed since the previous checkpoint,
+    while the next checkpoint is read in the background.
 
     Args:
       features: The dictionary of the input handles.
       model: The model operation graph.
-      checkpoints: The list of all checkpoint paths.
+      checkpoints: The list of all (step, checkpoint path) pairs.
       session: The session handle to use for running tensors.
       num_steps: The number of steps to run the experiment.
-      data: The num_steps list of loaded data to be fed to placeholders.
+      table: (optional) Path of a csv file receiving one row per checkpoint with
+        the step, the correct predictions, the accuracy, the number of restored
+        variables and the seconds spent.
 
     Returns:
-      logits: List of all the final layer logits for different checkpoints.
+      corrects: List of the number of correct predictions of every checkpoint.
     """
     _, inferred, correct = model.multi_gpu([features], 1)
-    corrects = []
-    saver = tf.compat.v1.train.Saver()
-    for checkpoint_info in checkpoints:
+    examples = tf.shape(features['recons_label'])[0]
+    sweep = CheckpointSweep(variables.variables_of(correct[0]))
+    steps = dict((checkpoint, step) for step, checkpoint in checkpoints)
 
-        step, checkpoint = checkpoint_info
-        saver.restore(session, checkpoint)
+    corrects = []
+    rows = []
+    start = time.time()
+    for checkpoint, restored in sweep.restore_each(session, [path for _, path in checkpoints]):
+        step = steps[checkpoint]
         corrects_checkpoint = []
-        for i in range(num_steps):
-            corrects_checkpoint.append(
-                session.run(
-                    correct[0],
-                    feed_dict={
-                        features['recons_label']: data[i]['recons_label'],
-                        features['labels']: data[i]['labels'],
-                        features['images']: data[i]['images'],
-                        features['recons_image']: data[i]['recons_image']
-                    }))
+        examples_checkpoint = 0
+        for _ in range(num_steps):
+            batch_correct, batch_examples = session.run([correct[0], examples])
+            corrects_checkpoint.append(batch_correct)
+            examples_checkpoint += batch_examples
 
         model_corrects = np.sum(corrects_checkpoint)
 
         corrects.append(
             model_corrects
         )
+        rows.append((step, model_corrects, model_corrects / examples_checkpoint,
+                     restored, time.time() - start))
+        start = time.time()
 
         wandb.log({"step": step, "corrects": model_corrects})
 
+    if table:
+        np.savetxt(table, np.array(rows), fmt=['%d', '%d', '%.6f', '%d', '%.3f'], delimiter=',',
+                   header='step,corrects,accuracy,restored,seconds', comments='')
+
     return corrects
 
 
@@ -622,26 +770,23 @@ def evaluate_ensemble(hparams, model_type, eval_size, data_dir, num_targets,
             checkpoints.append(GLOBAL_HPAR.summary_dir + "/train/" + hparams.model + "/" + file_name)
 
     with tf.Graph().as_default():
-        features = get_features('test', hparams.batch_size, 1, data_dir, num_targets,
-                                dataset)[0]
-        model = models[model_type](hparams)
+        eval_batch_size = hparams.eval_batch_size or hparams.batch_size
+        num_steps = (eval_size + eval_batch_size - 1) // eval_batch_size
+        features, initialize, targets = get_eval_data('test', eval_batch_size, eval_size,
+                                                      data_dir, num_targets, dataset)
+
+        def build(member_features):
+            return models[model_type](hparams, inference_only=True).inference(member_features).logits
 
         session = tf.compat.v1.Session(config=tf.compat.v1.ConfigProto(allow_soft_placement=True))
-        coord = tf.train.Coordinator()
-        threads = tf.compat.v1.train.start_queue_runners(sess=session, coord=coord)
-        num_steps = eval_size // hparams.batch_size
-        data, targets = get_placeholder_data(num_steps, hparams.batch_size, features,
-                                             session)
-
-        logits = infer_ensemble_logits(features, model, checkpoints, session,
-                                       num_steps, data)
-        coord.request_stop()
-        coord.join(threads)
+        initialize(session)
+
+        logits = infer_ensemble_logits(features, build, checkpoints, session,
+                                       num_steps)
         session.close()
 
-        logits = np.reshape(logits, (num_trials, num_steps, hparams.batch_size, -1))
-        logits = np.sum(logits, axis=0)
-        predictions = np.argmax(logits, axis=2)
+        logits = np.concatenate(logits)
+        predictions = np.argmax(logits, axis=1)
         total_wrong = np.sum(np.not_equal(predictions, targets))
         print('Total wrong predictions: {}, wrong percent: {}%'.format(
             total_wrong, total_wrong / eval_size * 100))
@@ -677,31 +822,30 @@ def evaluate_history(hparams, model_type, eval_size, data_dir, num_targets,
     checkpointsname = list(set(checkpointsname))
     checkpointsname.sort()
 
+    ## one listing of the directory instead of probing every checkpoint.
+    load_dir = GLOBAL_HPAR.summary_dir + "/train/" + hparams.model + "/"
+    written = set(extract_step(path[:-len(".index")])
+                  for path in tf.io.gfile.glob(load_dir + "model.ckpt-*.index"))
+
     checkpoints = []
     for model_number in checkpointsname:
-        fname = GLOBAL_HPAR.summary_dir \
-                + "/train/" + hparams.model + \
-                "/" + "model.ckpt-" + str(model_number)
-
-        if tf.compat.v1.train.checkpoint_exists(fname):
-            checkpoints.append((model_number,fname))
+        if model_number in written:
+            checkpoints.append((model_number, load_dir + "model.ckpt-" + str(model_number)))
 
     with tf.Graph().as_default():
-        features = get_features(dataset_type, hparams.batch_size, 1, data_dir, num_targets,
-                                dataset)[0]
-        model = models[model_type](hparams)
+        eval_batch_size = hparams.eval_batch_size or hparams.batch_size
+        num_steps = (eval_size + eval_batch_size - 1) // eval_batch_size
+        features, initialize, _ = get_eval_data(dataset_type, eval_batch_size, eval_size,
+                                                data_dir, num_targets, dataset)
+        model = models[model_type](hparams, inference_only=True)
 
         session = tf.compat.v1.Session(config=tf.compat.v1.ConfigProto(allow_soft_placement=True))
-        coord = tf.train.Coordinator()
-        threads = tf.compat.v1.train.start_queue_runners(sess=session, coord=coord)
-        num_steps = eval_size // hparams.batch_size
-        data, targets = get_placeholder_data(num_steps, hparams.batch_size, features,
-                                             session)
+        initialize(session)
 
+        table_dir = GLOBAL_HPAR.summary_dir + "/test/" + hparams.model + "/"
+        tf.io.gfile.makedirs(table_dir)
         corrects = infer_ensemble_accuracy(features, model, checkpoints, session,
-                                       num_steps, data)
-        coord.request_stop()
-        coord.join(threads)
+                                           num_steps, table_dir + "history_" + dataset_type + ".csv")
         session.close()
 
         #corrects_acc = corrects / eval_size * 100
@@ -710,6 +854,66 @@ def evaluate_history(hparams, model_type, eval_size, data_dir, num_targets,
         #    print(corrects_acc[i])
 
 
+def export_model(hparams, summary_dir, model_type, num_targets, dataset,
+                 checkpoint, export_dir):
+    """Exports a trained model as a frozen, constant folded SavedModel.
+
+    Builds the inference only graph with the routing iterations unrolled to
+    their design count, restores the checkpoint and writes a SavedModel whose
+    serving signature maps a batch of images, of any size, to the logits, the
+    predicted classes and the fixed routing iterations.
+
+    Args:
+      hparams: The hyperparameters for building the model graph.
+      summary_dir: The directory to load the training model from.
+      model_type: The model architecture category.
+      num_targets: Number of objects present in the image.
+      dataset: The name of the dataset for the experiment.
+      checkpoint: (optional) The checkpoint file name, the latest by default.
+      export_dir: The directory of the SavedModel, must not exist.
+    """
+    load_dir = summary_dir + '/train/' + hparams.model + '/'
+    checkpoint = checkpoint or tf.train.latest_checkpoint(load_dir)
+
+    features = dict(SERVING_FEATURES[dataset])
+    if dataset == 'mnist' and num_targets == 2:
+        features['height'] = features['width'] = 36
+    features['num_targets'] = num_targets
+
+    routers = []
+    if model_type != "ConvNet":
+        routers = [layer.routing for layer in hparams.layers] + [hparams.last_layer["routing"]]
+    for router in routers:
+        router.unrolled_iterations()
+
+    if dataset in CHANNELS_FIRST:
+        image_shape = [features['depth'], features['height'], features['width']]
+    else:
+        image_shape = [features['height'], features['width'], features['depth']]
+
+    with tf.Graph().as_default():
+        images = tf.compat.v1.placeholder(tf.float32, [None] + image_shape, name="images")
+        features['images'] = images
+        logits = tf.cast(
+            models[model_type](hparams, inference_only=True).inference(features).logits,
+            tf.float32)
+        outputs = {
+            "logits": logits,
+            "classes": tf.argmax(logits, axis=1, name="classes"),
+            "routing_iterations": tf.constant(
+                [router.iteration_count for router in routers], tf.int32,
+                name="routing_iterations"),
+        }
+
+        saver = tf.compat.v1.train.Saver(variables.variables_of(logits))
+        with tf.compat.v1.Session(config=tf.compat.v1.ConfigProto(allow_soft_placement=True)) as session:
+            load_eval(saver, session, checkpoint)
+            frozen, folded = export.export(session, export_dir, {"images": images}, outputs)
+
+    print('exported {} to {}, {} nodes folded to {}'.format(
+        checkpoint, export_dir, frozen, folded))
+
+
 def main(_):
 
     global GLOBAL_HPAR
@@ -717,6 +921,10 @@ def main(_):
     if GLOBAL_HPAR.summary_dir == "" :
         GLOBAL_HPAR.summary_dir = wandb.run.dir
 
+    ## the layers read the precision policy when they are built.
+    variables.set_precision(GLOBAL_HPAR.precision)
+    variables.set_placement(GLOBAL_HPAR.placement)
+
     if GLOBAL_HPAR.model == "CapsuleBlockNet":
         GLOBAL_HPAR = BlockNet.setup(GLOBAL_HPAR)
 
@@ -750,7 +958,11 @@ def main(_):
 
     print("Hyper Parameters")
     print(GLOBAL_HPAR)
-    if GLOBAL_HPAR.train:
+    if GLOBAL_HPAR.export_dir:
+        export_model(GLOBAL_HPAR, GLOBAL_HPAR.summary_dir, GLOBAL_HPAR.model,
+                     GLOBAL_HPAR.num_targets, GLOBAL_HPAR.dataset, GLOBAL_HPAR.checkpoint,
+                     GLOBAL_HPAR.export_dir)
+    elif GLOBAL_HPAR.train:
         wandb.init(project="Gulbenkian", name=GLOBAL_HPAR.model + "/train_experiment", sync_tensorboard=True, dir=".")
         train(GLOBAL_HPAR, GLOBAL_HPAR.summary_dir, GLOBAL_HPAR.num_gpus, GLOBAL_HPAR.model,
               GLOBAL_HPAR.max_steps, GLOBAL_HPAR.data_dir, GLOBAL_HPAR.num_targets,
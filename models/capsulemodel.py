@@ -7,6 +7,7 @@ import tensorflow as tf
 
 from .core import layer
 from .core import model
+from .core import variables
 from .layers.capsule import CapsuleClassLayer, PrimaryCapsuleLayer, FullyConnectedCapsuleLayer
 
 
@@ -15,12 +16,14 @@ class CapsuleModel(model.Model):
         A baseline Capsule multi GPU.
     """
 
-    def __init__(self, hparams, name = "CapsuleModel"):
+    def __init__(self, hparams, name = "CapsuleModel", inference_only=False):
         self._pose_cache = []
+        self._primary = None
 
         super(CapsuleModel, self).__init__(
             name,
-            hparams)
+            hparams,
+            inference_only=inference_only)
 
     def _summarize_remakes(self, features, remakes):
         """Adds an image summary consisting original, target and remake images.
@@ -119,7 +122,7 @@ class CapsuleModel(model.Model):
         else:
             image_4d = image
 
-        lower_features = image_4d
+        lower_features = tf.cast(image_4d, variables.compute_dtype())
 
         with tf.name_scope("derender/"):
             for i in range(len(self._hparams.derender_layers)):
@@ -132,16 +135,21 @@ class CapsuleModel(model.Model):
         with tf.name_scope("bn/"):
             lower_features = tf.compat.v1.layers.BatchNormalization(
                 center=self._hparams.bn_train,
-                trainable=self._hparams.bn_train)(
+                trainable=self._hparams.bn_train,
+                dtype=variables.policy())(
                     lower_features,
                     training=self._hparams.bn_train)
 
         with tf.name_scope("primarycapsules/"):
-            primary_poses, primary_activations = PrimaryCapsuleLayer(
-                self._hparams.primary_parameters["pose_dim"],
-                self._hparams.primary_parameters["ksize"],
-                self._hparams.primary_parameters["groups"],
-            ).inference(lower_features)
+            ## shared by the towers.
+            if self._primary is None:
+                self._primary = PrimaryCapsuleLayer(
+                    self._hparams.primary_parameters["pose_dim"],
+                    self._hparams.primary_parameters["ksize"],
+                    self._hparams.primary_parameters["groups"],
+                )
+
+            primary_poses, primary_activations = self._primary.inference(lower_features)
 
         lower_poses, lower_activations = primary_poses, primary_activations
 
@@ -169,12 +177,13 @@ class CapsuleModel(model.Model):
                 name=self.name + "Caps/"
             ).inference((fully_poses, fully_activations))
 
-        if self._hparams.remake:
+        ## the reconstructions only feed the loss and the summaries.
+        if self._hparams.remake and not self.inference_only:
             final_shape = final_poses.shape.as_list()
             remake = self._remake(
                 features,
                 tf.reshape(
-                    final_poses,
+                    tf.cast(final_poses, tf.float32),
                     [-1, final_shape[1], np.prod(final_shape[2:])]
                 )
             )
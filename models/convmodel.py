@@ -11,7 +11,7 @@ from __future__ import print_function
 import tensorflow as tf
 
 from .core import variables
-from .core.model import Model
+from .core.model import Inferred, Model
 
 
 class ConvModel(Model):
@@ -21,11 +21,12 @@ class ConvModel(Model):
     layers. The last layer is linear and has 10 units.
     """
 
-    def __init__(self, hparams, verbose=False, name="Convmodel"):
+    def __init__(self, hparams, verbose=False, name="Convmodel", inference_only=False):
 
         super(ConvModel, self).__init__(
             name=name,
-            hparams=hparams)
+            hparams=hparams,
+            inference_only=inference_only)
         self.verbose = verbose
 
     def _add_convs(self, input_tensor, channels):
@@ -58,7 +59,7 @@ class ConvModel(Model):
                 pre_activation = tf.nn.bias_add(
                     conv, biases, data_format='NHWC')
                 relu = tf.nn.relu(pre_activation, name=scope.name)
-                if self._hparams.verbose:
+                if self._hparams.verbose and not self.inference_only:
                     tf.summary.histogram('activation', relu)
                 input_tensor = tf.compat.v1.keras.layers.MaxPool2D(
                      pool_size=(2, 2), strides=(2, 2), data_format='channels_last', padding='same')(relu)
@@ -106,4 +107,4 @@ class ConvModel(Model):
                                              verbose=self._hparams.verbose)
             logits = tf.matmul(hidden2, weights) + biases
 
-        return logits, None
+        return Inferred(logits, None)
@@ -0,0 +1,98 @@
+"""Runs an ensemble of checkpoints of one model in a single forward pass.
+
+The inference graph is built once in a graph of its own and imported once
+per member, every copy with its own variables and all of them reading the
+same input tensors. Each member is loaded from its checkpoint and a single
+session run computes the summed logits of the whole ensemble.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+
+from . import variables
+
+
+def _unshared(graph_def, prefix):
+    ## resource variables are looked up by their shared name, which the import
+    ## keeps, every member needs its own.
+    member_def = tf.compat.v1.GraphDef()
+    member_def.CopyFrom(graph_def)
+    for node in member_def.node:
+        if node.op in variables.VARIABLE_OPS and node.attr["shared_name"].s:
+            node.attr["shared_name"].s = (prefix + "/").encode() + node.attr["shared_name"].s
+    return member_def
+
+
+class Ensemble(object):
+
+    def __init__(self, build, features, checkpoints):
+        """Adds the members to the default graph.
+
+        Args:
+          build: Function from a features dictionary to the logits tensor of
+            the model, called once in a separate graph.
+          features: Dictionary of batched feature tensors and static values
+            shared by the members.
+          checkpoints: The checkpoint paths of the members.
+        """
+        self._checkpoints = list(checkpoints)
+
+        tensors = {name: value for name, value in features.items() if tf.is_tensor(value)}
+
+        with tf.Graph().as_default() as graph:
+            placeholders = {
+                name: tf.compat.v1.placeholder(tensor.dtype, tensor.shape, name="input_" + name)
+                for name, tensor in tensors.items()
+            }
+            inputs = dict(features)
+            inputs.update(placeholders)
+            logits = build(inputs)
+            ## the variables are restored by their checkpoint keys, the names
+            ## tf.compat.v1.train.Saver writes.
+            keys = [var.op.name for var in variables.variables_of(logits)]
+            graph_def = tf.compat.v1.graph_util.extract_sub_graph(
+                graph.as_graph_def(), [logits.op.name])
+
+        ## inputs the logits do not depend on are not in the subgraph.
+        used = {node.name for node in graph_def.node}
+        input_map = {
+            placeholder.name: tensors[name] for name, placeholder in placeholders.items()
+            if placeholder.op.name in used
+        }
+
+        member_logits = []
+        self._assigns = []
+        for i in range(len(self._checkpoints)):
+            prefix = "member_%d" % i
+            outputs = tf.compat.v1.import_graph_def(
+                _unshared(graph_def, prefix),
+                input_map=input_map,
+                return_elements=[logits.name] + [key + ":0" for key in keys],
+                name=prefix)
+            member_logits.append(tf.cast(outputs[0], tf.float32))
+
+            assigns = {}
+            for key, var in zip(keys, outputs[1:]):
+                if var.dtype == tf.resource:
+                    dtype = var.op.get_attr("dtype")
+                    value = tf.compat.v1.placeholder(dtype, var.op.get_attr("shape"))
+                    assign = tf.raw_ops.AssignVariableOp(resource=var, value=value)
+                else:
+                    value = tf.compat.v1.placeholder(var.dtype.base_dtype, var.shape)
+                    assign = tf.compat.v1.assign(var, value)
+                assigns[key] = (value, assign)
+            self._assigns.append(assigns)
+
+        ## summed over the members like the predictions of the ensemble.
+        self.logits = tf.add_n(member_logits)
+
+    def load(self, session):
+        """Loads the checkpoint of every member."""
+        for checkpoint, assigns in zip(self._checkpoints, self._assigns):
+            reader = tf.train.load_checkpoint(checkpoint)
+            session.run(
+                [assign for _, assign in assigns.values()],
+                feed_dict={value: reader.get_tensor(key) for key, (value, _) in assigns.items()})
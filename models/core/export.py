@@ -0,0 +1,124 @@
+"""Exports the inference graph of a trained model as a frozen SavedModel.
+
+The variables restored in the session are replaced by constants and the
+routing iteration counts, fed through placeholders with a default when the
+routing runs symbolic iterations, are fixed to their default. The subgraphs
+that only depend on constants, such as the coordinate factors, the
+normalised transform weights and the absolute values of the routing
+parameters, are then folded by grappler. The SavedModel holds no variables
+and no python code, loading it does not rebuild the architecture.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+from tensorflow.python.grappler import tf_optimizer
+
+SIGNATURE = tf.compat.v1.saved_model.DEFAULT_SERVING_SIGNATURE_DEF_KEY
+
+_OPTIMIZERS = ("constfold", "arithmetic", "dependency", "constfold")
+
+
+def _names(tensors):
+    return [tensor.op.name for tensor in tensors.values()]
+
+
+def freeze(session, outputs):
+    """Returns the graph def computing the outputs with the variables as constants.
+
+    Args:
+      session: The session holding the restored variables.
+      outputs: Dictionary of the output tensors.
+    """
+    graph_def = tf.compat.v1.graph_util.convert_variables_to_constants(
+        session, session.graph.as_graph_def(), _names(outputs))
+
+    for node in graph_def.node:
+        ## the loader places the serving graph.
+        node.device = ""
+        if node.op == "PlaceholderWithDefault":
+            ## an identity of the default, the value is no longer feedable.
+            node.op = "Identity"
+            node.attr["T"].CopyFrom(node.attr["dtype"])
+            del node.attr["dtype"]
+            del node.attr["shape"]
+    return graph_def
+
+
+def fold(graph_def, outputs):
+    """Folds the constant subgraphs of a frozen graph def with grappler.
+
+    Args:
+      graph_def: The frozen graph def.
+      outputs: Dictionary of the output tensors, kept by the rewrite.
+    """
+    with tf.Graph().as_default() as graph:
+        tf.compat.v1.import_graph_def(graph_def, name="")
+        ## grappler keeps the nodes of the train_op collection.
+        for name in _names(outputs):
+            graph.add_to_collection("train_op", graph.get_operation_by_name(name))
+        meta_graph = tf.compat.v1.train.export_meta_graph(graph=graph)
+
+    config = tf.compat.v1.ConfigProto()
+    rewrite = config.graph_options.rewrite_options
+    rewrite.optimizers.extend(_OPTIMIZERS)
+    return tf_optimizer.OptimizeGraph(config, meta_graph)
+
+
+def save(export_dir, graph_def, inputs, outputs):
+    """Writes a graph def as a SavedModel with a single serving signature.
+
+    Args:
+      export_dir: The directory of the SavedModel, must not exist.
+      graph_def: The graph def to save.
+      inputs: Dictionary of the input tensors, by signature key.
+      outputs: Dictionary of the output tensors, by signature key.
+    """
+    with tf.Graph().as_default() as graph:
+        tf.compat.v1.import_graph_def(graph_def, name="")
+        signature = tf.compat.v1.saved_model.predict_signature_def(
+            inputs={key: graph.get_tensor_by_name(tensor.name) for key, tensor in inputs.items()},
+            outputs={key: graph.get_tensor_by_name(tensor.name) for key, tensor in outputs.items()})
+
+        builder = tf.compat.v1.saved_model.Builder(export_dir)
+        with tf.compat.v1.Session(graph=graph) as session:
+            builder.add_meta_graph_and_variables(
+                session, [tf.saved_model.SERVING],
+                signature_def_map={SIGNATURE: signature},
+                strip_default_attrs=True)
+        builder.save()
+
+
+def export(session, export_dir, inputs, outputs):
+    """Freezes, folds and saves the inference graph of the session.
+
+    Args:
+      session: The session holding the restored variables.
+      export_dir: The directory of the SavedModel, must not exist.
+      inputs: Dictionary of the input placeholders, by signature key.
+      outputs: Dictionary of the output tensors, by signature key.
+
+    Returns:
+      The number of nodes of the frozen and of the folded graph.
+    """
+    frozen = freeze(session, outputs)
+    folded = fold(frozen, outputs)
+    save(export_dir, folded, inputs, outputs)
+    return len(frozen.node), len(folded.node)
+
+
+def load(session, export_dir):
+    """Loads an exported SavedModel into the graph of the session.
+
+    Returns:
+      The dictionaries of the input and of the output tensors of the signature.
+    """
+    meta_graph = tf.compat.v1.saved_model.loader.load(
+        session, [tf.saved_model.SERVING], export_dir)
+    signature = meta_graph.signature_def[SIGNATURE]
+    graph = session.graph
+    inputs = {key: graph.get_tensor_by_name(info.name) for key, info in signature.inputs.items()}
+    outputs = {key: graph.get_tensor_by_name(info.name) for key, info in signature.outputs.items()}
+    return inputs, outputs
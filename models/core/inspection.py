@@ -0,0 +1,71 @@
+"""Keeps the intermediate tensors of routing procedures for inspection.
+
+Routing procedures report their votes, poses and coefficients at every
+iteration. Depending on the level nothing is kept (off), only scalar
+statistics of the coefficients are kept (summary) or the full tensors are
+kept (full). Records of the last `steps` fits are kept in a ring buffer.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+
+import tensorflow as tf
+
+OFF = "off"
+SUMMARY = "summary"
+FULL = "full"
+
+
+class Inspection(object):
+
+    def __init__(
+            self,
+            level=OFF,
+            steps=1,
+            epsilon=1e-9):
+
+        assert level in (OFF, SUMMARY, FULL), \
+            " level must be off, summary or full. "
+
+        assert steps > 0, \
+            " at least one step must be kept. "
+
+        self.level = level
+        self._epsilon = epsilon
+        self._records = collections.deque(maxlen=steps)
+
+    def step(self):
+        ## starts the record of a new fit, dropping the oldest one when full.
+        if self.level != OFF:
+            self._records.append({})
+
+    def tensor(self, key, value):
+        if self.level == FULL:
+            self._records[-1][key] = value
+
+    def coefficients(self, key, c):
+        ## c :: { batch, output_atoms, new_w , new_h, depth * np.prod(ksizes) }
+        if self.level == FULL:
+            self._records[-1][key] = c
+
+        elif self.level == SUMMARY:
+            entropy = -tf.reduce_sum(c * tf.math.log(c + self._epsilon), axis=4)
+
+            self._records[-1][key] = {
+                "mean": tf.reduce_mean(c),
+                "entropy": tf.reduce_mean(entropy),
+                "max": tf.reduce_max(c),
+            }
+
+    @property
+    def last(self):
+        if self._records:
+            return self._records[-1]
+        return {}
+
+    @property
+    def history(self):
+        return list(self._records)
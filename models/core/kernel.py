@@ -23,6 +23,7 @@ class Kernel(object):
     @abc.abstractmethod
     def apply(self, a, b):
         ## a,b :: { batch, output_atoms, new_w, new_h, depth * np.prod(ksizes) } + repdim
+        ## a may also be { batch, output_atoms, new_w, new_h, 1 } + repdim and must broadcast.
         raise NotImplementedError('Not implemented')
 
     def take(self, a, b):
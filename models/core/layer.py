@@ -99,24 +99,40 @@ def evaluate(logits, labels, num_targets, scope, loss_type, reg_const=0.0, remak
 
     with tf.name_scope('accuracy'):
         with tf.name_scope('correct_prediction'):
-            _, targets = tf.nn.top_k(labels, k=num_targets)
-            _, predictions = tf.nn.top_k(logits, k=num_targets)
-            missed_targets = tf.compat.v1.sets.difference(
-                targets, predictions)
-            num_missed_targets = tf.compat.v1.sets.set_size(missed_targets)
-            correct = tf.equal(num_missed_targets, 0)
-            almost_correct = tf.less(num_missed_targets, num_targets)
+            correct, almost_correct = accuracy(logits, labels, num_targets)
             correct_sum = tf.reduce_sum(tf.cast(correct, tf.float32))
             almost_correct_sum = tf.reduce_sum(
                 tf.cast(almost_correct, tf.float32))
         with tf.name_scope('accuracy'):
-            accuracy = tf.reduce_mean(tf.cast(correct, tf.float32))
-    tf.compat.v1.summary.scalar('accuracy', accuracy)
+            batch_accuracy = tf.reduce_mean(tf.cast(correct, tf.float32))
+    tf.compat.v1.summary.scalar('accuracy', batch_accuracy)
     tf.compat.v1.summary.scalar('correct_prediction_batch', correct_sum)
     tf.compat.v1.summary.scalar('almost_correct_batch', almost_correct_sum)
     return total_loss, correct_sum, almost_correct_sum
 
 
+def accuracy(logits, labels, num_targets):
+    """Compares the top predictions with the targets of every example.
+
+    Args:
+      logits: tensor, output of the model.
+      labels: tensor, ground truth of the data.
+      num_targets: scalar, number of present objects in the image.
+
+    Returns:
+      Two boolean tensors of shape [batch], set where all the targets are
+      predicted and where at least one of them is.
+    """
+    _, targets = tf.nn.top_k(labels, k=num_targets)
+    _, predictions = tf.nn.top_k(logits, k=num_targets)
+    missed_targets = tf.compat.v1.sets.difference(
+        targets, predictions)
+    num_missed_targets = tf.compat.v1.sets.set_size(missed_targets)
+    correct = tf.equal(num_missed_targets, 0)
+    almost_correct = tf.less(num_missed_targets, num_targets)
+    return correct, almost_correct
+
+
 def reconstruction(capsule_mask, num_atoms, capsule_embedding, layer_sizes,
                    num_pixels, reuse, image, balance_factor):
     """Adds the reconstruction loss and calculates the reconstructed image.
@@ -172,7 +188,8 @@ def reconstruction(capsule_mask, num_atoms, capsule_embedding, layer_sizes,
             bias_initializer=tf.compat.v1.keras.initializers.constant(0.1)
         )
     )
-    reconstruction_2d = model(filtered_embedding_2d)
+    ## the dense layers follow the global precision policy, the loss does not.
+    reconstruction_2d = tf.cast(model(filtered_embedding_2d), tf.float32)
 
     with tf.name_scope('loss') as scope:
         image_2d = tf.compat.v1.layers.Flatten()(image)
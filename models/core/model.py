@@ -21,6 +21,7 @@ import collections
 import tensorflow as tf
 
 from . import layer
+from . import variables
 
 TowerResult = collections.namedtuple('TowerResult', ('inferred', 'almost',
                                                      'correct', 'grads'))
@@ -34,20 +35,26 @@ class Model(object):
     """Base class for building a model and running inference on it."""
     __metaclass__ = abc.ABCMeta
 
-    def __init__(self, name, hparams):
+    def __init__(self, name, hparams, inference_only=False):
         """Initializes the model parameters.
 
     Args:
       hparams: The hyperparameters for the model as tf.contrib.training.HParams.
+      inference_only: If set the model only builds the forward ops and the
+        accuracy metrics, without losses, optimizer, gradients or summaries.
     """
         self.name = hparams.model + name
         self._hparams = hparams
-        with tf.device('/cpu:0'):
+        self.inference_only = inference_only
+        with variables.placed():
             self._global_step = tf.compat.v1.get_variable(
                 'global_step', [],
                 initializer=tf.compat.v1.constant_initializer(0),
                 trainable=False)
 
+            if inference_only:
+                return
+
             step = (self._global_step / hparams.max_steps)
 
             init_fact = tf.minimum( 10 * tf.sigmoid(-2 * (self._global_step / 2000) ) + 0.1, 1 )
@@ -69,6 +76,19 @@ class Model(object):
 
             self._optimizer = tf.compat.v1.train.AdamOptimizer(learning_rate=lr, epsilon=1e-9, )
 
+            ## float16 gradients underflow, the loss is scaled up by a factor
+            ## that halves on overflow and doubles after enough finite steps.
+            self._loss_scale = None
+            if variables.compute_dtype() == tf.float16:
+                self._loss_scale = tf.compat.v1.get_variable(
+                    'loss_scale', [],
+                    initializer=tf.compat.v1.constant_initializer(2 ** 15),
+                    trainable=False)
+                self._finite_steps = tf.compat.v1.get_variable(
+                    'loss_scale_finite_steps', [],
+                    initializer=tf.compat.v1.constant_initializer(0),
+                    trainable=False)
+
     def inference(self, features):
 
         with tf.compat.v1.variable_scope('Capsule/' + self.name, reuse=tf.compat.v1.AUTO_REUSE):
@@ -76,6 +96,23 @@ class Model(object):
 
             return Inferred(final_activations, remake)
 
+    def metrics(self, features):
+        """Adds the forward ops and the accuracy metrics of one batch.
+
+    Args:
+      features: Dictionary of batched features like images and labels.
+    Returns:
+      The Inferred outputs, the number of correct predictions and the number of
+      cases where at least one of the targets is correctly predicted.
+    """
+        inferred = self.inference(features)
+        with tf.name_scope('accuracy'):
+            correct, almost = layer.accuracy(
+                tf.cast(inferred.logits, tf.float32), features['labels'], features['num_targets'])
+            correct = tf.reduce_sum(tf.cast(correct, tf.float32))
+            almost = tf.reduce_sum(tf.cast(almost, tf.float32))
+        return inferred, correct, almost
+
     @abc.abstractmethod
     def apply(self, features):
         """Adds the inference graph ops.
@@ -105,13 +142,19 @@ class Model(object):
       feature: Dictionary of batched features like images and labels.
     Returns:
       A namedtuple TowerResult containing the inferred values like logits and
-      reconstructions, gradients and evaluation metrics.
+      reconstructions, gradients and evaluation metrics. In inference only
+      mode there are no gradients.
     """
-        with tf.device('/gpu:%d' % tower_ind):## gpu
+        with variables.tower(tower_ind):
             with tf.name_scope('tower_%d' % (tower_ind)) as scope:
+                if self.inference_only:
+                    inferred, correct, almost = self.metrics(feature)
+                    return TowerResult(inferred, almost, correct, None)
+
                 inferred = self.inference(feature)
+                ## losses are computed in float32 whatever the compute dtype.
                 losses, correct, almost = layer.evaluate(
-                    logits=inferred.logits,
+                    logits=tf.cast(inferred.logits, tf.float32),
                     labels=feature['labels'],
                     num_targets=feature['num_targets'],
                     scope=scope,
@@ -120,6 +163,8 @@ class Model(object):
                     remake = self._hparams.remake,
                     max_steps = self._hparams.max_steps)
                 tf.compat.v1.get_variable_scope().reuse_variables()
+                if self._loss_scale is not None:
+                    losses = losses * self._loss_scale
                 grads = self._optimizer.compute_gradients(losses)
 
         return TowerResult(inferred, almost, correct, grads)
@@ -155,20 +200,59 @@ class Model(object):
 
     Returns:
       A JoinedResult of evaluation results, the train op and the summary op.
+      In inference only mode there are no train and summary ops.
     """
+        summed_corrects = tf.reduce_sum(tf.stack(corrects), 0)
+        summed_almosts = tf.reduce_sum(tf.stack(almosts), 0)
+        if self.inference_only:
+            return JoinedResult(None, None, summed_corrects, summed_almosts)
 
         grads = self._average_gradients(tower_grads)
-        train_op = self._optimizer.apply_gradients(
-            grads, global_step=self._global_step)
+        if self._loss_scale is None:
+            train_op = self._optimizer.apply_gradients(
+                grads, global_step=self._global_step)
+        else:
+            train_op = self._apply_scaled_gradients(grads)
         summaries = tf.compat.v1.get_collection(tf.compat.v1.GraphKeys.SUMMARIES)
         summary = tf.compat.v1.summary.merge(summaries)
         #summary = tf.compat.v1.summary.merge_all()
-        stacked_corrects = tf.stack(corrects)
-        stacked_almosts = tf.stack(almosts)
-        summed_corrects = tf.reduce_sum(stacked_corrects, 0)
-        summed_almosts = tf.reduce_sum(stacked_almosts, 0)
         return JoinedResult(summary, train_op, summed_corrects, summed_almosts)
 
+    def _apply_scaled_gradients(self, grads, growth_steps=2000):
+        """Applies loss scaled gradients, skipping steps that overflowed.
+
+    Args:
+      grads: List of pairs of (gradient, variable) of the scaled loss.
+      growth_steps: Number of finite steps after which the scale doubles.
+    Returns:
+      The train op, which also updates the loss scale.
+    """
+        grads = [(g / self._loss_scale, v) for g, v in grads]
+
+        finite = tf.reduce_all(
+            [tf.reduce_all(tf.math.is_finite(g)) for g, _ in grads])
+
+        apply_op = tf.cond(
+            finite,
+            lambda: self._optimizer.apply_gradients(grads, global_step=self._global_step),
+            tf.no_op)
+
+        finite_steps = tf.where(finite, self._finite_steps + 1, 0.0)
+        grow = finite_steps >= growth_steps
+
+        with tf.control_dependencies([apply_op]):
+            update_scale = self._loss_scale.assign(
+                tf.where(
+                    finite,
+                    tf.where(grow, self._loss_scale * 2, self._loss_scale),
+                    tf.maximum(self._loss_scale / 2, 1.0)))
+            update_steps = self._finite_steps.assign(
+                tf.where(grow, 0.0, finite_steps))
+
+        tf.compat.v1.summary.scalar('loss_scale', self._loss_scale)
+
+        return tf.group(apply_op, update_scale, update_steps)
+
     def multi_gpu(self, features, num_gpus):
         """Build the Graph and add the train ops on multiple GPUs.
 
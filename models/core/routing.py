@@ -7,10 +7,13 @@ import abc
 import tensorflow as tf
 import wandb
 
+from ..core.inspection import FULL, Inspection
 from ..core.metric import Metric
+from ..core import variables
 from ..core.variables import bias_variable
 
-from opt_einsum import contract
+from ..util.contraction import contract
+from ..util.shapes import dynamic_shape
 
 
 class RoutingProcedure(object):
@@ -28,6 +31,7 @@ class RoutingProcedure(object):
             normalization = tf.nn.softmax,
             epsilon=1e-6,
             bias=False,
+            fused=False,
             verbose=True):
         self._iterations = design_iterations
         self._design_iterations = design_iterations
@@ -37,12 +41,22 @@ class RoutingProcedure(object):
         self._initial_state = initial_state
         self.name = name
         self._bias= bias
+        self._fused = fused
         self.metric = metric
         self.atoms = 0
         self._it = 0
         self._activate = True
 
-        self.inspection = {}
+        self._symbolic = False
+        self._parallel_iterations = 10
+        self._swap_memory = False
+        self._checkpoint_every = 0
+        self.iteration_count = design_iterations
+
+        ## indices of the children c covers, None when c is dense.
+        self._children = None
+
+        self._inspection = Inspection()
 
         RoutingProcedure.count += 1
         assert isinstance(metric, Metric), \
@@ -70,23 +84,68 @@ class RoutingProcedure(object):
         with tf.compat.v1.variable_scope('activation', reuse=tf.compat.v1.AUTO_REUSE) as scope:
             return self._activation(s, c, votes, poses)
 
+    def _parent_poses(self, poses):
+        ## poses :: { batch, output_atoms, new_w, new_h, 1 } + repdim
+
+        if self._fused:
+            ## kernels broadcast the parent pose against every vote.
+            return poses
+
+        children = self.atoms if self._children is None else self._children.shape[4]
+
+        return tf.tile(poses, [1, 1, 1, 1, children, 1, 1])
+        ## poses :: { batch, output_atoms, new_w, new_h, depth * np.prod(ksizes) } + repdim
+
+    def _expand_activations(self, activations, votes):
+        ## activations :: { batch, output_atoms or 1, new_w , new_h, depth * np.prod(ksizes), 1, 1 }
+        ## transforms may share the activations between the output atoms.
+
+        if activations.shape[1] == votes.shape[1]:
+            return activations
+
+        return tf.broadcast_to(activations, dynamic_shape(votes)[:5] + [1, 1])
+
+    def _normalize(self, r, axis):
+        ## the normalization runs in float32 whatever the compute dtype.
+        return tf.cast(self._normalization(tf.cast(r, tf.float32), axis=axis), r.dtype)
+
     def _initial_coefficients(self,activations):
 
-        r = (1/32) * tf.ones(shape= activations.shape,
-                    dtype=tf.float32,
+        r = (1/32) * tf.ones_like(activations,
                     name="compatibility_value")
 
         self._norm_coe = tf.reduce_sum(r, keepdims=True, axis=2)
 
-        c = self._normalization(r, axis=4)
+        c = self._normalize(r, axis=4)
 
         return c
 
+    def _selected_votes(self, votes):
+        ## votes :: { batch, output_atoms, new_w, new_h, depth * np.prod(ksizes) } + repdim
+
+        if self._children is None:
+            return votes
+
+        ## sparse routing, c only covers the children in self._children.
+        return tf.gather(votes, self._children, axis=4, batch_dims=4)
+        ## votes :: { batch, output_atoms, new_w, new_h, k } + repdim
+
+    def _selected_activations(self, activations, votes):
+        ## activations :: { batch, output_atoms or 1, new_w , new_h, depth * np.prod(ksizes), 1, 1 }
+
+        if self._children is None:
+            return activations
+
+        return tf.gather(self._expand_activations(activations, votes), self._children, axis=4, batch_dims=4)
+        ## activations :: { batch, output_atoms, new_w , new_h, k, 1, 1 }
+
     def _renormalizedDotProd(self, c, votes):
         ## votes :: { batch, output_atoms, new_w, new_h, depth * np.prod(ksizes) } + repdim
 
         vshape = votes.shape.as_list()
 
+        votes = self._selected_votes(votes)
+
         raw_poses = contract("bowhitl,bowhiuv->bowhtuv",c,votes)
 
         self._norm_coe = tf.reduce_sum( c, axis=4, keepdims=True) + self._epsilon
@@ -117,12 +176,135 @@ class RoutingProcedure(object):
     def unbound_activations(self):
         self._activate = False
 
+    def inspect(self, level=FULL, steps=1):
+        ## level :: off, summary (statistics of c) or full (every tensor).
+        self._inspection = Inspection(level=level, steps=steps)
+
+    @property
+    def inspection(self):
+        return self._inspection.last
+
+    @property
+    def inspection_history(self):
+        ## the records of the last `steps` fits, oldest first.
+        return self._inspection.history
+
+    def symbolic_iterations(self, parallel_iterations=10, swap_memory=False):
+        ## runs the routing iterations in a tf.while_loop instead of unrolling them.
+        self._symbolic = True
+        self._parallel_iterations = parallel_iterations
+        self._swap_memory = swap_memory
+
+    def unrolled_iterations(self):
+        self._symbolic = False
+
+    def recompute_iterations(self, every=1):
+        ## keeps only the state entering each group of `every` iterations for the
+        ## backward pass, the votes dependent intermediates are recomputed.
+        assert every >= 0, \
+            " every must be a non negative number of iterations. "
+
+        self._checkpoint_every = every
+
+    def _checkpoint(self, step, its, state, votes, activations):
+        ## runs step over its under tf.recompute_grad.
+
+        flat = tf.nest.flatten(state)
+        kept = [i for i, x in enumerate(flat) if x is not None]
+        structure = []
+
+        @tf.recompute_grad
+        def segment(votes, activations, *tensors):
+            full = list(flat)
+            for i, x in zip(kept, tensors):
+                full[i] = x
+
+            segment_state = tf.nest.pack_sequence_as(state, full)
+
+            with variables.unshared_reads():
+                for it in its:
+                    segment_state = step(it, segment_state, votes, activations)
+
+            del structure[:]
+            structure.append(segment_state)
+
+            return [x for x in tf.nest.flatten(segment_state) if x is not None]
+
+        outputs = iter(segment(votes, activations, *[flat[i] for i in kept]))
+
+        return tf.nest.map_structure(
+            lambda x: None if x is None else next(outputs), structure[0])
+
+    def _iterate(self, step, state, votes, activations):
+        ## step :: (it, state, votes, activations) -> state
+
+        if not self._symbolic or self._iterations < 2:
+            self.iteration_count = self._iterations
+
+            if self._checkpoint_every < 1 or self._iterations < 3:
+                for it in range(self._iterations):
+                    state = step(it, state, votes, activations)
+
+                return state
+
+            ## as in the symbolic loop the first and last iterations are kept out.
+            state = step(0, state, votes, activations)
+
+            for first in range(1, self._iterations - 1, self._checkpoint_every):
+                its = range(first, min(first + self._checkpoint_every, self._iterations - 1))
+                state = self._checkpoint(step, its, state, votes, activations)
+
+            return step(self._iterations - 1, state, votes, activations)
+
+        ## can be fed at run time to change the number of iterations (at least 2).
+        self.iteration_count = tf.compat.v1.placeholder_with_default(
+            self._iterations, shape=[], name="iterations")
+
+        ## the first and last iterations are peeled, fewer would run one twice.
+        with tf.control_dependencies([tf.debugging.assert_greater_equal(
+                self.iteration_count, 2,
+                message="symbolic routing runs at least 2 iterations")]):
+            count = tf.identity(self.iteration_count)
+
+        ## the first iteration is built outside the loop so that variables and
+        ## recurrent states exist before it, the last one so that the tensors
+        ## subclasses keep as attributes are usable after it.
+        state = step(0, state, votes, activations)
+
+        ## None entries (e.g. s) are not loop variables.
+        carried = [i for i, x in enumerate(state) if x is not None]
+
+        def body(it, loop_vars):
+            full = list(state)
+            for i, x in zip(carried, loop_vars):
+                full[i] = x
+
+            full = step(it, tuple(full), votes, activations)
+
+            return it + 1, [full[i] for i in carried]
+
+        _, loop_vars = tf.compat.v1.while_loop(
+            cond=lambda it, loop_vars: it < count - 1,
+            body=body,
+            loop_vars=(tf.constant(1), [state[i] for i in carried]),
+            parallel_iterations=self._parallel_iterations,
+            swap_memory=self._swap_memory,
+            name="iterations")
+
+        state = list(state)
+        for i, x in zip(carried, loop_vars):
+            state[i] = x
+
+        return step(count - 1, tuple(state), votes, activations)
+
     def fit(self, votes, activations, iterations = 0):
         ## votes :: { batch, output_atoms, new_w, new_h, depth * np.prod(ksizes) } + repdim
         ## activations { batch, output_atoms, new_w , new_h, depth * np.prod(ksizes) }
 
         self.atoms = votes.shape.as_list()[4]
-        self.inspection["poses"] = votes
+        self._children = None
+        self._inspection.step()
+        self._inspection.tensor("poses", votes)
 
         with tf.compat.v1.variable_scope('RoutingProcedure' + self.name, reuse=tf.compat.v1.AUTO_REUSE):
 
@@ -130,7 +312,7 @@ class RoutingProcedure(object):
 
             #activations = tf.reshape(activations, shape=activations.shape.as_list() + [1, 1])
 
-            c = self._initial_coefficients(activations)
+            c = self._initial_coefficients(self._expand_activations(activations, votes))
             ## c = self._normalization(r, axis=-3)
 
             ## r { batch, output_atoms, new_w , new_h, depth * np.prod(ksizes) }
@@ -141,7 +323,7 @@ class RoutingProcedure(object):
             poses = self._renormalizedDotProd(c, votes)
 
             ## poses :: { batch, output_atoms, new_w, new_h, 1 } + repdim
-            self.inspection["poses0"] = poses
+            self._inspection.tensor("poses0", poses)
 
             probabilities, s = self.activation(s, c, votes, poses)
             ## probabilities :: { batch, output_atoms, new_w, new_h, 1 }
@@ -152,12 +334,14 @@ class RoutingProcedure(object):
             else :
                 self._iterations = iterations
 
-            for it in range(self._iterations):
+            def step(it, state, votes, activations):
+                c, s, poses, probabilities = state
                 self._it = it
 
-                self.inspection["s"+str(it)] = s
+                if isinstance(it, int):
+                    self._inspection.tensor("s"+str(it), s)
 
-                self.inspection["c"+str(it) ] = c
+                    self._inspection.coefficients("c"+str(it), c)
 
                 """
                 import matplotlib.pyplot as plt
@@ -182,7 +366,12 @@ class RoutingProcedure(object):
                 ## probabilities :: { batch, output_atoms, new_w, new_h, 1 }
 
             #probabilities = tf.squeeze(probabilities, axis=[-2,-1])
-                self.inspection["poses"+str(it+1)] = poses
+                if isinstance(it, int):
+                    self._inspection.tensor("poses"+str(it+1), poses)
+
+                return c, s, poses, probabilities
+
+            c, s, poses, probabilities = self._iterate(step, (c, s, poses, probabilities), votes, activations)
 
             if self._verbose:
                 print("c:::###")
@@ -190,8 +379,8 @@ class RoutingProcedure(object):
                 tf.compat.v1.summary.histogram("compatibilityact/" + self.name, c)
                 best = tf.math.argmax(c, axis=4)
                 tf.compat.v1.summary.histogram("bestC", best)
-                self.inspection["cfinal"] = c
-                self.inspection["cbest"] = best
+                self._inspection.coefficients("cfinal", c)
+                self._inspection.tensor("cbest", best)
 
             poses = contract("bowhlij->bwhoij",poses)
             probabilities = contract("bowhlij->bwhoij",probabilities)
@@ -203,12 +392,12 @@ class RoutingProcedure(object):
                 #probabilities.reshape( (probabilities.shape[0], -1) )
                 best = tf.math.argmax(
                     tf.reshape(probabilities,
-                        (probabilities.shape[0], -1)
+                        dynamic_shape(probabilities)[:1] + [-1]
                         ),
                         axis=-1)
                 tf.compat.v1.summary.histogram("bestProb",best)
-                self.inspection["prob"] = probabilities
-                self.inspection["prob_best"] = best
+                self._inspection.tensor("prob", probabilities)
+                self._inspection.tensor("prob_best", best)
 
             return poses, probabilities
 
@@ -228,6 +417,7 @@ class SimplifiedRoutingProcedure(RoutingProcedure):
             normalization = tf.nn.softmax,
             epsilon=1e-6,
             bias=False,
+            fused=False,
             verbose=False):
 
         super(SimplifiedRoutingProcedure, self).__init__(
@@ -238,6 +428,7 @@ class SimplifiedRoutingProcedure(RoutingProcedure):
             normalization = normalization,
             epsilon=epsilon,
             bias=bias,
+            fused=fused,
             verbose=verbose)
 
     @abc.abstractmethod
@@ -256,6 +447,8 @@ class SimplifiedRoutingProcedure(RoutingProcedure):
 
         vshape = votes.shape.as_list()
 
+        votes = self._selected_votes(votes)
+
         #raw_poses = tf.reduce_sum(tf.multiply(c, votes), axis=4, keepdims=True)
         raw_poses = contract("bowhitl,bowhiuv->bowhtuv",c,votes)
 
@@ -275,14 +468,16 @@ class SimplifiedRoutingProcedure(RoutingProcedure):
         ## votes :: { batch, output_atoms, new_w, new_h, depth * np.prod(ksizes) } + repdim
         ## activations { batch, output_atoms, new_w , new_h, depth * np.prod(ksizes) }
         self.atoms = votes.shape.as_list()[4]
-        self.inspection["poses"] = votes
+        self._children = None
+        self._inspection.step()
+        self._inspection.tensor("poses", votes)
         with tf.compat.v1.variable_scope('SimplifiedRoutingProcedure/' + self.name, reuse=tf.compat.v1.AUTO_REUSE):
 
             s = self._initial_state
 
             #activations = tf.reshape(activations, shape=[-1] + activations.shape.as_list()[1:] + [1, 1])
 
-            c = self._initial_coefficients(activations)
+            c = self._initial_coefficients(self._expand_activations(activations, votes))
             ## r { batch, output_atoms, new_w , new_h, depth * np.prod(ksizes) }
 
             #c=r
@@ -290,7 +485,7 @@ class SimplifiedRoutingProcedure(RoutingProcedure):
 
             poses = self._renormalizedDotProd(c, votes)
             ## poses :: { batch, output_atoms, new_w, new_h, 1 } + repdim
-            self.inspection["poses0"] = poses
+            self._inspection.tensor("poses0", poses)
             #probabilities = self.activation(s, c, votes, poses)
             ## probabilities :: { batch, output_atoms, new_w, new_h, 1 }
 
@@ -299,11 +494,12 @@ class SimplifiedRoutingProcedure(RoutingProcedure):
             else :
                 self._iterations = iterations
 
-            for it in range(self._iterations):
+            def step(it, state, votes, activations):
+                c, s, poses = state
                 self._it = it
 
-
-                self.inspection["c"+str(it) ] = c
+                if isinstance(it, int):
+                    self._inspection.coefficients("c"+str(it), c)
 
                 #if self._verbose:
                 #        cshape = c.shape.as_list()
@@ -319,7 +515,12 @@ class SimplifiedRoutingProcedure(RoutingProcedure):
 
                 poses = self._renormalizedDotProd(c, votes)
                 ## poses :: { batch, output_atoms, new_w, new_h, 1 } + repdim
-                self.inspection["poses"+str(it+1)] = poses
+                if isinstance(it, int):
+                    self._inspection.tensor("poses"+str(it+1), poses)
+
+                return c, s, poses
+
+            c, s, poses = self._iterate(step, (c, s, poses), votes, activations)
 
             if self._verbose:
                 print("c:::###")
@@ -327,8 +528,8 @@ class SimplifiedRoutingProcedure(RoutingProcedure):
                 tf.compat.v1.summary.histogram("compatibilityact/" + self.name, c)
                 best = tf.math.argmax(c, axis=4)
                 tf.compat.v1.summary.histogram("bestC", best)
-                self.inspection["cfinal"] = c
-                self.inspection["cbest"] = best
+                self._inspection.coefficients("cfinal", c)
+                self._inspection.tensor("cbest", best)
 
             #if self._verbose:
             #    cshape = c.shape.as_list()
@@ -357,12 +558,12 @@ class SimplifiedRoutingProcedure(RoutingProcedure):
                 #probabilities.reshape( (probabilities.shape[0], -1) )
                 best = tf.math.argmax(
                     tf.reshape(probabilities,
-                        (probabilities.shape[0], -1)
+                        dynamic_shape(probabilities)[:1] + [-1]
                         ),
                         axis=-1)
                 tf.compat.v1.summary.histogram("bestProb",best)
-                self.inspection["prob"] = probabilities
-                self.inspection["prob_best"] = best
+                self._inspection.tensor("prob", probabilities)
+                self._inspection.tensor("prob_best", best)
 
             return poses, probabilities
 
@@ -380,6 +581,7 @@ class HyperSimplifiedRoutingProcedure(RoutingProcedure):
             normalization = tf.nn.softmax,
             epsilon=1e-6,
             bias=False,
+            fused=False,
             verbose=False):
 
 
@@ -391,6 +593,7 @@ class HyperSimplifiedRoutingProcedure(RoutingProcedure):
             normalization = normalization,
             epsilon=epsilon,
             bias=bias,
+            fused=fused,
             verbose=verbose)
 
 
@@ -405,7 +608,7 @@ class HyperSimplifiedRoutingProcedure(RoutingProcedure):
             r, s = self.compatibility(None, None, votes, None, None, activations, None)
             ## r :: { batch, output_atoms, new_w , new_h, depth * np.prod(ksizes) }
 
-            c = self._normalization(r, axis=4)
+            c = self._normalize(r, axis=4)
             #c = r
             ## c :: { batch, output_atoms, new_w , new_h, depth * np.prod(ksizes) }
 
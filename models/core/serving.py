@@ -0,0 +1,143 @@
+"""Scores images with an exported model, batching concurrent requests.
+
+The routing costs about as much for one image as for a full batch. The
+batcher coalesces the requests that arrive while it waits, up to the batch
+size or a latency deadline, and scores them in a single session run. Graphs
+exported with a static batch dimension get the batch padded to it.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import concurrent.futures
+import queue
+import threading
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from . import export
+
+## most images scored at once by graphs with a dynamic batch dimension.
+MAX_BATCH_SIZE = 32
+
+_STOP = object()
+
+
+class Batcher(object):
+
+    def __init__(self, export_dir, max_latency=0.005, max_batch_size=None, config=None):
+        """Loads the exported model and starts the batching thread.
+
+        Args:
+          export_dir: The directory of the SavedModel written by export.export.
+          max_latency: Seconds the first request of a batch waits for others.
+          max_batch_size: Most images scored in one run, the static batch size
+            of the graph or MAX_BATCH_SIZE by default.
+          config: (optional) The tf.compat.v1.ConfigProto of the session.
+        """
+        graph = tf.Graph()
+        self._session = tf.compat.v1.Session(graph=graph, config=config)
+        with graph.as_default():
+            inputs, outputs = export.load(self._session, export_dir)
+
+        self._images = inputs["images"]
+        ## None when the graph scores batches of any size.
+        self.batch_size = self._images.shape.as_list()[0]
+        self.image_shape = self._images.shape.as_list()[1:]
+        self.max_batch_size = max_batch_size or self.batch_size or MAX_BATCH_SIZE
+        if self.batch_size:
+            self.max_batch_size = min(self.max_batch_size, self.batch_size)
+        self.max_latency = max_latency
+
+        ## the outputs with a value per image, like the class activations.
+        self._outputs = {
+            key: output for key, output in outputs.items()
+            if output.shape.rank and output.shape.as_list()[0] == self.batch_size
+        }
+
+        self.batches = 0
+        self.examples = 0
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, images):
+        """Queues a request of one or more images.
+
+        Args:
+          images: Array of one image or of a batch of images.
+
+        Returns:
+          A concurrent.futures.Future of the dictionary of the outputs of the
+          images, like the 'logits' activations of every class.
+        """
+        images = np.asarray(images, np.float32)
+        images = images.reshape([-1] + self.image_shape)
+        if len(images) > self.max_batch_size:
+            raise ValueError(
+                'Request of {} images, at most {} are scored at once.'.format(
+                    len(images), self.max_batch_size))
+
+        future = concurrent.futures.Future()
+        self._queue.put((images, future))
+        return future
+
+    def _coalesce(self, request):
+        ## the requests arriving before the deadline that fit the batch.
+        requests = [request]
+        size = len(request[0])
+        deadline = time.time() + self.max_latency
+        while size < self.max_batch_size:
+            try:
+                request = self._queue.get(timeout=max(0., deadline - time.time()))
+            except queue.Empty:
+                break
+            ## scored in the next batch.
+            if request is _STOP or size + len(request[0]) > self.max_batch_size:
+                return requests, request
+            requests.append(request)
+            size += len(request[0])
+        return requests, None
+
+    def _score(self, requests):
+        size = sum(len(request_images) for request_images, _ in requests)
+        images = np.zeros([self.batch_size or size] + self.image_shape, np.float32)
+        start = 0
+        for request_images, _ in requests:
+            images[start:start + len(request_images)] = request_images
+            start += len(request_images)
+
+        outputs = self._session.run(self._outputs, feed_dict={self._images: images})
+        self.batches += 1
+        self.examples += start
+
+        start = 0
+        for request_images, future in requests:
+            end = start + len(request_images)
+            future.set_result({key: value[start:end] for key, value in outputs.items()})
+            start = end
+
+    def _run(self):
+        carried = None
+        while True:
+            request = carried or self._queue.get()
+            if request is _STOP:
+                break
+
+            requests, carried = self._coalesce(request)
+            try:
+                self._score(requests)
+            except Exception as error:
+                for _, future in requests:
+                    if not future.done():
+                        future.set_exception(error)
+
+    def close(self):
+        """Scores the queued requests, then stops the thread and the session."""
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._session.close()
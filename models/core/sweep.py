@@ -0,0 +1,75 @@
+"""Restores a sequence of checkpoints into one graph, one after the other.
+
+Only the variables whose values differ from the checkpoint restored before
+are assigned, frozen parameters such as batch norm statistics are loaded
+once. The tensors of the next checkpoint are read and compared on a
+background thread while the current one is evaluated.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import concurrent.futures
+
+import numpy as np
+import tensorflow as tf
+
+
+class CheckpointSweep(object):
+
+    def __init__(self, var_list=None):
+        """Builds the assign ops of the variables, call before finalizing the graph.
+
+        Args:
+          var_list: The variables to restore, all the global variables by default.
+        """
+        if var_list is None:
+            var_list = tf.compat.v1.global_variables()
+
+        ## checkpoint key -> (placeholder, assign op), keys as tf.compat.v1.train.Saver writes them.
+        self._assigns = {}
+        with tf.compat.v1.name_scope("sweep"):
+            for var in var_list:
+                value = tf.compat.v1.placeholder(var.dtype.base_dtype, shape=var.shape)
+                self._assigns[var.op.name] = (value, var.assign(value, read_value=False))
+
+    def _load(self, checkpoint, previous):
+        ## runs on the background thread.
+        reader = tf.train.load_checkpoint(checkpoint)
+        values = {name: reader.get_tensor(name) for name in self._assigns}
+        changed = {
+            name: value for name, value in values.items()
+            if name not in previous or not np.array_equal(value, previous[name])
+        }
+        return values, changed
+
+    def restore_each(self, session, checkpoints):
+        """Restores the checkpoints in order, yielding after each restore.
+
+        The next checkpoint is prefetched while the caller evaluates the
+        current one.
+
+        Args:
+          session: The session holding the variables.
+          checkpoints: The checkpoint paths to restore.
+
+        Yields:
+          The checkpoint path and the number of variables assigned to restore it.
+        """
+        if not checkpoints:
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+            pending = pool.submit(self._load, checkpoints[0], {})
+            for i, checkpoint in enumerate(checkpoints):
+                values, changed = pending.result()
+                if i + 1 < len(checkpoints):
+                    pending = pool.submit(self._load, checkpoints[i + 1], values)
+
+                if changed:
+                    session.run(
+                        [self._assigns[name][1] for name in changed],
+                        feed_dict={self._assigns[name][0]: value for name, value in changed.items()})
+
+                yield checkpoint, len(changed)
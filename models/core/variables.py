@@ -8,11 +8,169 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import contextlib
+import weakref
+
 import tensorflow as tf
 
+## variables are kept in float32, they are read in the compute dtype.
+_COMPUTE_DTYPE = [tf.float32]
+
+PLACEMENTS = ("parameter_server", "colocated", "replicated")
+
+_PLACEMENT = {
+    "strategy": "parameter_server",
+    "device": "/cpu:0",
+    "tower_device": "/gpu:%d",
+    "tower": None,
+    "shared_reads": True
+}
+
+## the local copies of the replicated placement, per graph, variable and tower.
+_REPLICAS = weakref.WeakKeyDictionary()
+
+VARIABLE_OPS = ("Variable", "VariableV2", "VarHandleOp")
+
+
+def set_placement(strategy="parameter_server", device="/cpu:0", tower_device="/gpu:%d"):
+    """Selects where variables live when the model runs on several towers.
+
+    Args:
+      strategy: 'parameter_server' keeps every variable on device, the towers
+        read it from there. 'colocated' creates each variable on the device of
+        the tower that first uses it. 'replicated' keeps the master copy on
+        device and gives every tower a local copy, refreshed once per step,
+        that all its reads share.
+      device: The parameter device.
+      tower_device: Format string of the tower devices.
+    """
+    if strategy not in PLACEMENTS:
+        raise ValueError(
+            'Unexpected placement {!r}, must be one of {}.'.format(strategy, PLACEMENTS))
+
+    _PLACEMENT["strategy"] = strategy
+    _PLACEMENT["device"] = device
+    _PLACEMENT["tower_device"] = tower_device
+
+
+def placement():
+    return _PLACEMENT["strategy"]
+
+
+def placed():
+    """Device scope for creating variables outside the towers."""
+    if placement() == "colocated":
+        return contextlib.nullcontext()
+    return tf.device(_PLACEMENT["device"])
+
+
+def tower_device(tower_ind):
+    """Device function of a tower, it also places the variables the tower
+    creates, for instance in the keras layers.
+    """
+    worker = _PLACEMENT["tower_device"] % tower_ind
+
+    def device(op):
+        if op.type in VARIABLE_OPS and placement() != "colocated":
+            return _PLACEMENT["device"]
+        return worker
+
+    return device
+
+
+@contextlib.contextmanager
+def tower(tower_ind):
+    """Device scope of a tower, see tower_device. The replicated placement
+    keeps one local copy of each variable per tower.
+    """
+    previous = _PLACEMENT["tower"]
+    _PLACEMENT["tower"] = tower_ind
+    try:
+        with tf.compat.v1.device(tower_device(tower_ind)):
+            yield
+    finally:
+        _PLACEMENT["tower"] = previous
+
+
+@contextlib.contextmanager
+def unshared_reads():
+    """Reads variables directly instead of through the tower copies.
+
+    tf.recompute_grad only differentiates the variables read inside the
+    function it wraps, not tensors computed from them outside.
+    """
+    previous = _PLACEMENT["shared_reads"]
+    _PLACEMENT["shared_reads"] = False
+    try:
+        yield
+    finally:
+        _PLACEMENT["shared_reads"] = previous
+
+
+def set_precision(policy="float32"):
+    """Selects float32 or mixed precision execution.
+
+    Args:
+      policy: 'float32', 'mixed_float16' or 'mixed_bfloat16'. The mixed
+        policies keep float32 master weights and compute in half precision.
+        Keras layers follow the same policy.
+    """
+    tf.keras.mixed_precision.set_global_policy(policy)
+    _COMPUTE_DTYPE[0] = tf.as_dtype(tf.keras.mixed_precision.global_policy().compute_dtype)
+
+
+def compute_dtype():
+    """The dtype variables are read in and the capsule layers compute in."""
+    return _COMPUTE_DTYPE[0]
+
+
+def policy():
+    """The precision policy, passed as dtype to the tf.compat.v1 layers.
+
+    The v1 layers create their variables in the compute dtype unless given
+    the policy itself.
+    """
+    return tf.keras.mixed_precision.global_policy()
+
+
+def variables_of(fetches):
+    """Returns the global variables the fetches are computed from.
+
+    Optimizer slots and other variables only the training ops read are left
+    out, evaluation only has to restore the returned ones.
+    """
+    graph = tf.compat.v1.get_default_graph()
+    names = [fetch.op.name if hasattr(fetch, "op") else fetch.name
+             for fetch in tf.nest.flatten(fetches)]
+    subgraph = tf.compat.v1.graph_util.extract_sub_graph(graph.as_graph_def(), names)
+    used = {node.name for node in subgraph.node if node.op in VARIABLE_OPS}
+    return [var for var in tf.compat.v1.global_variables() if var.op.name in used]
+
+
+def _replica(var):
+    ## made once on the tower device and outside any loop, so every read of
+    ## the step, the routing iterations included, shares the same copy.
+    replicas = _REPLICAS.setdefault(var.graph, {})
+    key = (var.name, _PLACEMENT["tower"])
+
+    if key not in replicas:
+        with tf.init_scope():
+            replicas[key] = tf.identity(var, name=var.op.name.split("/")[-1] + "_replica")
+
+    return replicas[key]
+
+
+def _read(var):
+    if placement() == "replicated":
+        var = _replica(var) if _PLACEMENT["shared_reads"] else tf.identity(var)
+
+    if var.dtype.base_dtype == compute_dtype():
+        return var
+    return tf.cast(var, compute_dtype())
+
 
 def weight_variable(shape, stddev=0.1, verbose=False, name="", regularizer=None, initializer = None):
-    """Creates a CPU variable with normal initialization. Adds summaries.
+    """Creates a variable with normal initialization. Adds summaries.
 
     Args:
       shape: list, the shape of the variable.
@@ -21,7 +179,7 @@ def weight_variable(shape, stddev=0.1, verbose=False, name="", regularizer=None,
     Returns:
       Weight variable tensor of shape=shape.
     """
-    with tf.device('/cpu:0'):
+    with placed():
         with tf.compat.v1.variable_scope('weights',reuse=tf.compat.v1.AUTO_REUSE):
             if initializer is None:
                 initializer = tf.compat.v1.truncated_normal_initializer(
@@ -33,20 +191,20 @@ def weight_variable(shape, stddev=0.1, verbose=False, name="", regularizer=None,
                 dtype=tf.float32,
                 regularizer=regularizer)
     variable_summaries(weights, verbose)
-    return weights
+    return _read(weights)
 
 def new_variable(value, verbose=False, name=""):
-    with tf.device('/cpu:0'):
+    with placed():
         var = tf.compat.v1.Variable(
             value,
             name=name,
             dtype=tf.float32)
 
     variable_summaries(var, verbose)
-    return var
+    return _read(var)
 
 def bias_variable(shape, verbose=False, name="", initializer = tf.compat.v1.constant_initializer(0.1)):
-    """Creates a CPU variable with constant initialization. Adds summaries.
+    """Creates a variable with constant initialization. Adds summaries.
 
     Args:
       shape: list, the shape of the variable.
@@ -55,7 +213,7 @@ def bias_variable(shape, verbose=False, name="", initializer = tf.compat.v1.cons
     Returns:
       Bias variable tensor with shape=shape.
     """
-    with tf.device('/cpu:0'):
+    with placed():
         with tf.compat.v1.variable_scope('biases', reuse=tf.compat.v1.AUTO_REUSE):
             biases = tf.compat.v1.get_variable(
                 'biases' + name,
@@ -63,7 +221,7 @@ def bias_variable(shape, verbose=False, name="", initializer = tf.compat.v1.cons
                 initializer=initializer,
                 dtype=tf.float32)
     variable_summaries(biases, verbose)
-    return biases
+    return _read(biases)
 
 
 def variable_summaries(var, verbose):
@@ -7,6 +7,14 @@ import tensorflow as tf
 
 from ..core import variables
 from ..core.kernel import Kernel
+from ..util.shapes import dynamic_shape
+
+
+def _flatten(x, shape):
+    ## merges the repdim axes into shape, [1, -1] or [-1, 1], keeping the
+    ## merged size static when the batch size is not.
+    size = int(np.prod(x.shape.as_list()[-2:]))
+    return tf.reshape(x, dynamic_shape(x)[:-2] + [size if d == -1 else d for d in shape])
 
 
 class Poly(Kernel):
@@ -22,12 +30,12 @@ class Poly(Kernel):
     def apply(self, a, b):
         ## a,b :: { batch, output_atoms, new_w, new_h, depth * np.prod(ksizes) } + repdim
 
-        shape = a.shape.as_list()
-        a = tf.reshape(a, shape[:-2] + [1, -1])
-        b = tf.reshape(b, shape[:-2] + [-1, 1])
+        a = _flatten(a, [1, -1])
+        b = _flatten(b, [-1, 1])
 
         ## a :: { batch, output_atoms, new_w, new_h, depth * np.prod(ksizes), 1, np.prod(repdim)}
         ## b :: { batch, output_atoms, new_w, new_h, depth * np.prod(ksizes), np.prod(repdim), 1}
+        ## the child axis of a may be 1, matmul broadcasts it against b.
         r = tf.pow(tf.matmul(a, b) + 1, self._degree)
 
         ## r :: { batch, output_atoms, new_w, new_h, depth * np.prod(ksizes), 1, 1}
@@ -43,9 +51,8 @@ class DotProd(Kernel):
             False)
 
     def apply(self, a, b):
-        shape = a.shape.as_list()
-        a = tf.reshape(a, shape[:-2] + [1, -1])
-        b = tf.reshape(b, shape[:-2] + [-1, 1])
+        a = _flatten(a, [1, -1])
+        b = _flatten(b, [-1, 1])
 
         return tf.matmul(a, b)
 
@@ -94,10 +101,8 @@ class SpectralMixture(Kernel):
             verbose=verbose)
 
     def apply(self, a, b):
-        shape = a.shape.as_list()
-
-        a = tf.reshape(a, shape[:-2] + [1, -1])
-        b = tf.reshape(b, shape[:-2] + [1, -1])
+        a = _flatten(a, [1, -1])
+        b = _flatten(b, [1, -1])
 
         ro = a - b
 
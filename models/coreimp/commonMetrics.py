@@ -31,5 +31,6 @@ class Frobenius(SquaredFrobenius):
     def apply(self, a):
         ## a :: { batch, output_atoms, new_w, new_h, depth * np.prod(ksizes) } + repdim
         with tf.name_scope("Frobenius"):
-            sq = super(Frobenius, self).apply(a)
-            return tf.sqrt( sq + self._epsilon)
+            ## the sum of squares and the sqrt run in float32.
+            sq = super(Frobenius, self).apply(tf.cast(a, tf.float32))
+            return tf.cast(tf.sqrt( sq + self._epsilon), a.dtype)
@@ -14,6 +14,7 @@ class DynamicRouting(SimplifiedRoutingProcedure):
             self,
             iterations,
             name="",
+            fused=False,
             verbose=False):
         self._agreement = None
 
@@ -22,6 +23,7 @@ class DynamicRouting(SimplifiedRoutingProcedure):
             metric=SquaredFrobenius(),
             design_iterations=iterations,
             initial_state=None,
+            fused=fused,
             verbose=verbose)
 
     def _compatibility(self, s, r, votes, poses, probabilities, activations, it):
@@ -36,20 +38,19 @@ class DynamicRouting(SimplifiedRoutingProcedure):
 
         self._wj = poses_norm / (1 + poses_norm)
 
-        poses_tiled = tf.tile(poses, [1, 1, 1, 1, self.atoms, 1, 1])
+        ## s carries the logits of the previous iteration.
+        if s is None:
+            s = self._r
 
-        r = self._r + self._wj * DotProd().take(poses_tiled, votes)
+        r = s + self._wj * DotProd().take(self._parent_poses(poses), votes)
 
-        self._r = r
-
-        c = self._normalization(r, axis=4)
+        c = self._normalize(r, axis=4)
 
-        return c, s
+        return c, r
 
     def _initial_coefficients(self,activations):
 
-        r = tf.zeros(shape= activations.shape,
-                    dtype=tf.float32,
+        r = tf.zeros_like(activations,
                     name="compatibility_value")
 
         self._r = r
@@ -58,7 +59,7 @@ class DynamicRouting(SimplifiedRoutingProcedure):
 
         return activations
 
-    def _activation(self, s, c, votes, poses):
+    def _activation(self, s, c, votes, poses, activations):
         ## poses :: { batch, output_atoms, new_w, new_h, 1 } + repdim
         ## votes :: { batch, output_atoms, new_w, new_h, depth * np.prod(ksizes) } + repdim
         ## c :: { batch, output_atoms, new_w , new_h, depth * np.prod(ksizes) }
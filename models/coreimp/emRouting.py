@@ -29,8 +29,7 @@ class EMRouting(RoutingProcedure):
 
     def _initial_coefficients(self,activations):
 
-        r = (1/16)*tf.ones(shape= activations.shape,
-                    dtype=tf.float32,
+        r = (1/16)*tf.ones_like(activations,
                     name="compatibility_value")
 
         self._norm_coe = tf.reduce_sum(r, keepdims=True, axis=2)
@@ -42,43 +41,44 @@ class EMRouting(RoutingProcedure):
         ## votes :: { batch, output_atoms, new_w, new_h, depth * np.prod(ksizes) } + repdim
         ## r :: { batch, output_atoms, new_w , new_h, depth * np.prod(ksizes) ,1 ,1}
 
-        sigma_sq = 2 * s
+        ## E-step in the log domain, the squared deviation comes from the M-step
+        ## of the previous iteration, that produced poses.
+        sigma_sq, deviation = s
 
-        expon = -tf.reduce_sum( (votes - poses)**2 /sigma_sq,  keepdims=True, axis=[-2,-1])
+        log_pj = self._log_likelihood(sigma_sq, deviation)
 
-        logfactor = (-0.5)*tf.reduce_sum( tf.math.log( sigma_sq * np.pi ) , keepdims=True, axis=[-2,-1])
+        log_rij = tf.math.log(tf.maximum(tf.cast(activations, tf.float32), self._epsilon)) + log_pj
 
-        #factor = 1 / tf.sqrt( tf.reduce_prod( sigma_sq * np.pi , keepdims=True, axis=[-2,-1]) )
+        rij = tf.exp(log_rij - tf.reduce_logsumexp(log_rij, keepdims=True, axis=1)) + self._epsilon
 
-        #print("#####insidecomp")
-        #print(self._it)
+        return tf.cast(rij, votes.dtype), s
 
-        #import matplotlib.pyplot as plt
-        #plt.hist( (factor).numpy().reshape(-1),bins=200)
-        #plt.show()
-        #print(tf.reduce_sum(expon))
-        #print(tf.reduce_sum(logfactor))
-        #
-        #print( tf.exp(tf.reduce_mean(logfactor+expon)))
+    def _log_likelihood(self, sigma_sq, deviation):
+        ## sigma_sq :: { batch, output_atoms, new_w, new_h, 1 } + repdim
+        ## deviation :: { batch, output_atoms, new_w, new_h, depth * np.prod(ksizes) } + repdim
 
-        pj = tf.exp(logfactor + expon)
-        #if self._it == 2:
-        #    print(pj)
+        ## the log likelihood is computed in float32 whatever the compute dtype.
+        sigma_sq = tf.cast(sigma_sq, tf.float32)
+        deviation = tf.cast(deviation, tf.float32)
 
-        rij = activations * pj
+        expon = -tf.reduce_sum( deviation / (2 * sigma_sq), keepdims=True, axis=[-2,-1])
 
-        rij_norm = tf.reduce_sum( rij, keepdims=True, axis=1)
+        logfactor = (-0.5)*tf.reduce_sum( tf.math.log( 2 * sigma_sq * np.pi ) , keepdims=True, axis=[-2,-1])
 
-        rij = rij / rij_norm + self._epsilon
+        return logfactor + expon
 
-        ## nao esta a ser corretamente feito o c_norm
-        ## recorer ao repositorio ibm/ implementing em
+    def _m_step(self, c, votes, poses):
+        ## closed form M-step for the whole batch, poses are the weighted mean of
+        ## the votes. The squared deviation is computed once and reused for
+        ## sigma here and for the log likelihood of the next E-step.
 
-        #self._norm_coe = tf.reduce_sum(c, keepdims=True, axis=2)
+        deviation = tf.math.squared_difference(votes, poses)
 
-        #c_normed = c / (self._norm_coe + self._epsilon)
+        sigma_sq = tf.reduce_sum(c * deviation / self._norm_coe, axis=4, keepdims=True)
 
-        return rij, s
+        sigma_sq = tf.maximum(sigma_sq, 0.00001)
+
+        return sigma_sq, deviation
 
     def _activation(self, s, c, votes, poses):
         ## poses :: { batch, output_atoms, new_w, new_h, 1 } + repdim
@@ -97,16 +97,13 @@ class EMRouting(RoutingProcedure):
             name="betaa",
             verbose=self._verbose)
 
-        sigma_sq = tf.reduce_sum(c * tf.pow(votes - poses, 2) / self._norm_coe, axis=4, keepdims=True)
-
-        sigma_sq = tf.maximum(sigma_sq, 0.00001)
-        #print(tf.reduce_sum(s))
+        sigma_sq, deviation = self._m_step(c, votes, poses)
 
         costh = self._norm_coe * (betau + 2* tf.math.log(sigma_sq + self._epsilon))
 
         inverse_temperature = (self._lambda *
-                               (1 - tf.pow(0.95, tf.cast(self._it + 1, tf.float32))))
+                               (1 - tf.pow(tf.constant(0.95, votes.dtype), tf.cast(self._it + 1, votes.dtype))))
 
         activation = tf.sigmoid(inverse_temperature * (betaa - tf.reduce_sum(costh, keepdims=True, axis=[-2,-1])))
 
-        return activation, sigma_sq
+        return activation, (sigma_sq, deviation)
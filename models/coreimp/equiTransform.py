@@ -9,7 +9,7 @@ from ..core.metric import Metric
 from ..core.transform import Transform
 from ..util.initializer import IdentityRandomUniform
 
-from opt_einsum import contract
+from ..util.contraction import contract
 
 class EquiTransform(Transform):
 
@@ -49,19 +49,19 @@ class EquiTransform(Transform):
         W_norm = self.metric.take(W)
         ## W_norm :: { 1, outputatoms, 1, 1, depth * np.prod(ksizes) , 1 ,1 }
 
-        votes_raw = contract("aocduik,bwhukj->bowhuij", W, poses)
+        ## normalizing the weights once is cheaper than normalizing every vote.
+        W = W / (W_norm + self._epsilon)
 
-        activations_tiled = tf.tile(
-            tf.expand_dims(activations, 1),
-            [1, self._output_atoms, 1, 1, 1, 1, 1]
-        )
-        ## activations_tiled :: { batch, outputatoms, new_w, new_h, depth * np.prod(ksizes) }
+        ## a batched matmul over the children of
+        ## { outputatoms * 4, 4 } x { 4, batch * new_w * new_h * 4 }
+        votes = contract("aocduik,bwhukj->bowhuij", W, poses)
 
-        votes = votes_raw / (W_norm + self._epsilon)
+        activations = tf.expand_dims(activations, 1)
+        ## activations :: { batch, 1, new_w, new_h, depth * np.prod(ksizes) }
+        ## shared by every output atom, routing broadcasts them.
 
         """
             transforms the lower level poses to the higher level capsule space.
         """
         ## votes :: { batch, outputatoms, new_w, new_h, depth * np.prod(ksizes) } + repdim
-        #print("votes: " + str(votes.shape))
-        return votes, activations_tiled
+        return votes, activations
@@ -18,9 +18,13 @@ class KernelRouting(SimplifiedRoutingProcedure):
             metric,
             iterations,
             name="",
+            fused=False,
+            top_k=None,
             verbose=False):
         self._kernel = kernel
         self._agreement = None
+        ## number of children each parent routes from, None keeps c dense.
+        self._top_k = top_k
 
         super(KernelRouting, self).__init__(
             name="KernelRouting" + name,
@@ -28,6 +32,7 @@ class KernelRouting(SimplifiedRoutingProcedure):
             design_iterations=iterations,
             initial_state=None,
             verbose=verbose,
+            fused=fused,
             normalization=self.norm)
 
     def _compatibility(self, s, r, votes, poses, probabilities, activations, it):
@@ -49,22 +54,38 @@ class KernelRouting(SimplifiedRoutingProcedure):
         alpha = tf.abs(alpha)
         beta = tf.abs(beta)
 
-        activations = tf.clip_by_value(activations, 1e-6, 1.0)
+        ## once the children are selected only their k votes are compared.
+        activations = tf.clip_by_value(self._selected_activations(activations, votes), 1e-6, 1.0)
+        votes = self._selected_votes(votes)
 
-        poses_tiled = tf.tile(poses, [1, 1, 1, 1, self.atoms, 1, 1])
+        self._agreement = self._kernel.take(self._parent_poses(poses), votes)
 
-        self._agreement = self._kernel.take(poses_tiled, votes)
-
-        if self._verbose:
+        if self._verbose and isinstance(self._it, int):
             tf.compat.v1.summary.histogram(self.name + "dist_" + str(self._it), self._agreement)
 
         lambda_o = beta + alpha + self._epsilon
         r = tf.pow(activations, beta/lambda_o ) * tf.exp(1/lambda_o * self._agreement)
 
-        c = self._normalization(r, axis=4)
+        if self._top_k is not None and self._top_k < self.atoms and self._children is None:
+            r = self._top_children(r)
+
+        c = self._normalize(r, axis=4)
 
         return c, s
 
+    def _top_children(self, r):
+        ## r :: { batch, output_atoms, new_w , new_h, depth * np.prod(ksizes), 1, 1 }
+
+        ## keeps the k children with the largest compatibility for each parent at
+        ## the first iteration, the later ones only route between those k votes.
+        r, self._children = tf.math.top_k(tf.squeeze(r, axis=[-2, -1]), k=self._top_k, sorted=False)
+        ## children :: { batch, output_atoms, new_w , new_h, k }
+
+        self._agreement = tf.gather(self._agreement, self._children, axis=4, batch_dims=4)
+
+        return r[..., tf.newaxis, tf.newaxis]
+        ## r :: { batch, output_atoms, new_w , new_h, k, 1, 1 }
+
     def _activation(self, s, c, votes, poses, activations):
         ## poses :: { batch, output_atoms, new_w, new_h, 1 } + repdim
         ## votes :: { batch, output_atoms, new_w, new_h, depth * np.prod(ksizes) } + repdim
@@ -75,7 +96,7 @@ class KernelRouting(SimplifiedRoutingProcedure):
         #print("raw")
         #print(activations.shape)
         #print(raw.shape)
-        activations = tf.clip_by_value(activations, 1e-6, 1.0)
+        activations = tf.clip_by_value(self._selected_activations(activations, votes), 1e-6, 1.0)
 
         ## raw :: { batch, output_atoms, new_w, new_h, 1 }
         rs = [1, raw.shape[1], 1, 1, 1, 1,1]
@@ -6,6 +6,7 @@ import tensorflow as tf
 
 from ..core import variables
 from ..core.kernel import Kernel
+from ..util.shapes import dynamic_shape
 
 
 class KernelMix(Kernel):
@@ -36,7 +37,7 @@ class KernelMix(Kernel):
 
         #c = self._normalization(bias)
 
-        s = tf.zeros(a.shape.as_list()[:-2]+ [1,1],dtype=tf.float32)
+        s = tf.zeros(dynamic_shape(a)[:-2]+ [1,1],dtype=a.dtype)
 
         for i in range(len(self._kernel_list)):
             with tf.compat.v1.variable_scope('component' + str(i), reuse=tf.compat.v1.AUTO_REUSE):
@@ -2,11 +2,13 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import numpy as np
 import tensorflow as tf
 
 from models.core.routing import HyperSimplifiedRoutingProcedure
 import models.core.variables as variables
 from models.coreimp.commonKernels import GaussianKernel
+from models.util.shapes import dynamic_shape
 
 
 class NiNRouting(HyperSimplifiedRoutingProcedure):
@@ -22,6 +24,7 @@ class NiNRouting(HyperSimplifiedRoutingProcedure):
             normalization=tf.nn.softmax,
             verbose=False,
             rate=0.5,
+            fused=False,
             train=False):
         self._activation_layers = activation_layers
         self._compatibility_layers = compatibility_layers
@@ -34,6 +37,7 @@ class NiNRouting(HyperSimplifiedRoutingProcedure):
             verbose=verbose,
             bias=bias,
             epsilon=epsilon,
+            fused=fused,
             normalization=normalization)
 
     def _compatibility(self, s, r, votes, poses, probabilities, activations, it):
@@ -43,15 +47,20 @@ class NiNRouting(HyperSimplifiedRoutingProcedure):
         ## r :: { batch, output_atoms, new_w , new_h, depth * np.prod(ksizes) }
 
         vshape = votes.shape.as_list()
+        ## the batch may only be known at run time.
+        dshape = dynamic_shape(votes)
         # s :: {degree}
 
-        votes_flatten = tf.reshape(votes, shape=vshape[:-2] + [-1])
+        votes_flatten = tf.reshape(votes, shape=dshape[:-2] + [int(np.prod(vshape[-2:]))])
 
-        activations_flatten = tf.reshape(activations, shape=vshape[:-2] + [-1])
+        activations = self._expand_activations(activations, votes)
+
+        activations_flatten = tf.reshape(activations, shape=dshape[:-2] + [1])
 
         capsule_flatten = tf.concat([votes_flatten, activations_flatten], axis=-1)
 
-        local_capsules_flatten = tf.reshape(capsule_flatten, shape=vshape[:-3] + [-1])
+        local_capsules_flatten = tf.reshape(
+            capsule_flatten, shape=dshape[:-3] + [int(np.prod(capsule_flatten.shape.as_list()[-2:]))])
 
         batched_features = tf.reshape(local_capsules_flatten, [-1, local_capsules_flatten.shape.as_list()[-1]])
 
@@ -63,6 +72,7 @@ class NiNRouting(HyperSimplifiedRoutingProcedure):
                         units=layer_num,
                         activation=tf.nn.relu,
                         _reuse=tf.compat.v1.AUTO_REUSE,
+                        dtype=variables.policy(),
                         name="l_" + str(counter)
                     )(batched_features),
                     training=self._train
@@ -75,13 +85,14 @@ class NiNRouting(HyperSimplifiedRoutingProcedure):
                     units=vshape[-3],
                     activation=None,
                     _reuse=tf.compat.v1.AUTO_REUSE,
+                    dtype=variables.policy(),
                     name="l_final")(batched_features),
                 training=self._train
             )
 
         ## output -> [h, r]
 
-        r = tf.reshape(r, shape= vshape[:-2] + [1,1])
+        r = tf.reshape(r, shape= dshape[:-2] + [1,1])
 
         # print(" r :" + str(r.shape))
 
@@ -92,9 +103,7 @@ class NiNRouting(HyperSimplifiedRoutingProcedure):
         ## votes :: { batch, output_atoms, new_w, new_h, depth * np.prod(ksizes) } + repdim
         ## c :: { batch, output_atoms, new_w , new_h, depth * np.prod(ksizes) }
 
-        poses_tiled = tf.tile(poses, [1, 1, 1, 1, self.atoms, 1, 1])
-
-        self._agreement = GaussianKernel().take(poses_tiled, votes)
+        self._agreement = GaussianKernel().take(self._parent_poses(poses), votes)
 
         raw = tf.reduce_sum(tf.multiply(c, self._agreement), axis=-3, keepdims=True)
 
@@ -2,9 +2,12 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import numpy as np
 import tensorflow as tf
 
 from models.core.routing import SimplifiedRoutingProcedure
+import models.core.variables as variables
+from models.util.shapes import dynamic_shape
 
 
 class RNNRouting(SimplifiedRoutingProcedure):
@@ -44,11 +47,14 @@ class RNNRouting(SimplifiedRoutingProcedure):
         ## r :: { batch, output_atoms, new_w , new_h, depth * np.prod(ksizes) }
 
         vshape = votes.shape.as_list()
+        ## the batch may only be known at run time.
+        dshape = dynamic_shape(votes)
+        pose_size = int(np.prod(vshape[-2:]))
         # s :: {degree}
 
         poses_tiled = tf.tile(poses, [1, 1, 1, 1, vshape[4], 1, 1])
-        poses_concat = tf.reshape(poses_tiled, poses_tiled.shape.as_list()[:-2]+[1]+[-1])
-        votes_concat = tf.reshape(votes, votes.shape.as_list()[:-2]+[1]+[-1])
+        poses_concat = tf.reshape(poses_tiled, dshape[:-2]+[1]+[pose_size])
+        votes_concat = tf.reshape(votes, dshape[:-2]+[1]+[pose_size])
 
         #s_tile = tf.tile(s, [1, 1, 1, 1, vshape[4], 1])
 
@@ -56,6 +62,8 @@ class RNNRouting(SimplifiedRoutingProcedure):
 
         #  concat( h : mu: a: v : r)(degree + 16 + 1 + 16 + 1 )
 
+        activations = self._expand_activations(activations, votes)
+
         stacked_values = tf.concat([poses_concat, activations, votes_concat, r], axis=-1)
 
         flatten_stacked_values = tf.reshape(stacked_values, [-1, stacked_values.shape.as_list()[-1]] )
@@ -65,8 +73,8 @@ class RNNRouting(SimplifiedRoutingProcedure):
         if s is None:
             s = self._cell.get_initial_state(
                 inputs=inl,
-                batch_size=inl.shape.as_list()[0],
-                dtype=tf.float32)
+                batch_size=dynamic_shape(inl)[0],
+                dtype=inl.dtype)
 
         out, s = self._cell(
             inputs=inl,
@@ -81,6 +89,7 @@ class RNNRouting(SimplifiedRoutingProcedure):
                     units=layer_num,
                     activation=tf.nn.relu,
                     _reuse=tf.compat.v1.AUTO_REUSE,
+                    dtype=variables.policy(),
                     name="l_" + str(counter)
                 )(feature_map)
             ## apply nn
@@ -91,27 +100,28 @@ class RNNRouting(SimplifiedRoutingProcedure):
                 units=1,
                 activation=None,
                 _reuse=tf.compat.v1.AUTO_REUSE,
+                dtype=variables.policy(),
                 name="l_final"
             )(feature_map)
 
-        r = tf.reshape(outl, vshape[0:5]+[1,1])
+        r = tf.reshape(outl, dshape[0:5]+[1,1])
 
         # final
 
         ## s :: { batch, output_atoms, new_w , new_h, depth * np.prod(ksizes), degree }
         ## r :: { batch, output_atoms, new_w , new_h, depth * np.prod(ksizes), 1 }
-        c = self._normalization(r, axis=4)
+        c = self._normalize(r, axis=4)
 
         return c, s
 
 
     def _activation(self, s, c, votes, poses, activations):
      ## votes :: { batch, output_atoms, new_w, new_h, depth * np.prod(ksizes) } + repdim
-        vshape = votes.shape.as_list()
+        dshape = dynamic_shape(votes)
 
         degree = s[0].shape[-1]
 
-        new_c = tf.reshape(s[1], vshape[0:-2]+[1,degree])
+        new_c = tf.reshape(s[1], dshape[0:-2]+[1,degree])
 
         combined_c = tf.reduce_sum(new_c * c, axis=-3, keepdims=True)
 
@@ -126,6 +136,7 @@ class RNNRouting(SimplifiedRoutingProcedure):
                     units=layer_num,
                     activation=tf.nn.relu,
                     _reuse=tf.compat.v1.AUTO_REUSE,
+                    dtype=variables.policy(),
                     name="l_" + str(counter)
                 )(inl)
             ## apply nn
@@ -137,6 +148,7 @@ class RNNRouting(SimplifiedRoutingProcedure):
                     units=1,
                     name="l_final",
                     _reuse=tf.compat.v1.AUTO_REUSE,
+                    dtype=variables.policy(),
                     activation=tf.nn.sigmoid
                 )(inl)
         else :
@@ -148,6 +160,6 @@ class RNNRouting(SimplifiedRoutingProcedure):
 
 
         ## activation :: { batch, output_atoms, new_w, new_h, 1 }
-        activation = tf.reshape(outl,vshape[:-3]+[1,1,1])
+        activation = tf.reshape(outl,dshape[:-3]+[1,1,1])
 
         return activation ## batch , out , w, h, 1, 1
@@ -2,6 +2,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import functools
+
 import numpy as np
 import tensorflow as tf
 
@@ -10,6 +12,66 @@ from ..core.transform import Transform
 from ..coreimp.commonMetrics import Frobenius
 
 
+@functools.lru_cache(maxsize=64)
+def _patch_indices(shape, ksizes, strides, padding):
+    """ index map of the receptive fields of a layer configuration.
+
+        shape is the { w, h } of the input. Returns the paddings of the input
+        and, for every patch, the flat indices of its children in the padded
+        { w * h } grid, ordered as tf.extract_image_patches orders them.
+    """
+    paddings = [[0, 0]]
+    patches = []
+
+    for n, k, s in zip(shape, ksizes[1:3], strides[1:3]):
+        if padding == "SAME":
+            m = -(-n // s)
+            total = max((m - 1) * s + k - n, 0)
+            paddings.append([total // 2, total - total // 2])
+        else:
+            m = (n - k) // s + 1
+            paddings.append([0, 0])
+        patches.append(m)
+
+    padded_h = shape[1] + sum(paddings[2])
+
+    rows = np.arange(patches[0])[:, None, None, None] * strides[1] + np.arange(ksizes[1])[None, None, :, None]
+    cols = np.arange(patches[1])[None, :, None, None] * strides[2] + np.arange(ksizes[2])[None, None, None, :]
+
+    indices = (rows * padded_h + cols).reshape(patches + [ksizes[1] * ksizes[2]]).astype(np.int32)
+    ## the cached map is shared between layers.
+    indices.setflags(write=False)
+
+    return paddings, indices
+
+
+@functools.lru_cache(maxsize=64)
+def _coordinate_factor(shape, representation_dim):
+    """ coordinate addition offsets of poses with the given { w, h, depth }.
+
+        the i-th pose entry of every capsule is offset by its scaled
+        coordinate along the i-th dimension, the remaining entries are 0.
+    """
+    d = len(shape)
+
+    assert d <= np.prod(representation_dim), \
+        " representation must have an entry for each coordinate"
+
+    coordinate_factor = np.zeros(list(shape) + [int(np.prod(representation_dim))], dtype=np.float32)
+
+    for index, n in enumerate(shape):
+        offset_shape = [1] * d
+        offset_shape[index] = n
+
+        coordinate_factor[..., index] = ((np.arange(n, dtype=np.float32) + 0.50) / n).reshape(offset_shape)
+
+    coordinate_factor = coordinate_factor.reshape([1] + list(shape) + list(representation_dim))
+    ## the cached factor is shared between layers.
+    coordinate_factor.setflags(write=False)
+
+    return coordinate_factor
+
+
 class CapsuleLayer(object):
     def __init__(
             self,
@@ -30,6 +92,7 @@ class CapsuleLayer(object):
         self._padding = padding
         self.name = name
         self._representation_dim = []
+        self.iteration_count = iterations
         self.activate = activate
         self._coordinate_addition = coordinate_addition
 
@@ -48,53 +111,55 @@ class CapsuleLayer(object):
         assert (padding is "VALID" or padding is "SAME"), \
             " padding must be VALID or SAME"
 
+    @property
+    def routing(self):
+        ## the routing procedure, to switch its iteration mode before building.
+        return self._routing
+
     def _receptivefield(self, input_tensor):
         ##  input_tensor == {  batch, w , h , depth } + repdim , {batch, w, h,  depth }
 
         poses, activations = input_tensor
 
         poses_shape = poses.shape.as_list()
+        pose_size = int(np.prod(self._representation_dim))
 
-        poses = tf.transpose(poses, [0, 4, 5, 1, 2, 3])
-        ## poses = { batch } + repdim + { w , h , depth }
+        children = tf.concat([
+                tf.reshape(poses, [-1] + poses_shape[1:4] + [pose_size]),
+                tf.squeeze(activations, axis=[-1])
+            ],
+            axis=-1
+        )
+        ## children { batch, w, h, depth, np.prod(repdim) + 1 }
 
-        condensed_poses = tf.reshape(poses,
-                                     shape=[-1, np.prod(self._representation_dim)] + poses_shape[1:4])
-        ## condensed_poses = { batch, np.prod(repdim), w , h, depth }
+        paddings, indices = _patch_indices(
+            tuple(poses_shape[1:3]),
+            tuple(self._ksizes),
+            tuple(self._strides),
+            self._padding)
+        ## indices { new_w, new_h, np.prod(ksizes) }
 
+        children = tf.pad(children, paddings + [[0, 0], [0, 0]])
+        children_shape = children.shape.as_list()
 
-        patched_poses = tf.extract_volume_patches(
-            condensed_poses,
-            ksizes=[self._ksizes[0], 1] + self._ksizes[1:],
-            strides=[self._strides[0], 1] + self._strides[1:],
-            padding=self._padding,
-        )
+        children = tf.reshape(children, [-1, children_shape[1] * children_shape[2]] + children_shape[3:])
+        ## children { batch, padded_w * padded_h, depth, np.prod(repdim) + 1 }
 
-        patched_activations = tf.compat.v1.extract_image_patches(
-            tf.squeeze(activations, axis=[-2,-1]),
-            sizes=self._ksizes,
-            strides=self._strides,
-            padding=self._padding,
-            rates=[1, 1, 1, 1]
-        )
-        ## patched_poses { batch, np.prod(repdim), new_w , new_h, depth * np.prod(ksizes) }
-        ## patched_activations { batch, new_w , new_h, depth * np.prod(ksizes) }
+        patches = tf.gather(children, indices, axis=1)
+        ## patches { batch, new_w , new_h, np.prod(ksizes), depth, np.prod(repdim) + 1 }
 
-        patched_poses = tf.transpose(patched_poses, [0, 2, 3, 4, 1])
+        patches = tf.reshape(patches, [-1] + list(indices.shape[:2]) + [indices.shape[2] * poses_shape[3], pose_size + 1])
 
-        ## patched_poses { batch, new_w , new_h, depth * np.prod(ksizes), np.prod(repdim) }
-        patched_poses_shape = patched_poses.shape.as_list()
+        patched_poses, patched_activations = tf.split(patches, [pose_size, 1], axis=-1)
 
-        patched_poses = tf.reshape(patched_poses, [-1] + patched_poses_shape[1:4] + self._representation_dim)
+        patched_poses = tf.reshape(patched_poses, [-1] + list(indices.shape[:2]) + [indices.shape[2] * poses_shape[3]] + self._representation_dim)
         ## patched_poses { batch, new_w , new_h, depth * np.prod(ksizes)} + repdim }
 
-        patched_activations = tf.expand_dims(
-            tf.expand_dims(
-                patched_activations,
-                axis=-1
-            ),
-            axis=-1
-        )
+        if self._coordinate_addition:
+            patched_poses = patched_poses + self._coordinate_factor(patched_poses.shape.as_list()[1:4], patched_poses.dtype)
+
+        patched_activations = tf.expand_dims(patched_activations, axis=-1)
+        ## patched_activations { batch, new_w , new_h, depth * np.prod(ksizes), 1, 1 }
 
         return patched_poses, patched_activations
 
@@ -147,9 +212,6 @@ class CapsuleLayer(object):
             ## poses { batch, new_w , new_h, depth * np.prod(ksizes)} + repdim
             ## activations { batch, new_w , new_h, depth * np.prod(ksizes) }
 
-            if self._coordinate_addition :
-                poses = poses + self._coordinate_factor(poses.shape.as_list()[1:4])
-
             votes, activations = self._transform.translate(poses, activations)
 
             """
@@ -164,6 +226,9 @@ class CapsuleLayer(object):
                 iterations=self._iterations
             )
 
+            ## a feedable tensor when the routing runs symbolic iterations.
+            self.iteration_count = self._routing.iteration_count
+
             """
                 determines the pose and activation of the output capsules.
             """
@@ -185,49 +250,12 @@ class CapsuleLayer(object):
 
             return higher_poses, higher_activations
 
-    def _coordinate_factor(self, shape):
-        def coordinate_dimension_offset(representation_dim, index, n, d):
-
-            assert (0 <= index < d), \
-                " index must be a valid index"
-
-            shape = [1] * d
-            shape[index] = n
-
-            coordinate_offset_nn = tf.reshape(
-                (tf.range(n, dtype=tf.float32) + 0.50) / n, shape
-            )
-
-            coordinate_offset_n0 = tf.constant(
-                0.0, shape=shape, dtype=tf.float32
-            )
-
-            tensor_list = []
-
-            for i in range(d):
-                if i == index:
-                    tensor_list.append(coordinate_offset_nn)
-                else:
-                    tensor_list.append(coordinate_offset_n0)
-
-            coordinate_offset = tf.stack(
-                tensor_list + [coordinate_offset_n0 for _ in range(np.prod(representation_dim) - d)],
-                axis=-1
-            )
-
-            return coordinate_offset
-
-        d = len(shape)
-
-        raw_coordinate_factor = coordinate_dimension_offset(self._representation_dim, 0, shape[0], d)
-
-        for idx in range(d)[1:]:
-            raw_coordinate_factor = raw_coordinate_factor + \
-                coordinate_dimension_offset(self._representation_dim,idx, shape[idx], d)
-
-        coordinate_factor = tf.reshape(raw_coordinate_factor, [1] + shape + self._representation_dim)
-
-        return coordinate_factor
+    def _coordinate_factor(self, shape, dtype=tf.float32):
+        ## shape :: { w, h, depth } of the poses the factor is added to.
+        return tf.constant(
+            _coordinate_factor(tuple(shape), tuple(self._representation_dim)),
+            dtype=dtype,
+            name="coordinate_factor")
 
 
 class FullyConnectedCapsuleLayer(CapsuleLayer):
@@ -257,10 +285,12 @@ class FullyConnectedCapsuleLayer(CapsuleLayer):
 
         if self._ff_coordinate_addition :
             self._representation_dim = input_tensor[0].shape.as_list()[4:]
-            poses = poses + self._coordinate_factor(poses.shape.as_list()[1:4])
+            poses = poses + self._coordinate_factor(poses.shape.as_list()[1:4], poses.dtype)
 
-        poses = tf.reshape(poses, [poses.shape[0], 1, 1, -1] + poses.shape.as_list()[4:])
-        activations = tf.reshape(activations, [poses.shape[0], 1, 1, -1, 1, 1])
+        ## the batch is the unknown dimension, the children are counted statically.
+        children = int(np.prod(poses.shape.as_list()[1:4]))
+        poses = tf.reshape(poses, [-1, 1, 1, children] + poses.shape.as_list()[4:])
+        activations = tf.reshape(activations, [-1, 1, 1, children, 1, 1])
 
         return super(FullyConnectedCapsuleLayer, self).inference((poses, activations))
 
@@ -280,8 +310,9 @@ class CapsuleClassLayer(object):
         with tf.compat.v1.variable_scope('toClassLayer/' + self.name,reuse=tf.compat.v1.AUTO_REUSE) as scope:
             poses, activations = input_tensor
 
-            poses = tf.reshape(poses, [poses.shape[0], -1] + poses.shape.as_list()[4:])
-            activations = tf.reshape(activations, [poses.shape[0], -1])
+            classes = int(np.prod(poses.shape.as_list()[1:4]))
+            poses = tf.reshape(poses, [-1, classes] + poses.shape.as_list()[4:])
+            activations = tf.reshape(activations, [-1, classes])
 
             if self._normalized:
                 activations = tf.nn.softmax(activations, axis=-1)
@@ -304,26 +335,17 @@ class PrimaryCapsuleLayer(object):
         self._groups = groups
         self._metric = metric
         self._epsilon = epsilon
+        self._convolutions = None
 
     def inference(self, input_tensor):
         ## input_tensor == {batch, w, h, depth}
         with tf.compat.v1.variable_scope('PrimaryCapsuleLayer/', reuse=tf.compat.v1.AUTO_REUSE):
-            conv_pose = tf.keras.layers.Conv2D(
-                filters=np.prod(self._pose_dim) * self._groups,
-                kernel_size=self._ksize,
-                activation='relu',
-                use_bias=True,
-                padding="SAME"
-            )
+            ## keras layers ignore the variable scope reuse, every tower
+            ## calls the same convolutions instead.
+            if self._convolutions is None:
+                self._convolutions = self._build()
 
-            conv_activation = tf.keras.layers.Conv2D(
-                filters=self._groups,
-                kernel_size=self._ksize,
-                activation='sigmoid',
-                use_bias=True,
-                padding="SAME",
-                bias_initializer=tf.compat.v1.initializers.truncated_normal(mean=0.8, stddev=0.1)
-            )
+            conv_pose, conv_activation = self._convolutions
 
             raw_poses = conv_pose(input_tensor)
 
@@ -336,7 +358,7 @@ class PrimaryCapsuleLayer(object):
                 shape=[-1] + raw_poses_shape[1:3] + [self._groups] + self._pose_dim
             )
 
-            activations = tf.reshape(activations, shape=list(activations.shape)+[1,1])
+            activations = tf.reshape(activations, shape=[-1] + activations.shape.as_list()[1:] + [1, 1])
 
             ## pose == {batch, w, h, capsule_groups} + pose_dim
             ## activation == {batch, w, h, capsule_groups}
@@ -344,3 +366,23 @@ class PrimaryCapsuleLayer(object):
             poses = poses / (self._metric.take(poses) + self._epsilon)
 
             return poses, activations
+
+    def _build(self):
+        conv_pose = tf.keras.layers.Conv2D(
+            filters=np.prod(self._pose_dim) * self._groups,
+            kernel_size=self._ksize,
+            activation='relu',
+            use_bias=True,
+            padding="SAME"
+        )
+
+        conv_activation = tf.keras.layers.Conv2D(
+            filters=self._groups,
+            kernel_size=self._ksize,
+            activation='sigmoid',
+            use_bias=True,
+            padding="SAME",
+            bias_initializer=tf.compat.v1.initializers.truncated_normal(mean=0.8, stddev=0.1)
+        )
+
+        return conv_pose, conv_activation
@@ -0,0 +1,31 @@
+import numpy as np
+import tensorflow as tf
+
+from models.util.contraction import contract
+
+tf.compat.v1.enable_eager_execution()
+
+rng = np.random.RandomState(0)
+
+cases = [
+    ## pose aggregation
+    ("bowhitl,bowhiuv->bowhtuv", [(4, 5, 3, 3, 72, 1, 1), (4, 5, 3, 3, 72, 4, 4)]),
+    ## equivariant transform
+    ("aocduik,bwhukj->bowhuij", [(1, 16, 1, 1, 72, 4, 4), (4, 3, 3, 72, 4, 4)]),
+    ## output capsules become depth
+    ("bowhlij->bwhoij", [(4, 10, 3, 2, 1, 4, 4)]),
+    ("abc->ac", [(2, 3, 4)]),
+    ("ij,jk,kl->il", [(2, 3), (3, 4), (4, 5)]),
+]
+
+for spec, shapes in cases:
+    operands = [rng.randn(*shape).astype(np.float32) for shape in shapes]
+
+    result = contract(spec, *[tf.constant(x) for x in operands])
+    expected = np.einsum(spec, *operands)
+
+    print(spec)
+    print("got " + str(result.shape))
+    print("should have been " + str(expected.shape))
+    assert np.allclose(result.numpy(), expected, atol=1e-4), \
+        " contraction must match einsum. "
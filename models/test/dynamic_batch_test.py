@@ -0,0 +1,124 @@
+import os
+import tempfile
+from argparse import Namespace
+
+import numpy as np
+import tensorflow as tf
+
+from benchmarks.routing_memory import SETUPS
+from models.capsulemodel import CapsuleModel
+from models.coreimp.commonMetrics import Frobenius
+from models.coreimp.ninRouting import NiNRouting
+
+batch = 8
+partial = 3
+
+rng = np.random.RandomState(0)
+images_value = rng.rand(batch, 28 * 28).astype(np.float32)
+
+config = tf.compat.v1.ConfigProto(allow_soft_placement=True)
+
+
+def hyperparameters(model):
+    ## verbose, the summaries and inspection tensors also see the unknown batch.
+    hparams = Namespace(**{
+        "model": model,
+        "dataset": "mnist",
+        "batch_size": batch,
+        "learning_rate": 0.001,
+        "max_steps": 1000,
+        "num_classes": 10,
+        "loss_type": "margin",
+        "remake": False,
+        "verbose": True,
+        "regulizer_constant": 0.0,
+        "bn_train": False,
+        "degree": 16,
+        "top_k": None,
+        "precision": "float32",
+        "train": False,
+    })
+    return SETUPS[model](hparams)
+
+
+def logits(model, batch_size):
+    images = tf.compat.v1.placeholder(tf.float32, [batch_size, 28 * 28], name="images")
+    features = {
+        "images": images,
+        "height": 28,
+        "width": 28,
+        "depth": 1,
+        "num_targets": 1,
+        "num_classes": 10,
+    }
+    return images, CapsuleModel(hyperparameters(model), inference_only=True).inference(features).logits
+
+
+## KernelNet and the RNNRouting layers of CapsMLP, static graph first.
+for model in ["KernelNet", "CapsMLP"]:
+    checkpoint = os.path.join(tempfile.mkdtemp(), "model.ckpt")
+
+    with tf.Graph().as_default():
+        images, static_logits = logits(model, batch)
+        with tf.compat.v1.Session(config=config) as session:
+            session.run(tf.compat.v1.global_variables_initializer())
+            expected = session.run(static_logits, feed_dict={images: images_value})
+            tf.compat.v1.train.Saver().save(session, checkpoint)
+
+    ## one graph, restored from the static one, scores both batch sizes.
+    with tf.Graph().as_default():
+        images, dynamic_logits = logits(model, None)
+        print("got " + str(dynamic_logits.shape.as_list()))
+        print("should have been " + str([None, 10]))
+        assert dynamic_logits.shape.as_list() == [None, 10]
+
+        with tf.compat.v1.Session(config=config) as session:
+            tf.compat.v1.train.Saver().restore(session, checkpoint)
+            for size in [batch, partial]:
+                got = session.run(dynamic_logits, feed_dict={images: images_value[:size]})
+                diff = np.max(np.abs(got - expected[:size]))
+                print("got " + str(diff) + " for " + model + " at batch " + str(size))
+                print("should have been ~" + str(0.0))
+                assert got.shape == (size, 10)
+                assert diff < 1e-4, " dynamic batch logits must match the static graph. "
+
+
+## NiNRouting, the same router on a static and on an unknown batch.
+w = 3
+h = 3
+depth = 9
+representation_dim = [4, 4]
+atoms = 4
+
+with tf.Graph().as_default():
+    votes_value = rng.randn(batch, atoms, w, h, depth, *representation_dim).astype(np.float32)
+    activations_value = rng.rand(batch, atoms, w, h, depth, 1, 1).astype(np.float32)
+
+    outputs = []
+    for batch_size in [batch, None]:
+        votes = tf.compat.v1.placeholder_with_default(
+            votes_value, [batch_size, atoms, w, h, depth] + representation_dim)
+        activations = tf.compat.v1.placeholder_with_default(
+            activations_value, [batch_size, atoms, w, h, depth, 1, 1])
+        ## same name, so both routers share their variables.
+        r = NiNRouting(
+            metric=Frobenius(),
+            activation_layers=[16],
+            compatibility_layers=[16],
+            name="dynamic",
+            verbose=True)
+        outputs.append((votes, activations, r.fit(votes, activations)))
+
+    (_, _, static), (votes, activations, dynamic) = outputs
+
+    with tf.compat.v1.Session(config=config) as session:
+        session.run(tf.compat.v1.global_variables_initializer())
+        expected = session.run(static)
+
+        for size in [batch, partial]:
+            got = session.run(dynamic, feed_dict={
+                votes: votes_value[:size], activations: activations_value[:size]})
+            diff = max(np.max(np.abs(a - b[:size])) for a, b in zip(got, expected))
+            print("got " + str(diff) + " for NiNRouting at batch " + str(size))
+            print("should have been ~" + str(0.0))
+            assert diff < 1e-4, " dynamic batch routing must match the static one. "
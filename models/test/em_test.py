@@ -37,4 +37,17 @@ print("got " + str(high_poses.shape))
 print("should have been " + str([batch, w, h, atoms] + representation_dim))
 
 print("got " + str(high_activations.shape))
-print("should have been " + str([batch, w, h, atoms]))
\ No newline at end of file
+print("should have been " + str([batch, w, h, atoms]))
+
+## widely spread votes underflow the gaussian likelihood outside the log domain
+votes = 40 * tf.random.normal([batch, atoms, w, h, depth] + representation_dim, seed=0)
+
+with tf.GradientTape() as tape:
+    tape.watch(votes)
+    high_poses, high_activations = r.fit(votes, activations)
+    loss = tf.reduce_sum(high_poses) + tf.reduce_sum(high_activations)
+
+grads = tape.gradient(loss, votes)
+print("got " + str(bool(tf.reduce_all(tf.math.is_finite(grads)))))
+print("should have been " + str(True))
+assert tf.reduce_all(tf.math.is_finite(grads)), " em routing gradients must be finite. "
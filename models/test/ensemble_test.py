@@ -0,0 +1,46 @@
+import os
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from models.core.ensemble import Ensemble
+
+directory = tempfile.mkdtemp()
+rng = np.random.RandomState(0)
+images_value = rng.randn(4, 3).astype(np.float32)
+
+
+def build(features):
+    w = tf.compat.v1.get_variable("w", [3, 2])
+    b = tf.compat.v1.get_variable("b", [2])
+    ## a loop like the routing iterations.
+    _, logits = tf.while_loop(
+        lambda i, x: i < 3,
+        lambda i, x: (i + 1, tf.tanh(x)),
+        [0, tf.matmul(features["images"], w) + b])
+    return logits
+
+
+checkpoints = []
+expected = 0
+with tf.Graph().as_default():
+    logits = build({"images": tf.constant(images_value)})
+    saver = tf.compat.v1.train.Saver()
+    with tf.compat.v1.Session() as session:
+        for member in range(3):
+            session.run(tf.compat.v1.global_variables_initializer())
+            checkpoints.append(saver.save(session, os.path.join(directory, "model.ckpt"), global_step=member))
+            expected += session.run(logits)
+
+with tf.Graph().as_default():
+    images = tf.constant(images_value)
+    ensemble = Ensemble(build, {"images": images, "height": 1}, checkpoints)
+
+    with tf.compat.v1.Session() as session:
+        ensemble.load(session)
+        summed = session.run(ensemble.logits)
+
+print("got " + str(summed))
+print("should have been " + str(expected))
+assert np.allclose(summed, expected, atol=1e-5), " ensemble logits differ from the sum of the members. "
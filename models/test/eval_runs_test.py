@@ -0,0 +1,79 @@
+import sys
+import tempfile
+from argparse import Namespace
+
+import numpy as np
+import tensorflow as tf
+
+## experiment parses the command line when it is imported.
+sys.argv = sys.argv[:1]
+import experiment
+from benchmarks.input_pipeline import write_mnist
+from models.core import variables
+
+towers = 2
+
+data_dir = tempfile.mkdtemp()
+write_mnist(data_dir, 16)
+
+rng = np.random.RandomState(0)
+weights_value = rng.rand(28 * 28).astype(np.float32)
+
+
+class Fingerprint(object):
+    """Scores every example with a fingerprint of its image, the sums of the
+    fingerprints and of their squares tell which examples a run scored.
+    """
+
+    def metrics(self, features):
+        images = tf.reshape(features['images'], [-1, 28 * 28])
+        fingerprints = tf.reduce_sum(images * weights_value, axis=1)
+        return None, tf.reduce_sum(fingerprints), tf.reduce_sum(tf.square(fingerprints))
+
+
+def scored(eval_size, eval_batch_size, num_gpus, eval_steps_per_run=10):
+    hparams = Namespace(batch_size=8, eval_batch_size=eval_batch_size,
+                        eval_steps_per_run=eval_steps_per_run)
+    variables.set_placement(tower_device='/cpu:%d')
+
+    with tf.Graph().as_default():
+        results, runs = experiment.build_eval_runs(
+            hparams, Fingerprint(), num_gpus, eval_size, data_dir, 1, 'mnist', False)
+
+        ## every example once, also on the second pass over the split.
+        config = tf.compat.v1.ConfigProto(device_count={'CPU': towers},
+                                          allow_soft_placement=True)
+        passes = []
+        with tf.compat.v1.Session(config=config) as session:
+            for _ in range(2):
+                totals = np.zeros(3)
+                for result, result_runs in zip(results, runs):
+                    for _ in range(result_runs):
+                        totals += session.run(result)
+                passes.append(totals)
+
+    variables.set_placement()
+
+    return passes
+
+
+def expected(eval_size):
+    with tf.Graph().as_default():
+        features = experiment.get_features('test', eval_size, 1, data_dir, 1, 'mnist',
+                                           examples=eval_size)[0]
+        with tf.compat.v1.Session() as session:
+            images = session.run(features['images']).reshape(eval_size, -1)
+    fingerprints = images @ weights_value
+    return np.array([fingerprints.sum(), np.square(fingerprints).sum(), eval_size])
+
+
+for eval_size, eval_batch_size, num_gpus, eval_steps_per_run in [
+        (10, 4, 2, 10), (13, 4, 2, 2), (16, 4, 2, 2), (3, 4, 2, 10), (13, 4, 1, 2)]:
+    reference = expected(eval_size)
+    for totals in scored(eval_size, eval_batch_size, num_gpus, eval_steps_per_run):
+        print("got " + str(totals) + " for " + str(eval_size) + " examples on "
+              + str(num_gpus) + " towers")
+        print("should have been " + str(reference))
+        assert totals[2] == eval_size, " every example must be scored once. "
+        assert np.allclose(totals, reference, rtol=1e-5), \
+            " every tower must score its own examples. "
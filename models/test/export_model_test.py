@@ -0,0 +1,59 @@
+import os
+import sys
+import tempfile
+from argparse import Namespace
+
+import numpy as np
+import tensorflow as tf
+
+## experiment parses the command line when it is imported.
+sys.argv = sys.argv[:1]
+import experiment
+from models.convmodel import ConvModel
+from models.core import export
+
+summary_dir = tempfile.mkdtemp()
+export_dir = os.path.join(tempfile.mkdtemp(), "export")
+
+hparams = Namespace(**{
+    "model": "ConvNet",
+    "dataset": "cifar10",
+    "batch_size": 4,
+    "learning_rate": 0.001,
+    "max_steps": 1000,
+    "loss_type": "softmax",
+    "remake": False,
+    "verbose": False,
+    "regulizer_constant": 0.0,
+})
+
+## a depth 3 batch, channels first as the cifar10 reader emits it.
+images_value = np.random.RandomState(0).rand(4, 3, 24, 24).astype(np.float32)
+
+with tf.Graph().as_default():
+    features = dict(experiment.SERVING_FEATURES["cifar10"], num_targets=1)
+    features["images"] = tf.constant(images_value)
+    logits = ConvModel(hparams, inference_only=True).inference(features).logits
+
+    with tf.compat.v1.Session() as session:
+        session.run(tf.compat.v1.global_variables_initializer())
+        expected = session.run(logits)
+
+        os.makedirs(os.path.join(summary_dir, "train", "ConvNet"))
+        checkpoint = os.path.join(summary_dir, "train", "ConvNet", "model.ckpt")
+        tf.compat.v1.train.Saver().save(session, checkpoint, global_step=0)
+
+experiment.export_model(hparams, summary_dir, "ConvNet", 1, "cifar10", None, export_dir)
+
+with tf.Graph().as_default():
+    with tf.compat.v1.Session() as session:
+        inputs, outputs = export.load(session, export_dir)
+        exported = session.run(outputs["logits"], feed_dict={inputs["images"]: images_value})
+
+print("got " + str(inputs["images"].shape.as_list()))
+print("should have been " + str([None, 3, 24, 24]))
+assert inputs["images"].shape.as_list() == [None, 3, 24, 24], " the signature must be channels first. "
+
+print("got " + str(exported))
+print("should have been " + str(expected))
+assert np.allclose(exported, expected, atol=1e-5), " exported logits differ from the restored model. "
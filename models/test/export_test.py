@@ -0,0 +1,48 @@
+import os
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from models.core import export
+
+directory = os.path.join(tempfile.mkdtemp(), "export")
+rng = np.random.RandomState(0)
+images_value = rng.randn(4, 3).astype(np.float32)
+
+with tf.Graph().as_default():
+    images = tf.compat.v1.placeholder(tf.float32, [4, 3], name="images")
+    w = tf.compat.v1.get_variable("w", initializer=rng.randn(3, 2).astype(np.float32))
+    beta = tf.compat.v1.get_variable("beta", initializer=-rng.rand(2).astype(np.float32))
+
+    ## a normalised weight and an absolute routing parameter, both folded.
+    logits = tf.matmul(images, w / tf.norm(w, axis=0, keepdims=True))
+    for _ in range(3):
+        logits = tf.tanh(logits) * tf.abs(beta)
+    ## like the iteration count of symbolic routing, fixed to its default.
+    iterations = tf.compat.v1.placeholder_with_default(3, shape=[], name="iterations") + 0
+
+    with tf.compat.v1.Session() as session:
+        session.run(tf.compat.v1.global_variables_initializer())
+        expected = session.run(logits, feed_dict={images: images_value})
+        frozen, folded = export.export(
+            session, directory, {"images": images}, {"logits": logits, "iterations": iterations})
+
+print("got " + str(folded) + " nodes after folding")
+print("should have been less than " + str(frozen))
+assert folded < frozen
+
+with tf.Graph().as_default():
+    with tf.compat.v1.Session() as session:
+        inputs, outputs = export.load(session, directory)
+        exported, exported_iterations = session.run(
+            [outputs["logits"], outputs["iterations"]], feed_dict={inputs["images"]: images_value})
+        ops = set(op.type for op in session.graph.get_operations())
+
+print("got " + str(exported))
+print("should have been " + str(expected))
+assert np.allclose(exported, expected, atol=1e-5), " exported logits differ from the restored model. "
+assert exported_iterations == 3
+
+for op in ("VarHandleOp", "VariableV2", "PlaceholderWithDefault", "Abs", "Norm", "Sqrt"):
+    assert op not in ops, " {} was not folded. ".format(op)
@@ -0,0 +1,50 @@
+import numpy as np
+import tensorflow as tf
+
+from models.coreimp.commonKernels import DotProd, GaussianKernel
+from models.coreimp.commonMetrics import Frobenius
+from models.coreimp.kernelRouting import KernelRouting
+from models.coreimp.kernelmix import MonoKernelMix
+
+batch = 8
+w = 3
+h = 3
+depth = 9
+representation_dim = [4, 4]
+atoms = 4
+
+rng = np.random.RandomState(0)
+
+with tf.Graph().as_default():
+    votes = tf.constant(
+        rng.randn(batch, atoms, w, h, depth, *representation_dim).astype(np.float32))
+    activations = tf.constant(
+        rng.rand(batch, atoms, w, h, depth, 1, 1).astype(np.float32))
+
+    results = []
+    for kernel in [DotProd(), MonoKernelMix(GaussianKernel(singular=False), 2)]:
+        outputs = []
+        for fused in [False, True]:
+            ## same name, so both routers share their variables.
+            r = KernelRouting(
+                kernel,
+                Frobenius(),
+                iterations=3,
+                name=kernel.name,
+                fused=fused)
+
+            high_poses, high_activations = r.fit(votes, activations)
+            grads = tf.gradients(
+                tf.reduce_sum(high_poses) + tf.reduce_sum(high_activations), [votes])
+
+            outputs.append([high_poses, high_activations] + grads)
+        results.append(outputs)
+
+    with tf.compat.v1.Session() as session:
+        session.run(tf.compat.v1.global_variables_initializer())
+
+        for tiled, fused in session.run(results):
+            diff = max(np.max(np.abs(a - b)) for a, b in zip(tiled, fused))
+            print("got " + str(diff))
+            print("should have been ~" + str(0.0))
+            assert diff < 1e-4, " fused routing must match the tiled routing."
@@ -0,0 +1,61 @@
+from argparse import Namespace
+
+import numpy as np
+import tensorflow as tf
+
+from models.convmodel import ConvModel
+
+hparams = Namespace(
+    model="ConvNet",
+    learning_rate=0.001,
+    max_steps=1000,
+    loss_type="softmax",
+    regulizer_constant=0.0,
+    remake=False,
+    verbose=False)
+
+rng = np.random.RandomState(0)
+features = {
+    "images": rng.rand(8, 1, 24, 24).astype(np.float32),
+    "labels": np.eye(10, dtype=np.float32)[rng.randint(10, size=8)],
+    "height": 24,
+    "width": 24,
+    "depth": 1,
+    "num_targets": 1,
+    "num_classes": 10,
+}
+
+
+def build(inference_only):
+    graph = tf.Graph()
+    with graph.as_default():
+        tf.compat.v1.set_random_seed(0)
+        feature = {name: tf.constant(value) if isinstance(value, np.ndarray) else value
+                   for name, value in features.items()}
+        model = ConvModel(hparams, inference_only=inference_only)
+        result, _, _ = model.multi_gpu([feature], 1)
+
+        config = tf.compat.v1.ConfigProto(allow_soft_placement=True)
+        with tf.compat.v1.Session(config=config) as session:
+            session.run(tf.compat.v1.global_variables_initializer())
+            correct = session.run(result.correct)
+
+    return graph, result, correct
+
+
+train_graph, train_result, train_correct = build(False)
+graph, result, correct = build(True)
+
+assert result.train_op is None and result.summary is None, " inference only models have no train or summary op. "
+
+names = [node.name for node in graph.as_graph_def().node]
+print("got " + str(len(names)) + " nodes")
+print("should have been fewer than " + str(len(train_graph.as_graph_def().node)))
+assert len(names) < len(train_graph.as_graph_def().node)
+assert not [name for name in names if "gradients" in name or "Adam" in name], \
+    " inference only graphs have no gradient or optimizer ops. "
+assert not graph.get_collection("losses") and not graph.get_collection(tf.compat.v1.GraphKeys.SUMMARIES)
+
+print("got " + str(correct))
+print("should have been " + str(train_correct))
+assert correct == train_correct
@@ -0,0 +1,58 @@
+import numpy as np
+import tensorflow as tf
+
+from models.core.inspection import FULL, OFF, SUMMARY
+from models.coreimp.commonKernels import DotProd
+from models.coreimp.commonMetrics import Frobenius
+from models.coreimp.kernelRouting import KernelRouting
+
+tf.compat.v1.enable_eager_execution()
+
+batch = 4
+w = 3
+h = 3
+depth = 9
+representation_dim = [4, 4]
+atoms = 4
+
+rng = np.random.RandomState(0)
+fits = [
+    (tf.constant(rng.randn(batch, atoms, w, h, depth, *representation_dim).astype(np.float32)),
+     tf.constant(rng.rand(batch, atoms, w, h, depth, 1, 1).astype(np.float32)))
+    for _ in range(3)
+]
+
+
+def inspected(level, steps=1):
+    r = KernelRouting(DotProd(), Frobenius(), iterations=3, name="inspection", verbose=False)
+    r.inspect(level=level, steps=steps)
+    for votes, activations in fits:
+        r.fit(votes, activations)
+    return r
+
+
+## off keeps no tensors at all.
+r = inspected(OFF)
+print("got " + str(r.inspection) + " and " + str(r.inspection_history))
+print("should have been {} and []")
+assert r.inspection == {} and r.inspection_history == [], " off must keep nothing. "
+
+## summary keeps only the scalar statistics of the coefficients.
+r = inspected(SUMMARY)
+print("got " + str(sorted(r.inspection)))
+print("should have been " + str(["c0", "c1", "c2"]))
+assert sorted(r.inspection) == ["c0", "c1", "c2"], " summary must only keep the coefficients. "
+for statistics in r.inspection.values():
+    assert sorted(statistics) == ["entropy", "max", "mean"]
+    assert all(value.shape.rank == 0 for value in statistics.values()), \
+        " summary must only keep scalars. "
+
+## full keeps every tensor of the last `steps` fits.
+r = inspected(FULL, steps=2)
+history = r.inspection_history
+print("got " + str(len(history)) + " records")
+print("should have been 2")
+assert len(history) == 2, " full must evict the records older than steps. "
+for record, (votes, _) in zip(history, fits[1:]):
+    assert record["poses"] is votes, " full must keep the records of the latest fits. "
+assert r.inspection["c0"].shape == [batch, atoms, w, h, depth, 1, 1]
@@ -0,0 +1,65 @@
+import numpy as np
+import tensorflow as tf
+
+from models.core import variables
+from models.coreimp.commonKernels import DotProd
+from models.coreimp.commonMetrics import Frobenius
+from models.coreimp.kernelRouting import KernelRouting
+
+batch = 4
+w = 3
+h = 3
+depth = 9
+representation_dim = [4, 4]
+atoms = 4
+towers = 2
+
+rng = np.random.RandomState(0)
+votes_value = rng.randn(batch, atoms, w, h, depth, *representation_dim).astype(np.float32)
+activations_value = rng.rand(batch, atoms, w, h, depth, 1, 1).astype(np.float32)
+
+
+def gradients(placement, every):
+    variables.set_placement(placement, device='/cpu:0', tower_device='/cpu:%d')
+
+    with tf.Graph().as_default() as graph:
+        tf.compat.v1.set_random_seed(0)
+        votes = tf.constant(votes_value)
+        activations = tf.constant(activations_value)
+
+        losses = []
+        for i in range(towers):
+            with variables.tower(i):
+                r = KernelRouting(DotProd(), Frobenius(), iterations=4, name="placement")
+                r.recompute_iterations(every)
+                high_poses, high_activations = r.fit(votes, activations)
+                losses.append(tf.reduce_sum(high_poses) + tf.reduce_sum(high_activations))
+
+        replicas = [op for op in graph.get_operations() if op.type == "Identity" and "_replica" in op.name]
+        weights = tf.compat.v1.trainable_variables()
+        grads = tf.gradients(tf.add_n(losses), weights)
+
+        config = tf.compat.v1.ConfigProto(device_count={'CPU': towers})
+        with tf.compat.v1.Session(config=config) as session:
+            session.run(tf.compat.v1.global_variables_initializer())
+            grads = session.run(grads)
+
+    variables.set_placement()
+
+    return grads, len(weights), len(replicas)
+
+
+expected, _, _ = gradients("parameter_server", 0)
+
+for every in [0, 1]:
+    grads, weights, replicas = gradients("replicated", every)
+
+    ## one local copy per variable and tower, shared by every iteration.
+    print("got " + str(replicas) + " copies")
+    print("should have been " + str(weights * towers))
+    assert replicas == weights * towers, " every tower must read one copy of each variable. "
+
+    diff = max(np.max(np.abs(a - b)) for a, b in zip(grads, expected))
+    print("got " + str(diff))
+    print("should have been ~" + str(0.0))
+    assert diff < 1e-4, " replicated gradients must match the parameter server ones. "
@@ -0,0 +1,64 @@
+import numpy as np
+import tensorflow as tf
+
+from models.core import variables
+from models.coreimp.commonKernels import GaussianKernel
+from models.coreimp.commonMetrics import Frobenius
+from models.coreimp.kernelRouting import KernelRouting
+from models.coreimp.kernelmix import MonoKernelMix
+
+batch = 8
+w = 1
+h = 1
+depth = 32
+representation_dim = [4, 4]
+atoms = 10
+
+rng = np.random.RandomState(0)
+
+votes_value = rng.randn(batch, atoms, w, h, depth, *representation_dim).astype(np.float32)
+activations_value = rng.rand(batch, 1, w, h, depth, 1, 1).astype(np.float32)
+
+
+def route(policy):
+    variables.set_precision(policy)
+
+    with tf.Graph().as_default():
+        votes = tf.cast(tf.constant(votes_value), variables.compute_dtype())
+        activations = tf.cast(tf.constant(activations_value), variables.compute_dtype())
+
+        r = KernelRouting(
+            MonoKernelMix(GaussianKernel(singular=False), 2),
+            Frobenius(),
+            iterations=3,
+            name="precision")
+
+        high_poses, high_activations = r.fit(votes, activations)
+        grads = tf.gradients(
+            tf.reduce_sum(tf.cast(high_poses, tf.float32)), [votes])
+
+        for var in tf.compat.v1.global_variables():
+            assert var.dtype.base_dtype == tf.float32, " master weights must stay in float32. "
+
+        with tf.compat.v1.Session() as session:
+            session.run(tf.compat.v1.global_variables_initializer())
+
+            high_poses, grads = session.run([high_poses, grads])
+
+    variables.set_precision("float32")
+
+    return high_poses, grads[0]
+
+
+poses_32, _ = route("float32")
+poses_16, grads_16 = route("mixed_bfloat16")
+
+print("got " + str(poses_16.dtype))
+print("should have been bfloat16")
+assert str(poses_16.dtype) == "bfloat16"
+
+assert np.isfinite(grads_16.astype(np.float32)).all(), " bfloat16 gradients must be finite. "
+
+error = np.abs(poses_16.astype(np.float32) - poses_32).max()
+print("max deviation from float32 " + str(error))
+assert error < 0.1 * np.abs(poses_32).max(), " bfloat16 routing drifted from float32. "
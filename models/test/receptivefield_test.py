@@ -0,0 +1,65 @@
+import numpy as np
+import tensorflow as tf
+
+from models.coreimp.commonKernels import DotProd
+from models.coreimp.commonMetrics import SquaredFrobenius
+from models.coreimp.equiTransform import EquiTransform
+from models.coreimp.kernelRouting import KernelRouting
+from models.layers.capsule import CapsuleLayer
+
+tf.compat.v1.enable_eager_execution()
+
+batch = 4
+w = 11
+h = 9
+depth = 3
+representation_dim = [4, 4]
+
+rng = np.random.RandomState(0)
+
+poses = tf.constant(rng.randn(batch, w, h, depth, *representation_dim).astype(np.float32))
+activations = tf.constant(rng.rand(batch, w, h, depth, 1, 1).astype(np.float32))
+
+for ksizes, strides, padding in [([1, 3, 3, 1], [1, 2, 2, 1], "VALID"), ([1, 3, 3, 1], [1, 2, 2, 1], "SAME")]:
+    layer = CapsuleLayer(
+        routing=KernelRouting(
+            kernel=DotProd(),
+            metric=SquaredFrobenius(),
+            iterations=1,
+        ),
+        transform=EquiTransform(
+            output_atoms=2,
+            metric=SquaredFrobenius(),
+        ),
+        ksizes=ksizes,
+        strides=strides,
+        padding=padding
+    )
+    layer._representation_dim = representation_dim
+
+    patched_poses, patched_activations = layer._receptivefield((poses, activations))
+
+    expected_poses = tf.compat.v1.extract_image_patches(
+        tf.reshape(poses[..., 1, 2], [batch, w, h, depth]),
+        sizes=ksizes,
+        strides=strides,
+        padding=padding,
+        rates=[1, 1, 1, 1]
+    )
+
+    expected_activations = tf.compat.v1.extract_image_patches(
+        tf.squeeze(activations, axis=[-2, -1]),
+        sizes=ksizes,
+        strides=strides,
+        padding=padding,
+        rates=[1, 1, 1, 1]
+    )
+
+    print("got " + str(patched_poses.shape))
+    print("should have been " + str(list(expected_poses.shape) + representation_dim))
+
+    assert np.array_equal(patched_poses[..., 1, 2].numpy(), expected_poses.numpy()), \
+        " poses must be patched as extract_image_patches does. "
+
+    assert np.array_equal(patched_activations[..., 0, 0].numpy(), expected_activations.numpy()), \
+        " activations must be patched as extract_image_patches does. "
@@ -0,0 +1,44 @@
+import numpy as np
+import tensorflow as tf
+
+from models.coreimp.commonKernels import DotProd
+from models.coreimp.commonMetrics import Frobenius
+from models.coreimp.kernelRouting import KernelRouting
+
+batch = 8
+w = 3
+h = 3
+depth = 9
+representation_dim = [4, 4]
+atoms = 4
+
+rng = np.random.RandomState(0)
+
+with tf.Graph().as_default():
+    votes = tf.constant(
+        rng.randn(batch, atoms, w, h, depth, *representation_dim).astype(np.float32))
+    activations = tf.constant(
+        rng.rand(batch, atoms, w, h, depth, 1, 1).astype(np.float32))
+
+    outputs = []
+    for every in [0, 1, 2]:
+        ## same name, so every router shares its variables.
+        r = KernelRouting(DotProd(), Frobenius(), iterations=5, name="recompute")
+        r.recompute_iterations(every=every)
+
+        high_poses, high_activations = r.fit(votes, activations)
+        grads = tf.gradients(
+            tf.reduce_sum(high_poses) + tf.reduce_sum(high_activations), [votes, activations])
+
+        outputs.append([high_poses, high_activations] + grads)
+
+    with tf.compat.v1.Session() as session:
+        session.run(tf.compat.v1.global_variables_initializer())
+
+        plain, every_one, every_two = session.run(outputs)
+
+        for every, recomputed in [(1, every_one), (2, every_two)]:
+            diff = max(np.max(np.abs(a - b)) for a, b in zip(plain, recomputed))
+            print("got " + str(diff) + " for every=" + str(every))
+            print("should have been ~" + str(0.0))
+            assert diff < 1e-4, " recomputed routing must match the plain routing."
@@ -0,0 +1,65 @@
+import os
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from models.core import export
+from models.core.serving import Batcher
+
+directory = os.path.join(tempfile.mkdtemp(), "export")
+rng = np.random.RandomState(0)
+images_value = rng.randn(6, 3).astype(np.float32)
+w_value = rng.randn(3, 2).astype(np.float32)
+
+## a static batch dimension, the batches are padded to it.
+with tf.Graph().as_default():
+    images = tf.compat.v1.placeholder(tf.float32, [4, 3], name="images")
+    w = tf.compat.v1.get_variable("w", initializer=w_value)
+    logits = tf.matmul(images, w)
+
+    with tf.compat.v1.Session() as session:
+        session.run(tf.compat.v1.global_variables_initializer())
+        export.export(session, directory, {"images": images}, {"logits": logits})
+
+batcher = Batcher(directory, max_latency=0.5)
+
+try:
+    batcher.submit(images_value[:5])
+    raise AssertionError(" a request larger than the batch was accepted. ")
+except ValueError:
+    pass
+
+## six single image requests, a full batch of four and a padded one of two.
+futures = [batcher.submit(image) for image in images_value]
+scored = np.concatenate([future.result()["logits"] for future in futures])
+batcher.close()
+
+print("got " + str(scored))
+print("should have been " + str(images_value.dot(w_value)))
+assert np.allclose(scored, images_value.dot(w_value), atol=1e-5), " batched logits differ. "
+
+print("got " + str(batcher.batches) + " batches")
+print("should have been 2")
+assert batcher.batches == 2
+assert batcher.examples == 6
+
+## a dynamic batch dimension, the batches are scored as they are.
+dynamic_directory = os.path.join(tempfile.mkdtemp(), "export")
+with tf.Graph().as_default():
+    images = tf.compat.v1.placeholder(tf.float32, [None, 3], name="images")
+    w = tf.compat.v1.get_variable("w", initializer=w_value)
+    logits = tf.matmul(images, w)
+
+    with tf.compat.v1.Session() as session:
+        session.run(tf.compat.v1.global_variables_initializer())
+        export.export(session, dynamic_directory, {"images": images}, {"logits": logits})
+
+batcher = Batcher(dynamic_directory, max_latency=0.5, max_batch_size=4)
+futures = [batcher.submit(image) for image in images_value]
+scored = np.concatenate([future.result()["logits"] for future in futures])
+batcher.close()
+
+assert batcher.batch_size is None
+assert np.allclose(scored, images_value.dot(w_value), atol=1e-5), " batched logits differ. "
+assert batcher.batches == 2
@@ -0,0 +1,69 @@
+import numpy as np
+import tensorflow as tf
+
+from models.coreimp.commonKernels import GaussianKernel
+from models.coreimp.commonMetrics import Frobenius
+from models.coreimp.kernelRouting import KernelRouting
+from models.coreimp.kernelmix import MonoKernelMix
+
+batch = 8
+w = 1
+h = 1
+depth = 72
+representation_dim = [4, 4]
+atoms = 10
+k = 8
+
+rng = np.random.RandomState(0)
+
+with tf.Graph().as_default():
+    votes = tf.constant(
+        rng.randn(batch, atoms, w, h, depth, *representation_dim).astype(np.float32))
+    activations = tf.constant(
+        np.tile(rng.rand(batch, 1, w, h, depth, 1, 1), [1, atoms, 1, 1, 1, 1, 1]).astype(np.float32))
+
+    r = KernelRouting(
+        MonoKernelMix(GaussianKernel(singular=False), 2),
+        Frobenius(),
+        iterations=3,
+        name="sparse",
+        top_k=k)
+    r.inspect()
+
+    high_poses, high_activations = r.fit(votes, activations)
+    grads = tf.gradients(
+        tf.reduce_sum(high_poses) + tf.reduce_sum(high_activations), [votes])
+
+    c = r.inspection["c2"]
+
+    ## the children are selected once, so the symbolic loop keeps [.., k] coefficients.
+    symbolic = KernelRouting(
+        MonoKernelMix(GaussianKernel(singular=False), 2),
+        Frobenius(),
+        iterations=3,
+        name="sparse",
+        top_k=k)
+    symbolic.symbolic_iterations()
+    symbolic_poses, _ = symbolic.fit(votes, activations)
+
+    with tf.compat.v1.Session() as session:
+        session.run(tf.compat.v1.global_variables_initializer())
+
+        c, high_poses, high_activations, grads, symbolic_poses = session.run(
+            [c, high_poses, high_activations, grads, symbolic_poses])
+
+        print("got " + str(list(c.shape)))
+        print("should have been " + str([batch, atoms, w, h, k, 1, 1]))
+        assert list(c.shape) == [batch, atoms, w, h, k, 1, 1]
+
+        print("got " + str(list(high_poses.shape)))
+        print("should have been " + str([batch, w, h, atoms] + representation_dim))
+        assert list(high_poses.shape) == [batch, w, h, atoms] + representation_dim
+
+        assert np.isfinite(grads).all(), " sparse routing gradients must be finite. "
+        assert np.allclose(c.sum(axis=4), 1, atol=1e-4), " coefficients must sum to one over the kept children. "
+
+        diff = np.max(np.abs(high_poses - symbolic_poses))
+        print("got " + str(diff))
+        print("should have been ~" + str(0.0))
+        assert diff < 1e-4, " symbolic sparse routing must match the unrolled one. "
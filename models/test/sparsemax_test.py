@@ -0,0 +1,48 @@
+import numpy as np
+import tensorflow as tf
+
+from models.util.sparsemax import sparsemax, sparsemax_loss, smforward, smRop, smlforward_loss, smlgrad
+
+tf.compat.v1.enable_eager_execution()
+
+rng = np.random.RandomState(0)
+
+z = rng.randn(64, 10)
+v = rng.randn(64, 10)
+q = np.eye(10)[rng.randint(0, 10, 64)]
+
+logits = tf.constant(z)
+with tf.GradientTape() as tape:
+    tape.watch(logits)
+    p = sparsemax(logits)
+
+grad = tape.gradient(p, logits, output_gradients=tf.constant(v))
+
+print("sparsemax")
+print("got " + str(np.max(np.abs(p.numpy() - smforward(z)))))
+print("should have been ~" + str(0.0))
+assert np.allclose(p.numpy(), smforward(z))
+
+## the jacobian is symmetric, the vector jacobian product is the Rop.
+print("got " + str(np.max(np.abs(grad.numpy() - smRop(z, v)))))
+print("should have been ~" + str(0.0))
+assert np.allclose(grad.numpy(), smRop(z, v))
+
+with tf.GradientTape() as tape:
+    tape.watch(logits)
+    loss = sparsemax_loss(logits, p, q)
+
+grad = tape.gradient(loss, logits)
+
+print("sparsemax loss")
+assert np.allclose(loss.numpy(), smlforward_loss(z, smforward(z), q))
+assert np.allclose(grad.numpy(), smlgrad(z, q))
+
+## routing coefficients are normalized along the children axis.
+r = rng.randn(2, 3, 1, 1, 5, 1, 1).astype(np.float32)
+c = sparsemax(tf.constant(r), axis=4)
+expected = smforward(np.moveaxis(r, 4, -1).reshape(-1, 5)).reshape(2, 3, 1, 1, 1, 1, 5)
+
+print("got " + str(c.shape))
+print("should have been " + str(r.shape))
+assert np.allclose(np.moveaxis(c.numpy(), 4, -1), expected, atol=1e-6)
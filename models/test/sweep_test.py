@@ -0,0 +1,50 @@
+import os
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from models.core import variables
+from models.core.sweep import CheckpointSweep
+
+directory = tempfile.mkdtemp()
+rng = np.random.RandomState(0)
+
+with tf.Graph().as_default():
+    x = tf.constant(rng.randn(4, 3).astype(np.float32))
+
+    w = tf.compat.v1.get_variable("w", initializer=rng.randn(3, 2).astype(np.float32))
+    frozen = tf.compat.v1.get_variable("frozen", initializer=rng.randn(2).astype(np.float32))
+    slot = tf.compat.v1.get_variable("slot", initializer=np.zeros(5, np.float32))
+
+    y = tf.matmul(x, w) + frozen
+
+    used = variables.variables_of(y)
+    print("got " + str(sorted(var.op.name for var in used)))
+    print("should have been ['frozen', 'w']")
+    assert sorted(var.op.name for var in used) == ["frozen", "w"]
+
+    saver = tf.compat.v1.train.Saver()
+    checkpoints = []
+    expected = []
+    with tf.compat.v1.Session() as session:
+        session.run(tf.compat.v1.global_variables_initializer())
+        for step in range(3):
+            ## only w and the slot change between the checkpoints.
+            session.run([w.assign(rng.randn(3, 2).astype(np.float32)),
+                         slot.assign(rng.randn(5).astype(np.float32))])
+            checkpoints.append(saver.save(session, os.path.join(directory, "model.ckpt"), global_step=step))
+            expected.append(session.run(y))
+
+    sweep = CheckpointSweep(used)
+
+    with tf.compat.v1.Session() as session:
+        restored = []
+        for i, (checkpoint, count) in enumerate(sweep.restore_each(session, checkpoints)):
+            assert checkpoint == checkpoints[i]
+            assert np.allclose(session.run(y), expected[i]), " restored values differ from the checkpoint. "
+            restored.append(count)
+
+print("got " + str(restored))
+print("should have been [2, 1, 1]")
+assert restored == [2, 1, 1]
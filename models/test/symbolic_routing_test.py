@@ -0,0 +1,52 @@
+import numpy as np
+import tensorflow as tf
+
+from models.coreimp.commonKernels import DotProd
+from models.coreimp.commonMetrics import Frobenius
+from models.coreimp.kernelRouting import KernelRouting
+
+batch = 8
+w = 3
+h = 3
+depth = 9
+representation_dim = [4, 4]
+atoms = 4
+
+rng = np.random.RandomState(0)
+
+with tf.Graph().as_default():
+    votes = tf.constant(
+        rng.randn(batch, atoms, w, h, depth, *representation_dim).astype(np.float32))
+    activations = tf.constant(
+        rng.rand(batch, atoms, w, h, depth, 1, 1).astype(np.float32))
+
+    ## same name, so every router shares its variables.
+    def router():
+        return KernelRouting(DotProd(), Frobenius(), iterations=3, name="symbolic")
+
+    symbolic = router()
+    symbolic.symbolic_iterations()
+    symbolic_outputs = symbolic.fit(votes, activations)
+
+    unrolled = [router().fit(votes, activations, iterations=iterations) for iterations in [3, 5]]
+
+    with tf.compat.v1.Session() as session:
+        session.run(tf.compat.v1.global_variables_initializer())
+
+        expected = session.run(unrolled)
+
+        ## the design iteration count, then one fed at run time.
+        for iterations, target in zip([3, 5], expected):
+            got = session.run(symbolic_outputs, feed_dict={symbolic.iteration_count: iterations})
+            diff = max(np.max(np.abs(a - b)) for a, b in zip(got, target))
+            print("got " + str(diff) + " for " + str(iterations) + " iterations")
+            print("should have been ~" + str(0.0))
+            assert diff < 1e-4, " symbolic routing must match the unrolled routing."
+
+        ## the first and last iterations are peeled, fewer than 2 must fail.
+        for iterations in [0, 1]:
+            try:
+                session.run(symbolic_outputs, feed_dict={symbolic.iteration_count: iterations})
+                raise AssertionError(" " + str(iterations) + " symbolic iterations were accepted. ")
+            except tf.errors.InvalidArgumentError:
+                pass
@@ -0,0 +1,184 @@
+"""Shared registry of planned einsum contractions.
+
+contract(spec, *operands) plans every (spec, operand shapes) pair once and
+caches the plan. Single operand expressions that only permute axes (and drop
+size 1 indices) run as one transpose and a reshape, two operand expressions
+as a batched matmul between reshaped operands, anything else through an
+opt_einsum contract_expression.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import functools
+
+import opt_einsum
+import tensorflow as tf
+
+from .shapes import dynamic_shape
+
+_LOWERING = [True]
+
+## summed :: axes reduced first, perm :: transpose of the remaining axes or
+## None, order :: indices of the axes after both, groups :: indices merged
+## into each axis of the reshaped operand.
+_Operand = collections.namedtuple("_Operand", ["summed", "perm", "order", "groups"])
+
+_Plan = collections.namedtuple("_Plan", ["kind", "operands", "product", "perm", "expression"])
+
+
+def lowering(enabled=True):
+    """ when disabled every contraction goes through opt_einsum.contract. """
+    _LOWERING[0] = enabled
+
+
+def contract(spec, *operands):
+    ## spec :: einsum expression with an explicit output, e.g. "bowhlij->bwhoij"
+
+    if not _LOWERING[0]:
+        return opt_einsum.contract(spec, *operands)
+
+    operands = [tf.convert_to_tensor(x) for x in operands]
+
+    plan = _plan(spec, tuple(tuple(x.shape.as_list()) for x in operands))
+
+    if plan.kind == "transpose":
+        return _merge(operands[0], plan.operands[0])
+
+    if plan.kind == "matmul":
+        a, b = [_merge(x, operand) for x, operand in zip(operands, plan.operands)]
+
+        product = tf.matmul(a, b)
+        ## product :: { batch, left, right }
+
+        return _split(product, plan, spec, operands)
+
+    if plan.expression is not None:
+        return plan.expression(*operands, backend="tensorflow")
+
+    return opt_einsum.contract(spec, *operands)
+
+
+@functools.lru_cache(maxsize=256)
+def _plan(spec, shapes):
+    inputs, output = spec.replace(" ", "").split("->")
+    inputs = inputs.split(",")
+
+    distinct = all(len(set(x)) == len(x) for x in inputs + [output])
+
+    if len(inputs) == 1 and distinct:
+        operand = _operand(inputs[0], shapes[0], [[i] for i in output])
+
+        return _Plan("transpose", [operand], None, None, None)
+
+    if len(inputs) == 2 and distinct:
+        a, b = inputs
+
+        batch = [i for i in output if i in a and i in b]
+        left = [i for i in output if i in a and i not in b]
+        right = [i for i in output if i in b and i not in a]
+        contracted = [i for i in a if i in b and i not in output]
+
+        operands = [
+            _operand(a, shapes[0], [[i] for i in batch] + [left, contracted]),
+            _operand(b, shapes[1], [[i] for i in batch] + [contracted, right])
+        ]
+
+        product = batch + left + right
+
+        return _Plan("matmul", operands, product, _perm(product, output, None), None)
+
+    expression = None
+    if all(d is not None for shape in shapes for d in shape):
+        expression = opt_einsum.contract_expression(spec, *shapes)
+
+    return _Plan("einsum", None, None, None, expression)
+
+
+def _perm(indices, order, shape):
+    ## transpose taking indices to order, None when it only moves size 1
+    ## axes, which the reshapes drop or reinsert for free.
+    perm = [indices.index(i) for i in order] + [n for n, i in enumerate(indices) if i not in order]
+
+    moved = [axis for axis in perm if shape is None or shape[axis] != 1]
+
+    if moved == sorted(moved):
+        return None
+
+    return tuple(perm)
+
+
+def _operand(indices, shape, groups):
+    kept = [i for g in groups for i in g]
+
+    ## indices outside the groups are summed, unless they have size 1.
+    summed = tuple(
+        axis for axis, i in enumerate(indices)
+        if i not in kept and shape[axis] != 1)
+
+    remaining = [i for axis, i in enumerate(indices) if axis not in summed]
+    remaining_shape = [d for axis, d in enumerate(shape) if axis not in summed]
+
+    perm = _perm(remaining, kept, remaining_shape)
+
+    if perm is not None:
+        remaining = [remaining[axis] for axis in perm]
+
+    return _Operand(
+        summed,
+        perm,
+        tuple(remaining),
+        tuple(tuple(g) for g in groups))
+
+
+def _merge(x, operand):
+    ## x :: operand axes, returns one axis for each group of operand.
+
+    if operand.summed:
+        x = tf.reduce_sum(x, axis=list(operand.summed))
+
+    if operand.perm is not None:
+        x = tf.transpose(x, list(operand.perm))
+
+    sizes = dict(zip(operand.order, dynamic_shape(x)))
+
+    target = [_product([sizes[i] for i in g]) for g in operand.groups]
+
+    return tf.reshape(x, _static(target))
+
+
+def _split(product, plan, spec, operands):
+    ## product :: { batch, left, right }, returns the axes of the output.
+
+    inputs = spec.replace(" ", "").split("->")[0].split(",")
+    batch = len(plan.operands[0].groups) - 2
+
+    sizes = {}
+    for indices, x in zip(inputs, operands):
+        for i, d in zip(indices, dynamic_shape(x)):
+            sizes.setdefault(i, d)
+
+    shape = dynamic_shape(product)
+    target = shape[:batch] + [sizes[i] for i in plan.product[batch:]]
+
+    result = tf.reshape(product, _static(target))
+
+    if plan.perm is not None:
+        result = tf.transpose(result, list(plan.perm))
+
+    return result
+
+
+def _product(sizes):
+    result = 1
+    for d in sizes:
+        result = result * d
+    return result
+
+
+def _static(target):
+    if all(isinstance(d, int) for d in target):
+        return target
+    return tf.stack(target)
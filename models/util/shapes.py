@@ -0,0 +1,20 @@
+"""Shapes of tensors whose batch dimension is only known at run time."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+
+
+def dynamic_shape(x):
+    """Returns the shape of x as a list, static sizes where known and scalar
+    tensors where not, usable in tf.reshape, tf.zeros or tf.tile.
+    """
+    static = x.shape.as_list()
+
+    if all(d is not None for d in static):
+        return static
+
+    dynamic = tf.shape(x)
+    return [d if d is not None else dynamic[axis] for axis, d in enumerate(static)]
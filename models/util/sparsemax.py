@@ -36,7 +36,7 @@ def smjacobian(z):
 
     # Construct S(z)
     # Possibly this could be reduced to just calculating k(z)
-    p = forward(z)
+    p = smforward(z)
     s = p > 0
     s_float = s.astype('float64')
 
@@ -60,7 +60,7 @@ def smRop(z, v):
     """
 
     # Construct S(z)
-    p = forward(z)
+    p = smforward(z)
     s = p > 0
 
     # Calculate \hat{v}, which will be a vector (scalar for each z)
@@ -96,68 +96,81 @@ def smlgrad(z, q):
     return -q + smforward(z)
 
 
-def py_func(func, inp, Tout, stateful=True, name=None, grad=None):
-    # Need to generate a unique name to avoid duplicates:
-    rnd_name = 'PyFuncGrad' + str(np.random.randint(0, 1E+8))
+def _threshold(z, axis):
+    """tau(z) along axis by Michelot's algorithm, without sorting.
+    starting from the whole vector as support, tau only grows and the support
+    only shrinks, it stops at the exact tau(z) after at most n rounds.
+    """
+    n = tf.cast(tf.shape(z)[axis], z.dtype)
+    tau = (tf.reduce_sum(z, axis=axis, keepdims=True) - 1) / n
 
-    tf.RegisterGradient(rnd_name)(grad)  # see _MySquareGrad for grad example
-    g = tf.compat.v1.get_default_graph()
-    with g.gradient_override_map({"PyFunc": rnd_name}):
-        result = tf.compat.v1.py_func(func, inp, Tout, stateful=stateful, name=name)
-        return result
+    def body(tau, changed):
+        support = tf.cast(z > tau, z.dtype)
 
+        update = (tf.reduce_sum(support * z, axis=axis, keepdims=True) - 1) / tf.reduce_sum(support, axis=axis, keepdims=True)
 
-def grad_sparsemax(op, grad):
-    spm = op.outputs[0]
-    support = tf.cast(spm > 0, spm.dtype)
+        return update, tf.reduce_any(update > tau)
 
-    # Calculate \hat{v}, which will be a vector (scalar for each z)
-    v_hat = tf.reduce_sum(tf.mul(grad, support), 1) / tf.reduce_sum(support, 1)
+    tau, _ = tf.compat.v1.while_loop(
+        cond=lambda tau, changed: changed,
+        body=body,
+        loop_vars=(tau, tf.constant(True)),
+        name="threshold")
 
-    # Calculates J(z) * v
-    return [support * (grad - v_hat[:, np.newaxis])]
+    return tau
+
+
+def sparsemax(Z, axis=-1, name=None):
+    """sparsemax along axis, a drop in replacement for tf.nn.softmax.
+    both the threshold tau(z) and the gradient, the analytic Jacobian vector
+    product, run as graph ops on any device.
+    """
+    with tf.compat.v1.name_scope(name, "SparseMax", [Z]):
+        Z = tf.convert_to_tensor(Z)
+
+        @tf.custom_gradient
+        def forward(z):
+            spm = tf.maximum(tf.cast(0, z.dtype), z - _threshold(z, axis))
+
+            def grad(dy):
+                support = tf.cast(spm > 0, spm.dtype)
 
+                # Calculate \hat{v}, which will be a scalar for each z
+                v_hat = tf.reduce_sum(dy * support, axis=axis, keepdims=True) / tf.reduce_sum(support, axis=axis, keepdims=True)
 
-def grad_sparsemax_loss(op, grad):
-    spm = op.inputs[1]
-    labels = op.inputs[2]
-    result = tf.transpose(grad * tf.transpose(-labels + spm))
-    return [result, None, None]
+                # Calculates J(z) * v
+                return support * (dy - v_hat)
 
+            return spm, grad
 
-def sparsemax(Z, name=None):
-    with tf.compat.v1.keras.backend.name_scope(name, "SparseMaxGrad", [Z]) as name:
-        # py_func takes a list of tensors and a
-        # function that takes np arrays as inputs
-        # and returns np arrays as outputs
-        sparsemax_forward = py_func(
-            smforward,
-            [Z],
-            [tf.float64],
-            name=name,
-            grad=grad_sparsemax)  # <-- here's the call to the gradient
-    return sparsemax_forward[0]
+        return forward(Z)
 
 
-def sparsemax_loss(Z, sparsemax, q, name=None):
-    with tf.compat.v1.keras.backend.name_scope(name, "SparseMaxLossGrad", [Z, sparsemax, q]) as name:
-        # py_func takes a list of tensors and a
-        # function that takes np arrays as inputs
-        # and returns np arrays as outputs
-        sparsemax_forward_loss = py_func(
-            smlforward_loss,
-            [Z, sparsemax, q],
-            [tf.float64],
-            name=name,
-            grad=grad_sparsemax_loss)  # <-- here's the call to the gradient
+def sparsemax_loss(Z, sparsemax, q, axis=-1, name=None):
+    """sparsemax loss along axis, sparsemax is the sparsemax of Z and q the
+    (binary) labels. Only Z receives a gradient, -q + sparsemax.
+    """
+    with tf.compat.v1.name_scope(name, "SparseMaxLoss", [Z, sparsemax, q]):
+        Z = tf.convert_to_tensor(Z)
+        sparsemax = tf.stop_gradient(tf.convert_to_tensor(sparsemax, dtype=Z.dtype))
+        q = tf.stop_gradient(tf.convert_to_tensor(q, dtype=Z.dtype))
+
+        @tf.custom_gradient
+        def forward(z):
+            # Calculate q^T * z
+            z_k = tf.reduce_sum(q * z, axis=axis)
 
-    return sparsemax_forward_loss[0]
+            # calculate sum over S(z)
+            # z_i^2 - tau(z)^2 = p_i (2 * z_i - p_i) for i \in S(z)
+            support = tf.cast(sparsemax > 0, z.dtype)
+            S_sum = tf.reduce_sum(support * sparsemax * (2 * z - sparsemax), axis=axis)
 
+            # because q is binary, sum([q_1^2, q_2^2, ...]) is just sum(q)
+            q_norm = tf.reduce_sum(q, axis=axis)
 
+            def grad(dy):
+                return tf.expand_dims(dy, axis) * (-q + sparsemax)
 
+            return -z_k + 0.5 * S_sum + 0.5 * q_norm, grad
 
-#logits = tf.placeholder(tf.float64, name='z')
-r = sparsemax(tf.zeros( (1,10) ) )
-print(r)
-#with tf.Session() as sess:
-#    print(r.eval({logits: np.zeros((1, 10))}) ) 
+        return forward(Z)
@@ -0,0 +1,113 @@
+"""Local HTTP server scoring images with a model written by experiment.py --export_dir.
+
+Concurrent requests are batched together, see models/core/serving.py.
+
+  python serve.py --export_dir exported/ --port 8500
+
+  POST /score {"images": [image, ...]}
+  -> {"logits": [[activation per class], ...], "classes": [class, ...]}
+  GET /metadata
+  -> {"image_shape": [...], "batch_size": ..., "max_batch_size": ...}
+
+The images are laid out as the test split reader emits them, [depth, height,
+width] for cifar10 and [height, width, depth] for mnist and smallnorb.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import http.server
+import json
+
+from models.core.serving import Batcher
+
+parser = argparse.ArgumentParser(prog='Serve', add_help=True)
+
+parser.add_argument('--export_dir', required=True,
+                    type=str, help='Directory of the exported SavedModel.')
+parser.add_argument('--host', default='127.0.0.1',
+                    type=str, help='Address to listen on.')
+parser.add_argument('--port', default=8500,
+                    type=int, help='Port to listen on, 0 picks a free one.')
+parser.add_argument('--max_latency', default=0.005,
+                    type=float, help='Seconds a request waits for others to batch with.')
+parser.add_argument('--max_batch_size', default=None,
+                    type=int, help='Most images scored in one run, the exported batch size or 32 by default.')
+
+
+class ScoringHandler(http.server.BaseHTTPRequestHandler):
+
+    def _reply(self, code, body):
+        body = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/metadata':
+            self._reply(404, {'error': 'unknown path {}'.format(self.path)})
+            return
+
+        batcher = self.server.batcher
+        self._reply(200, {
+            'image_shape': batcher.image_shape,
+            'batch_size': batcher.batch_size,
+            'max_batch_size': batcher.max_batch_size,
+        })
+
+    def do_POST(self):
+        if self.path != '/score':
+            self._reply(404, {'error': 'unknown path {}'.format(self.path)})
+            return
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            future = self.server.batcher.submit(request['images'])
+        except (KeyError, TypeError, ValueError) as error:
+            self._reply(400, {'error': str(error)})
+            return
+
+        try:
+            outputs = future.result()
+        except Exception as error:
+            self._reply(500, {'error': str(error)})
+            return
+        self._reply(200, {key: value.tolist() for key, value in outputs.items()})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(batcher, host='127.0.0.1', port=0):
+    """Returns an HTTP server scoring with the batcher, call serve_forever to run it.
+
+    server.server_address holds the address it listens on.
+    """
+    server = http.server.ThreadingHTTPServer((host, port), ScoringHandler)
+    server.daemon_threads = True
+    server.batcher = batcher
+    return server
+
+
+def main():
+    args = parser.parse_args()
+
+    batcher = Batcher(args.export_dir, args.max_latency, args.max_batch_size)
+    server = make_server(batcher, args.host, args.port)
+    print('scoring batches of up to {} images on http://{}:{}'.format(
+        batcher.max_batch_size, *server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+
+
+if __name__ == '__main__':
+    main()